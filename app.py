@@ -1,10 +1,12 @@
-from flask import Flask, render_template, request, jsonify, send_file, Response, stream_with_context, url_for
+from flask import Flask, render_template, request, jsonify, send_file, Response, stream_with_context, url_for, redirect
 import pandas as pd
 import numpy as np
 import matplotlib
 matplotlib.use('Agg')  # Verwende nicht-interaktiven Backend
-import matplotlib.pyplot as plt
 import json
+import hashlib
+import threading
+from collections import namedtuple
 import io
 import base64
 import os
@@ -13,29 +15,40 @@ import unicodedata # Für Umlaute etc. in simplified_name
 from werkzeug.utils import secure_filename
 import tempfile
 from utils import (
-    normalize, calculate_target_group, generate_charts,
-    generate_scatter_plot, perform_clustering, encode_figure_to_base64,
-    generate_city_pie_chart, generate_cities_chart,
+    calculate_target_group,
     generate_interactive_scatter_plot, generate_interactive_clustering,
-    generate_filtered_clustering, perform_clustering_population_target,
-    generate_interactive_clustering_population_target
+    generate_filtered_clustering,
+    generate_interactive_clustering_population_target,
+    fit_clustering, fit_clustering_population_target, format_thousands,
+    summarize_clustering, summarize_clustering_population_target
+)
+from data_cache import CityDatasetCache, ResultCache, TableReplica
+from place_store import PlaceWriter, load_search_hints, save_search_hints, fresh_city_ids
+from fetch_scheduler import LatencyStats, sliding_window
+import places_api
+import search_jobs
+from status_bus import StatusBus, DONE as STATUS_DONE, format_sse
+import status_server
+import migrations
+import db_pool
+from contextlib import aclosing
+import chart_renderer
+from concurrent.futures.process import BrokenProcessPool
+from target_group import TargetGroupEngine, age_band_rename_map
+from scoring import (
+    apply_scores, feature_matrix, score_matrix, rank_scores, normalize_weights,
+    weight_simplex_grid, sweep_scores, RankStability
 )
-from sklearn.preprocessing import StandardScaler
-from sklearn.cluster import KMeans
 from openpyxl import Workbook
 import plotly.express as px
 import sqlite3
 from datetime import datetime
 import time # Für eventuelle Pausen zwischen API-Aufrufen bei Paginierung
 import requests # Für API-Aufrufe
-import queue # Für SSE Statusmeldungen
 from openpyxl.styles import Font, Alignment # Für Excel-Formatierung
 from dotenv import load_dotenv # Für .env-Datei
 import asyncio # Für asynchrone Verarbeitung
-import aiohttp # Für asynchrone HTTP-Anfragen
 import openpyxl # Stelle sicher, dass es importiert ist
-from google.cloud import monitoring_v3
-from google.oauth2 import service_account
 from calendar import monthrange
 
 # Lade Umgebungsvariablen aus der .env-Datei
@@ -65,45 +78,24 @@ BUNDESLAND_MAP = {
 
 app = Flask(__name__)
 
-# --- Datenbank-Hilfsfunktion: Spalte hinzufügen, falls nicht vorhanden ---
-def add_column_if_not_exists(db_conn, table_name, column_name, column_type):
-    cursor = db_conn.cursor()
-    try:
-        # PRAGMA table_info gibt Infos zu Spalten zurück
-        cursor.execute(f"PRAGMA table_info({table_name})")
-        columns = [column['name'] for column in cursor.fetchall()]
-        if column_name not in columns:
-            print(f"Füge Spalte '{column_name}' zur Tabelle '{table_name}' hinzu...")
-            cursor.execute(f"ALTER TABLE {table_name} ADD COLUMN {column_name} {column_type}")
-            db_conn.commit()
-            print(f"Spalte '{column_name}' erfolgreich hinzugefügt.")
-        #     print(f"Spalte '{column_name}' existiert bereits in Tabelle '{table_name}'.")
-    except sqlite3.Error as e:
-        print(f"Fehler beim Überprüfen/Hinzufügen der Spalte '{column_name}' zu '{table_name}': {e}")
-        # Es ist wichtig, hier keine Exception auszulösen, damit die App weiterläuft
-    finally:
-        # Cursor hier nicht schließen, da die Verbindung extern verwaltet wird
-        pass
-
 def get_db():
-    db = sqlite3.connect(DATABASE)
+    # Verbindung des aktuellen Threads aus dem Pool; db.close() gibt sie zurück, spätestens
+    # beim Teardown des App-Kontexts (close_db)
+    db = connection_pool.acquire()
     # Gib Zeilen zurück, die sich wie Dictionaries verhalten
     db.row_factory = sqlite3.Row
     return db
 
-# --- Initialisierung beim App-Start (NACH get_db Definition) --- # NEUE POSITION
-# Wird einmal ausgeführt, wenn die App startet (oder neu lädt im Debug-Modus)
-with app.app_context():
-    try:
-        db = get_db()
-        # Füge die postal_code Spalte zur place Tabelle hinzu, falls sie fehlt
-        add_column_if_not_exists(db, 'place', 'postal_code', 'TEXT')
-        # NEU: Spalten für search_cache hinzufügen
-        add_column_if_not_exists(db, 'search_cache', 'min_rating', 'REAL')
-        add_column_if_not_exists(db, 'search_cache', 'min_user_ratings', 'INTEGER')
-        db.close() # Schließe die Verbindung nach der Prüfung/Änderung
-    except Exception as e:
-         print(f"Fehler während der Initialisierung der Datenbankstruktur: {e}")
+def get_readonly_db():
+    # Schreibgeschützte Verbindung (mode=ro, query_only) für reine Auswertungen
+    db = readonly_pool.acquire()
+    db.row_factory = sqlite3.Row
+    return db
+
+@app.teardown_appcontext
+def close_db(exception=None):
+    connection_pool.release()
+    readonly_pool.release()
 
 # Konfiguration für Datei-Upload
 UPLOAD_FOLDER = os.path.join(tempfile.gettempdir(), 'uploads')
@@ -114,31 +106,53 @@ app.config['MAX_CONTENT_LENGTH'] = 16 * 1024 * 1024  # 16 MB Limit
 
 # Lade Google Maps API-Schlüssel
 DATABASE = 'data.db'
+connection_pool = db_pool.ConnectionPool(DATABASE)
+readonly_pool = db_pool.ConnectionPool(DATABASE, readonly=True)
 API_KEY = os.environ.get('GOOGLE_MAPS_API_KEY')
 
-# Prüfe, ob der API-Schlüssel vorhanden ist
-if not API_KEY:
-    print("WARNUNG: Google Maps API-Schlüssel nicht gefunden. Bitte .env-Datei überprüfen.")
-else:
-    print(f"Google Maps API-Schlüssel geladen: {API_KEY[:4]}...{API_KEY[-4:]}")
+# --- Initialisierung beim App-Start (nach DATABASE und get_db) ---
+# Wird einmal ausgeführt, wenn die App startet (oder neu lädt im Debug-Modus). Die Render-Prozesse
+# von chart_renderer laden app.py nicht; falls ein anderer spawn-Prozess es als __mp_main__
+# ausführt, wird übersprungen.
+if __name__ != '__mp_main__':
+    with app.app_context():
+        try:
+            db = get_db()
+            # Ausstehende Schema-Migrationen (Spalten, Tabellen, Indizes) anwenden
+            migrations.migrate(db)
+            if migrations.DB_DIAGNOSTICS:
+                migrations.explain_report(db)
+            db.close() # Schließe die Verbindung nach der Prüfung/Änderung
+        except Exception as e:
+             print(f"Fehler während der Initialisierung der Datenbankstruktur: {e}")
 
-# Globale Variable für SSE Nachrichten-Queue
-search_status_queue = queue.Queue()
+    # Prüfe, ob der API-Schlüssel vorhanden ist
+    if not API_KEY:
+        print("WARNUNG: Google Maps API-Schlüssel nicht gefunden. Bitte .env-Datei überprüfen.")
+    else:
+        print(f"Google Maps API-Schlüssel geladen: {API_KEY[:4]}...{API_KEY[-4:]}")
 
+# Massensuche: gleichzeitige API-Abrufe und maximale Dauer pro Stadt (Sekunden)
+SEARCH_CONCURRENCY = int(os.environ.get('SEARCH_CONCURRENCY', 10))
+CITY_FETCH_TIMEOUT = float(os.environ.get('CITY_FETCH_TIMEOUT', 30))
 
-# --- Hilfsfunktion für Google Maps API ---
-async def fetch_google_maps_data_async(session, API_KEY, query, city_id, city_display_name, fields_mask='*', latitude=None, longitude=None): 
-    """Asynchrone Funktion für Google Maps Places searchText API Anfrage - mit optionalem locationBias für bessere lokale Ergebnisse."""
-    url = 'https://places.googleapis.com/v1/places:searchText'
-    logger = app.logger 
+# Umgang mit der locationBias-Anfrage (50km um die Stadt), wenn die Suche ohne Koordinaten nichts findet:
+#   'sequential': erst ohne, bei 0 Treffern mit locationBias (zwei Anfragen nacheinander)
+#   'learned':    wie 'sequential', aber Städte, die zuletzt locationBias brauchten, direkt damit anfragen
+#   'hedged':     beide Anfragen parallel, die nicht benötigte wird abgebrochen (kostet zusätzliches Kontingent);
+#                 nur in der Massensuche (async), synchrone Anfragen (Live-Suche) verhalten sich wie 'sequential'
+LOCATION_BIAS_STRATEGY = os.environ.get('LOCATION_BIAS_STRATEGY', 'learned').lower()
 
-    headers = {
-        'Content-Type': 'application/json',
-        'X-Goog-Api-Key': API_KEY,
-        'X-Goog-FieldMask': fields_mask 
-    }
-    
-    # Erste Anfrage OHNE locationBias
+# Inkrementelle Massensuche: Ergebnisse jünger als so viele Tage gelten als aktuell
+SEARCH_STALE_AFTER_DAYS = float(os.environ.get('SEARCH_STALE_AFTER_DAYS', 7))
+
+# Statusmeldungen der Massensuche, ein Kanal je Suchauftrag (SSE über /search_status/<job_id>)
+status_bus = StatusBus()
+
+
+# --- Hilfsfunktion für Google Maps API ---
+def _places_search_payload(query, latitude=None, longitude=None):
+    """Payload für searchText; mit Koordinaten inkl. locationBias (50km-Kreis)."""
     payload = {
         "textQuery": query,
         "languageCode": "de-DE",
@@ -147,61 +161,122 @@ async def fetch_google_maps_data_async(session, API_KEY, query, city_id, city_di
         "strictTypeFiltering": False,
         "rankPreference": "RELEVANCE"
     }
+    if latitude is not None and longitude is not None:
+        payload["locationBias"] = {
+            "circle": {
+                "center": {
+                    "latitude": latitude,
+                    "longitude": longitude
+                },
+                "radius": 50000.0  # 50km Radius für Kreise/größere Gebiete
+            }
+        }
+    return payload
 
-    logger.info(f"Google API: Rufe Ergebnisse für '{query}' ab (ohne Koordinaten)...")
+def _location_bias_strategy(latitude, longitude):
+    """Strategie für diese Anfrage; ohne Koordinaten gibt es keine locationBias-Anfrage."""
+    if latitude is None or longitude is None:
+        return None
+    return LOCATION_BIAS_STRATEGY
+
+async def fetch_google_maps_data_async(session, API_KEY, query, city_id, city_display_name, fields_mask='*', latitude=None, longitude=None, bias_first=False): 
+    """
+    Asynchrone Funktion für Google Maps Places searchText API Anfrage - mit optionalem locationBias für bessere lokale Ergebnisse.
+
+    bias_first: Für diese Stadt war zuletzt die locationBias-Anfrage nötig (Strategie 'learned').
+    Das Ergebnis enthält 'location_bias_needed' (True/False, None wenn unbekannt).
+    """
+    # Läuft dieselbe Anfrage bereits (Live-Suche oder andere Massensuche), wird deren Ergebnis übernommen
+    key = places_api.request_key(query, fields_mask, latitude, longitude)
+    result = await places_api.coalesce_async(
+        key, lambda: _search_places_async(session, API_KEY, query, fields_mask, latitude, longitude, bias_first)
+    )
+    return dict(result, city_id=city_id, city_display_name=city_display_name)
+
+async def _search_places_async(session, API_KEY, query, fields_mask='*', latitude=None, longitude=None, bias_first=False):
+    """Führt die eigentliche (asynchrone) searchText-Anfrage aus, mit locationBias je nach Strategie."""
+    url = 'https://places.googleapis.com/v1/places:searchText'
+    logger = app.logger 
+
+    headers = {
+        'Content-Type': 'application/json',
+        'X-Goog-Api-Key': API_KEY,
+        'X-Goog-FieldMask': fields_mask 
+    }
+    payload = _places_search_payload(query)
+    strategy = _location_bias_strategy(latitude, longitude)
 
     try:
-        async with session.post(url, headers=headers, json=payload) as response:
-            status_code = response.status
-            if status_code == 200:
-                result = await response.json()
-                places = result.get("places", []) 
-                
-                # Wenn keine Ergebnisse gefunden wurden UND Koordinaten verfügbar sind, versuche es nochmal mit locationBias
-                if len(places) == 0 and latitude is not None and longitude is not None:
+        # Alle Anfragen laufen über den gemeinsamen Rate-Limiter (inkl. Wiederholung bei 429/503)
+        biased_request = None
+        if strategy == 'learned' and bias_first:
+            # Für diese Stadt war zuletzt locationBias nötig: direkt damit anfragen
+            logger.info(f"Google API: Rufe Ergebnisse für '{query}' direkt mit locationBias ab...")
+            status_code, result = await places_api.post_async(session, url, headers, _places_search_payload(query, latitude, longitude))
+            if status_code == 200 and result.get("places"):
+                logger.info(f"Mit locationBias wurden {len(result['places'])} Orte für '{query}' gefunden.")
+                return {"places": result["places"], "location_bias_needed": True}
+            logger.info(f"Mit locationBias keine Ergebnisse für '{query}', versuche ohne Koordinaten...")
+            strategy = None  # kein zweiter locationBias-Versuch
+        elif strategy == 'hedged':
+            # Beide Anfragen parallel; die locationBias-Anfrage wird abgebrochen, wenn sie nicht gebraucht wird
+            biased_request = asyncio.ensure_future(
+                places_api.post_async(session, url, headers, _places_search_payload(query, latitude, longitude))
+            )
+
+        logger.info(f"Google API: Rufe Ergebnisse für '{query}' ab (ohne Koordinaten)...")
+        try:
+            status_code, result = await places_api.post_async(session, url, headers, payload)
+        except BaseException:
+            if biased_request is not None:
+                biased_request.cancel()
+            raise
+        if status_code == 200:
+            places = result.get("places", []) 
+            location_bias_needed = False if places else None
+            
+            # Wenn keine Ergebnisse gefunden wurden UND Koordinaten verfügbar sind, versuche es nochmal mit locationBias
+            if len(places) == 0 and strategy is not None:
+                if biased_request is None:
                     logger.info(f"Keine Ergebnisse für '{query}' ohne Koordinaten. Versuche erneut mit locationBias...")
-                    
-                    # Zweite Anfrage MIT locationBias
-                    payload_with_location = payload.copy()
-                    payload_with_location["locationBias"] = {
-                        "circle": {
-                            "center": {
-                                "latitude": latitude,
-                                "longitude": longitude
-                            },
-                            "radius": 50000.0  # 50km Radius für Kreise/größere Gebiete
-                        }
-                    }
-                    
-                    async with session.post(url, headers=headers, json=payload_with_location) as response2:
-                        status_code2 = response2.status
-                        if status_code2 == 200:
-                            result2 = await response2.json()
-                            places = result2.get("places", [])
-                            if len(places) > 0:
-                                logger.info(f"Mit locationBias wurden {len(places)} Orte für '{query}' gefunden.")
-                            else:
-                                logger.info(f"Auch mit locationBias keine Ergebnisse für '{query}'.")
-                        else:
-                            logger.warning(f"Fehler beim Retry mit locationBias für '{query}': HTTP {status_code2}")
-                else:
+                    biased_request = places_api.post_async(session, url, headers, _places_search_payload(query, latitude, longitude))
+                status_code2, result2 = await biased_request
+                if status_code2 == 200:
+                    places = result2.get("places", [])
                     if len(places) > 0:
-                        logger.info(f"Google API Erfolg für '{query}': {len(places)} Orte erhalten.")
+                        location_bias_needed = True
+                        logger.info(f"Mit locationBias wurden {len(places)} Orte für '{query}' gefunden.")
                     else:
-                        logger.info(f"Google API für '{query}': Keine Ergebnisse gefunden (0 Orte).")
-                
-                return {"places": places, "city_id": city_id, "city_display_name": city_display_name}
+                        logger.info(f"Auch mit locationBias keine Ergebnisse für '{query}'.")
+                else:
+                    logger.warning(f"Fehler beim Retry mit locationBias für '{query}': HTTP {status_code2}")
             else:
-                error_text = await response.text()
-                logger.error(f"Google Maps API Fehler für '{query}': HTTP {status_code}. Antwort: {error_text[:200]}...")
-                return {"error": f"HTTP Error {status_code}", "status_code": status_code, "places": [], "city_id": city_id, "city_display_name": city_display_name}
+                if biased_request is not None:
+                    biased_request.cancel()
+                if len(places) > 0:
+                    logger.info(f"Google API Erfolg für '{query}': {len(places)} Orte erhalten.")
+                else:
+                    logger.info(f"Google API für '{query}': Keine Ergebnisse gefunden (0 Orte).")
+            
+            return {"places": places, "location_bias_needed": location_bias_needed}
+        else:
+            if biased_request is not None:
+                biased_request.cancel()
+            error_text = result
+            logger.error(f"Google Maps API Fehler für '{query}': HTTP {status_code}. Antwort: {error_text[:200]}...")
+            return {"error": f"HTTP Error {status_code}", "status_code": status_code, "places": []}
     except Exception as e:
         logger.error(f"Google Maps API Exception für '{query}': {str(e)}", exc_info=True)
-        return {"error": str(e), "places": [], "city_id": city_id, "city_display_name": city_display_name}
+        return {"error": str(e), "places": []}
 
 # Synchrone Version anpassen (analog)
-def fetch_google_maps_data(API_KEY, query, fields_mask='*', latitude=None, longitude=None): 
+def fetch_google_maps_data(API_KEY, query, fields_mask='*', latitude=None, longitude=None, bias_first=False): 
     """Synchrone Funktion für Google Maps Places searchText API Anfrage - mit optionalem locationBias für bessere lokale Ergebnisse."""
+    key = places_api.request_key(query, fields_mask, latitude, longitude)
+    return places_api.coalesce(key, lambda: _search_places(API_KEY, query, fields_mask, latitude, longitude, bias_first))
+
+def _search_places(API_KEY, query, fields_mask='*', latitude=None, longitude=None, bias_first=False):
+    """Führt die eigentliche (synchrone) searchText-Anfrage aus, mit locationBias je nach Strategie."""
     url = 'https://places.googleapis.com/v1/places:searchText'
     logger = app.logger
     headers = {
@@ -209,48 +284,43 @@ def fetch_google_maps_data(API_KEY, query, fields_mask='*', latitude=None, longi
         'X-Goog-Api-Key': API_KEY,
         'X-Goog-FieldMask': fields_mask 
     }
-    
-    # Erste Anfrage OHNE locationBias
-    payload = {
-        "textQuery": query,
-        "languageCode": "de-DE",
-        "maxResultCount": 20, 
-        "regionCode": "de",
-        "strictTypeFiltering": False,
-        "rankPreference": "RELEVANCE"
-    }
-
-    logger.info(f"Google API (synchron): Rufe Ergebnisse für '{query}' ab (ohne Koordinaten)...")
+    payload = _places_search_payload(query)
+    strategy = _location_bias_strategy(latitude, longitude)
+    if strategy == 'hedged':
+        # Eine bereits gestartete synchrone Anfrage lässt sich nicht abbrechen, die zweite Anfrage
+        # würde also immer bezahlt: synchron daher wie 'sequential'
+        strategy = 'sequential'
 
     response = None
     try:
-        response = requests.post(url, headers=headers, json=payload)
+        if strategy == 'learned' and bias_first:
+            # Für diese Stadt war zuletzt locationBias nötig: direkt damit anfragen
+            logger.info(f"Google API (synchron): Rufe Ergebnisse für '{query}' direkt mit locationBias ab...")
+            response = places_api.post(url, headers, _places_search_payload(query, latitude, longitude))
+            places = response.json().get("places") if response.ok else None
+            if places:
+                logger.info(f"Mit locationBias wurden {len(places)} Orte für '{query}' gefunden.")
+                return {"places": places, "location_bias_needed": True}
+            logger.info(f"Mit locationBias keine Ergebnisse für '{query}', versuche ohne Koordinaten...")
+            strategy = None  # kein zweiter locationBias-Versuch
+
+        logger.info(f"Google API (synchron): Rufe Ergebnisse für '{query}' ab (ohne Koordinaten)...")
+        response = places_api.post(url, headers, payload)
         response.raise_for_status()
         result = response.json()
         places = result.get("places", [])
+        location_bias_needed = False if places else None
         
         # Wenn keine Ergebnisse gefunden wurden UND Koordinaten verfügbar sind, versuche es nochmal mit locationBias
-        if len(places) == 0 and latitude is not None and longitude is not None:
+        if len(places) == 0 and strategy is not None:
             logger.info(f"Keine Ergebnisse für '{query}' ohne Koordinaten. Versuche erneut mit locationBias...")
-            
-            # Zweite Anfrage MIT locationBias
-            payload_with_location = payload.copy()
-            payload_with_location["locationBias"] = {
-                "circle": {
-                    "center": {
-                        "latitude": latitude,
-                        "longitude": longitude
-                    },
-                    "radius": 50000.0  # 50km Radius für Kreise/größere Gebiete
-                }
-            }
-            
-            response2 = requests.post(url, headers=headers, json=payload_with_location)
+            response2 = places_api.post(url, headers, _places_search_payload(query, latitude, longitude))
             response2.raise_for_status()
             result2 = response2.json()
             places = result2.get("places", [])
             
             if len(places) > 0:
+                location_bias_needed = True
                 logger.info(f"Mit locationBias wurden {len(places)} Orte für '{query}' gefunden.")
             else:
                 logger.info(f"Auch mit locationBias keine Ergebnisse für '{query}'.")
@@ -260,11 +330,11 @@ def fetch_google_maps_data(API_KEY, query, fields_mask='*', latitude=None, longi
             else:
                 logger.info(f"Google API (synchron) für '{query}': Keine Ergebnisse gefunden (0 Orte).")
         
-        return {"places": places}
+        return {"places": places, "location_bias_needed": location_bias_needed}
     
     except requests.exceptions.RequestException as e:
-        status_code = response.status_code if response else 500
-        error_text = response.text if response else 'Keine Antwort'
+        status_code = response.status_code if response is not None else 500
+        error_text = response.text if response is not None else 'Keine Antwort'
         logger.error(f"Google Maps API Fehler (synchron) für '{query}': {e}. Status: {status_code}. Antwort: {error_text[:200]}...")
         return {"error": str(e), "status_code": status_code, "places": []} 
     except json.JSONDecodeError:
@@ -273,496 +343,464 @@ def fetch_google_maps_data(API_KEY, query, fields_mask='*', latitude=None, longi
             logger.error(f"Antworttext (synchron): {response.text[:200]}...")
         return {"error": "Ungültige JSON-Antwort von der API (synchron)", "places": []}
 
-async def save_places_to_db(db_path, term_id, results):
-    """Asynchrone Funktion zum Speichern der Ergebnisse in der Datenbank."""
-    # Datenbank-Verbindung aufbauen (in einem eigenen Thread)
-    conn = sqlite3.connect(db_path)
-    conn.row_factory = sqlite3.Row
-    cursor = conn.cursor()
-    
-    for result in results:
-        if "error" in result:
-            continue
-            
-        city_id = result["city_id"]
-        city_display_name = result.get("city_display_name", f"Stadt ID {city_id}")
-        found_places = result.get("places", [])
-        
-        # Explizit loggen, wenn keine Orte für eine Stadt gefunden wurden
-        if len(found_places) == 0:
-            print(f"Keine Orte zum Speichern für {city_display_name} (city_id: {city_id})")
-            continue
-        
-        for place_data in found_places:
-            place_id = place_data.get('id')
-            if not place_id:
-                continue
+# --- Kernfunktion für die Massensuche ---
+def with_db(fn, *args):
+    """Ruft fn(db, *args) mit der Pool-Verbindung des aktuellen Threads auf."""
+    db = get_db()
+    try:
+        return fn(db, *args)
+    finally:
+        db.close()
 
-            # Aktuellen Zeitstempel generieren
-            now_ts = datetime.now()
-            
-            # Extrahiere den displayName.text für den besseren Anzeigenamen
-            display_name = None
-            if place_data.get('displayName') and place_data['displayName'].get('text'):
-                display_name = place_data['displayName']['text']
-
-            # Extrahiere editorialSummary.text
-            editorial_summary = None
-            if place_data.get('editorialSummary') and place_data['editorialSummary'].get('text'):
-                editorial_summary = place_data['editorialSummary']['text']
-
-            # --- Place Tabelle --- # MODIFIZIERT: PLZ aus addressComponents holen
-            postal_code_value = None
-            address_components = place_data.get('addressComponents', [])
-            if address_components:
-                for component in address_components:
-                    if 'postal_code' in component.get('types', []):
-                        postal_code_value = component.get('longText') or component.get('shortText')
-                        break # Nimm den ersten gefundenen
-
-            place_values = {
-                'place_id': place_id,
-                'name': place_data.get('name'),
-                'display_name': display_name,  # Speichere den displayName.text, falls vorhanden
-                'formatted_address': place_data.get('formattedAddress'),
-                'latitude': place_data.get('location', {}).get('latitude'),
-                'longitude': place_data.get('location', {}).get('longitude'),
-                'phone_number': place_data.get('internationalPhoneNumber'),
-                'website_uri': place_data.get('websiteUri'),
-                'google_maps_uri': place_data.get('googleMapsUri'),
-                'price_level': place_data.get('priceLevel', '').split('$')[-1].count('€') if isinstance(place_data.get('priceLevel'), str) else None,
-                'primary_type': place_data.get('types', [None])[0],
-                'city_id': city_id,
-                'last_updated': now_ts,
-                'postal_code': postal_code_value, # NEUE SPALTE
-                'supports_live_music': place_data.get('liveMusic'),
-                'outdoor_seating': place_data.get('outdoorSeating'),
-                'editorial_summary': editorial_summary
-            }
-            # Bereinige None-Werte
-            place_values_clean = {k: v for k, v in place_values.items() if v is not None}
+async def run_with_db(fn, *args):
+    """Wie with_db, aber in einem Worker-Thread, damit der Event-Loop nicht blockiert."""
+    return await asyncio.to_thread(with_db, fn, *args)
 
-            # UPSERT Logik
-            columns = ', '.join(place_values_clean.keys())
-            placeholders = ', '.join(['?'] * len(place_values_clean))
-            update_setters = ', '.join([f"{key} = excluded.{key}" for key in place_values_clean.keys() if key != 'place_id'])
+def create_search_job(db, term_name, incremental=False, max_age_days=None):
+    """
+    Legt den Suchbegriff (falls nötig) und einen Suchauftrag mit allen abzufragenden Städten an.
 
-            sql_place = f"""
-                INSERT INTO place ({columns}) VALUES ({placeholders})
-                ON CONFLICT(place_id) DO UPDATE SET {update_setters}
-            """
-            try:
-                cursor.execute(sql_place, list(place_values_clean.values()))
-            except sqlite3.Error as e:
-                print(f"FEHLER beim Speichern von place {place_id}: {e}")
-                continue
+    Mit incremental=True werden Städte ausgelassen, deren letzte Suche für den Begriff jünger
+    als max_age_days (Standard: SEARCH_STALE_AFTER_DAYS) ist.
 
-            # --- Place Type Tabelle ---
-            types = place_data.get('types', [])
-            for place_type in types:
-                try:
-                    cursor.execute(
-                        "INSERT OR IGNORE INTO place_type (place_id, type) VALUES (?, ?)",
-                        (place_id, place_type)
-                    )
-                except sqlite3.Error as e:
-                    print(f"FEHLER beim Speichern von place_type für {place_id}: {e}")
-
-            # --- Place Search Tabelle ---
-            try:
-                cursor.execute(
-                    """
-                    INSERT OR IGNORE INTO place_search (term_id, city_id, place_id, search_timestamp)
-                    VALUES (?, ?, ?, ?)
-                    """,
-                    (term_id, city_id, place_id, now_ts)
-                )
-            except sqlite3.Error as e:
-                print(f"FEHLER beim Speichern von place_search für {place_id} in {city_id}: {e}")
+    Returns:
+        job_id des neuen Auftrags (Statusmeldungen laufen über status_bus unter dieser ID)
 
-            # --- Rating History Tabelle ---
-            rating = place_data.get('rating')
-            user_rating_count = place_data.get('userRatingCount')
-            if rating is not None and user_rating_count is not None:
-                try:
-                    cursor.execute(
-                        """
-                        INSERT INTO rating_history (place_id, rating, user_rating_count, timestamp)
-                        VALUES (?, ?, ?, ?)
-                        """,
-                        (place_id, rating, user_rating_count, now_ts)
-                    )
-                except sqlite3.Error as e:
-                    print(f"FEHLER beim Speichern der Bewertungshistorie für {place_id}: {e}")
-    
-            # --- Opening Hours Tabelle --- # NEUER ABSCHNITT
-            opening_hours_data = place_data.get('regularOpeningHours')
-            if opening_hours_data:
-                weekday_text = "\n".join(opening_hours_data.get('weekdayDescriptions', []))
-                periods_json = json.dumps(opening_hours_data.get('periods', []))
-                try:
-                    cursor.execute(
-                        """
-                        INSERT INTO opening_hours (place_id, weekday_text, periods_json)
-                        VALUES (?, ?, ?)
-                        ON CONFLICT(place_id) DO UPDATE SET
-                            weekday_text = excluded.weekday_text,
-                            periods_json = excluded.periods_json
-                        """,
-                        (place_id, weekday_text, periods_json)
-                    )
-                except sqlite3.Error as e:
-                     print(f"FEHLER beim Speichern der Öffnungszeiten für {place_id}: {e}")
-
-            # --- Reviews Tabelle --- # NEUER ABSCHNITT
-            reviews_data = place_data.get('reviews', [])
-            if reviews_data:
-                for review in reviews_data:
-                    publish_time_str = review.get('publishTime')
-                    publish_time_dt = None
-                    if publish_time_str:
-                         try:
-                            # Versuche, das ISO 8601 Format mit 'Z' zu parsen
-                            publish_time_dt = datetime.fromisoformat(publish_time_str.replace('Z', '+00:00'))
-                         except ValueError:
-                              print(f"Warnung: Konnte publishTime '{publish_time_str}' für Review von {review.get('authorAttribution', {}).get('displayName')} nicht parsen.")
+    Raises:
+        sqlite3.Error, ValueError: wenn der Suchbegriff nicht angelegt werden kann oder keine Städte vorhanden sind
+        search_jobs.JobConflict: wenn für den Suchbegriff bereits ein Auftrag läuft (auch in einem anderen Worker)
+    """
+    logger = app.logger
+    cursor = db.cursor()
+    messages = []
+
+    # Prüfen, ob der Suchbegriff bereits existiert; wenn nicht, anlegen
+    cursor.execute("SELECT term_id FROM search_term WHERE name = ?", (term_name,))
+    term_result = cursor.fetchone()
+    if term_result:
+        term_id = term_result['term_id']
+    else:
+        logger.info(f"Suchbegriff '{term_name}' noch nicht in der Datenbank, wird automatisch hinzugefügt.")
+        cursor.execute("INSERT INTO search_term (name) VALUES (?)", (term_name,))
+        term_id = cursor.lastrowid
+        db.commit()
+        logger.info(f"Suchbegriff '{term_name}' (ID: {term_id}) zur Datenbank hinzugefügt.")
+        messages.append(f"Suchbegriff '{term_name}' erfolgreich angelegt.")
 
-                    try:
-                        cursor.execute(
-                            """
-                            INSERT OR IGNORE INTO review (
-                                place_id, author_name, rating, 
-                                relative_publish_time_description, text, language_code, publish_time
-                            )
-                            VALUES (?, ?, ?, ?, ?, ?, ?) 
-                            """,
-                            (
-                                place_id,
-                                review.get('authorAttribution', {}).get('displayName'),
-                                review.get('rating'),
-                                review.get('relativePublishTimeDescription'),
-                                review.get('text', {}).get('text'),
-                                review.get('text', {}).get('languageCode'),
-                                publish_time_dt # Speichere als DATETIME
-                            )
-                        )
-                    except sqlite3.Error as e:
-                        print(f"FEHLER beim Speichern von Review für {place_id}: {e}")
+    cursor.execute("SELECT city_id FROM city")
+    city_ids = [row['city_id'] for row in cursor.fetchall()]
+    logger.info(f"  -> {len(city_ids)} Städte mit Koordinaten gefunden.")
+    if not city_ids:
+        raise ValueError("Keine Städte mit Koordinaten in der Datenbank gefunden.")
+
+    if incremental:
+        stale_days = max_age_days if max_age_days is not None else SEARCH_STALE_AFTER_DAYS
+        fresh_ids = fresh_city_ids(db, term_id, stale_days)
+        stale_ids = [city_id for city_id in city_ids if city_id not in fresh_ids]
+        skip_message = f"Inkrementelle Suche: {len(city_ids) - len(stale_ids)} Städte haben Ergebnisse, die jünger als {stale_days:g} Tage sind, und werden übersprungen. {len(stale_ids)} Städte werden aktualisiert."
+        logger.info(skip_message)
+        messages.append(skip_message)
+        city_ids = stale_ids
+
+    # Auftrag mit allen abzufragenden Städten anlegen (Checkpoint zum Fortsetzen)
+    job_id = search_jobs.create_job(db, term_id, city_ids)
+    status_bus.publish(job_id, f"Suchauftrag #{job_id} für '{term_name}' angelegt.")
+    for message in messages:
+        status_bus.publish(job_id, message)
+    return job_id
+
+def run_place_search_for_all_cities(term_name, API_KEY, pause_between_cities=1, incremental=False, max_age_days=None, job_id=None):
+    """
+    Führt die Google Places Suche für einen Begriff über alle Städte durch und speichert Ergebnisse.
 
-    # Änderungen speichern und Verbindung schließen
-    conn.commit()
-    conn.close()
+    Jeder Lauf gehört zu einem Suchauftrag (search_jobs). Ohne job_id wird ein neuer Auftrag
+    angelegt (siehe create_search_job), sonst wird der bestehende Auftrag fortgesetzt: Es werden
+    nur seine noch nicht erledigten Städte abgefragt. Der Auftrag muss diesem Prozess gehören
+    (create_job bzw. claim_job); seine Lease wird während des Laufs per Heartbeat erneuert.
+    Statusmeldungen gehen an status_bus.
+    """
+    if job_id is None:
+        db = get_db()
+        try:
+            job_id = create_search_job(db, term_name, incremental, max_age_days)
+        except search_jobs.JobConflict:
+            app.logger.error(f"Für '{term_name}' läuft bereits eine Suche.")
+            return False
+        except (sqlite3.Error, ValueError) as e:
+            app.logger.error(f"Suchauftrag für '{term_name}' konnte nicht angelegt werden: {e}")
+            return False
+        finally:
+            db.close()
+
+    def publish(message):
+        status_bus.publish(job_id, message)
+
+    def load_run(db):
+        """Suchbegriff, offene Städte und locationBias-Hinweise des Auftrags."""
+        cursor = db.cursor()
+        cursor.execute("SELECT term_id FROM search_job WHERE job_id = ?", (job_id,))
+        term_id = cursor.fetchone()['term_id']
+        # Nur Städte, die im Auftrag noch nicht erledigt sind
+        open_ids = set(search_jobs.open_city_ids(db, job_id))
+        cursor.execute("SELECT city_id, name, simplified_name, latitude, longitude FROM city")
+        cities = [city for city in cursor.fetchall() if city['city_id'] in open_ids]
+        # Städte, für die zuletzt nur die locationBias-Anfrage Treffer lieferte
+        return term_id, cities, load_search_hints(db)
+
+    # Hauptfunktion als asynchrone Funktion definieren. Alle Datenbankzugriffe laufen über
+    # run_with_db in einem Worker-Thread: Der Event-Loop wird von allen Aufträgen geteilt und darf
+    # nicht auf Sperren (busy_timeout) warten, während dort Abrufe laufen.
+    async def keep_lease(cancel_event):
+        """Erneuert die Lease, bis der Lauf endet; übernimmt Abbruchanforderungen anderer Prozesse."""
+        while True:
+            await asyncio.sleep(search_jobs.JOB_HEARTBEAT_INTERVAL)
+            try:
+                state = await run_with_db(search_jobs.heartbeat, job_id)
+            except sqlite3.Error as e:
+                app.logger.error(f"Heartbeat von Suchauftrag #{job_id} fehlgeschlagen: {e}")
+                continue
+            if state == 'lost':
+                # Ein anderer Prozess hat den Auftrag übernommen: diesen Lauf beenden
+                app.logger.error(f"Suchauftrag #{job_id} wird inzwischen von einem anderen Prozess ausgeführt.")
+                publish(f"FEHLER: Suchauftrag #{job_id} wurde von einem anderen Prozess übernommen.")
+                cancel_event.set()
+                return
+            if state == 'cancel':
+                cancel_event.set()
 
-# --- Kernfunktion für die Massensuche ---
-def run_place_search_for_all_cities(term_name, API_KEY, pause_between_cities=1):
-    """Führt die Google Places Suche für einen Begriff über alle Städte durch und speichert Ergebnisse."""
-    global search_status_queue
-    
-    # Hauptfunktion als asynchrone Funktion definieren
     async def run_search_async():
-        
         logger = app.logger # Logger holen
-        db = None 
+        writer = None
+        lease_task = None
         try:
-            db = get_db()
-            cursor = db.cursor()
             db_path = DATABASE  
 
-            # Prüfen, ob der Suchbegriff bereits existiert
-            cursor.execute("SELECT term_id FROM search_term WHERE name = ?", (term_name,))
-            term_result = cursor.fetchone()
-            
-            # Wenn der Suchbegriff nicht existiert, füge ihn hinzu
-            if not term_result:
-                logger.info(f"Suchbegriff '{term_name}' noch nicht in der Datenbank, wird automatisch hinzugefügt.")
-                search_status_queue.put(f"Neuer Suchbegriff '{term_name}' wird angelegt...")
-                try:
-                    cursor.execute("INSERT INTO search_term (name) VALUES (?)", (term_name,))
-                    term_id = cursor.lastrowid
-                    db.commit()
-                    logger.info(f"Suchbegriff '{term_name}' (ID: {term_id}) zur Datenbank hinzugefügt.")
-                    search_status_queue.put(f"Suchbegriff '{term_name}' erfolgreich angelegt.")
-                except sqlite3.Error as e:
-                    logger.error(f"Fehler beim Hinzufügen des Suchbegriffs '{term_name}': {e}")
-                    search_status_queue.put(f"FEHLER: Suchbegriff '{term_name}' konnte nicht hinzugefügt werden: {e}")
-                    search_status_queue.put("DONE")
-                    db.close()
-                    return
-                
-                # Suchbegriff nochmal aus DB holen, um ID zu bekommen
-                cursor.execute("SELECT term_id FROM search_term WHERE name = ?", (term_name,))
-                term_result = cursor.fetchone()
-                
-                if not term_result:
-                    logger.error(f"Suchbegriff '{term_name}' konnte nicht in der Datenbank gefunden werden, obwohl er gerade hinzugefügt wurde.")
-                    search_status_queue.put(f"FEHLER: Kritischer Datenbankfehler mit Suchbegriff '{term_name}'.")
-                    search_status_queue.put("DONE")
-                    db.close()
-                    return
+            term_id, cities, search_hints = await run_with_db(load_run)
+            logger.info(f"Starte Massensuche für Begriff: '{term_name}' (ID: {term_id}, Auftrag #{job_id})")
+            publish(f"Starte Suche für '{term_name}'...")
+            total_cities = len(cities)
+            cancel_event = search_jobs.register_active(job_id)
+            lease_task = asyncio.create_task(keep_lease(cancel_event))
             
-            term_id = term_result['term_id']
-            logger.info(f"Starte Massensuche für Begriff: '{term_name}' (ID: {term_id})")
-            search_status_queue.put(f"Starte Suche für '{term_name}'...")
+            publish(f"0/{total_cities} Städten verarbeitet.")
 
-            cursor.execute("SELECT city_id, name, simplified_name, latitude, longitude FROM city")
-            cities = cursor.fetchall()
-            total_cities = len(cities)
-            logger.info(f"  -> {total_cities} Städte mit Koordinaten gefunden.")
-            if total_cities == 0:
-                logger.error("Keine Städte mit Koordinaten in der Datenbank für Massensuche gefunden.")
-                search_status_queue.put("FEHLER: Keine Städte mit Koordinaten in der Datenbank gefunden.")
-                return 
-                
-            search_status_queue.put(f"0/{total_cities} Städten verarbeitet.")
+            changed_hints = {}
 
-            rate_limit = 500  
-            sem = asyncio.Semaphore(10)  # REDUZIERT VON 50
-            
             processed_cities_count = 0 # Umbenannt für Klarheit
             total_places_found = 0
+            failed_cities_count = 0
             start_time = time.time()
-            batch_size = 50  
+            stats = LatencyStats()
             
-            async def process_city_with_rate_limit(city_data, session_context): # Parameter umbenannt
-                # Verwende nonlocal um auf die Zählvariable im äußeren Scope zuzugreifen
-                nonlocal processed_cities_count, total_places_found
-
-                async with sem:
-                    city_id_local = city_data['city_id']
-                    city_query_name_local = city_data['simplified_name'] if city_data['simplified_name'] else city_data['name']
-                    city_display_name_local = city_data['name']
-                    # sqlite3.Row unterstützt kein .get(), deshalb try/except verwenden
-                    try:
-                        city_latitude = city_data['latitude']
-                    except (KeyError, IndexError):
-                        city_latitude = None
-                    try:
-                        city_longitude = city_data['longitude']
-                    except (KeyError, IndexError):
-                        city_longitude = None
-                    
-                    current_processing_num = processed_cities_count + 1 # Für Logging, bevor Zähler erhöht wird
-                    query_text = f"{term_name} in {city_query_name_local}"
-                    logger.info(f"Verarbeite Stadt: {city_display_name_local} ({current_processing_num}/{total_cities}) für Begriff '{term_name}'")
-                    
-                    api_result = await fetch_google_maps_data_async(
-                        session_context, 
-                        API_KEY, 
-                        query_text, 
-                        city_id_local, 
-                        city_display_name_local,
-                        latitude=city_latitude,
-                        longitude=city_longitude
-                    )
-                    
-                    processed_cities_count += 1 # Zähler hier erhöhen, nachdem der API-Call (potenziell lang) fertig ist
-
-                    if "error" in api_result:
-                        logger.error(f"API Fehler für {city_display_name_local}: {api_result.get('error')} (Status: {api_result.get('status_code', 'N/A')})")
-                        search_status_queue.put(f"WARNUNG: API Fehler für {city_display_name_local} - {api_result.get('error')}")
-                        # Gib das Fehlerobjekt weiter, damit es ggf. von save_places_to_db ignoriert wird
-                        # oder die Plätze, die bis zum Fehler gesammelt wurden
-                        return api_result 
-                    
-                    places_in_city_count = len(api_result.get("places", []))
-                    total_places_found += places_in_city_count
-
-                    elapsed_time = time.time() - start_time # Korrigierte Einrückung
-                    estimated_remaining = (elapsed_time / processed_cities_count) * (total_cities - processed_cities_count) if processed_cities_count > 0 else 0
-                    minutes, seconds = divmod(estimated_remaining, 60) # Korrigierte Einrückung
-                        
-                    status_message = f"{processed_cities_count}/{total_cities} Städte verarbeitet ({city_display_name_local}: {places_in_city_count} Orte). Geschätzte Restzeit: {int(minutes)} min {int(seconds)} sek."
-                    search_status_queue.put(status_message)
-                    logger.info(status_message)
-
-                    delay_val = 60 / rate_limit  
-                    await asyncio.sleep(delay_val)
-                    
-                    return api_result
+            async def fetch_city(city_data):
+                city_id_local = city_data['city_id']
+                city_query_name_local = city_data['simplified_name'] if city_data['simplified_name'] else city_data['name']
+                city_display_name_local = city_data['name']
+                # sqlite3.Row unterstützt kein .get(), deshalb try/except verwenden
+                try:
+                    city_latitude = city_data['latitude']
+                except (KeyError, IndexError):
+                    city_latitude = None
+                try:
+                    city_longitude = city_data['longitude']
+                except (KeyError, IndexError):
+                    city_longitude = None
+                
+                query_text = f"{term_name} in {city_query_name_local}"
+                logger.info(f"Verarbeite Stadt: {city_display_name_local} für Begriff '{term_name}'")
+                
+                return await fetch_google_maps_data_async(
+                    session, 
+                    API_KEY, 
+                    query_text, 
+                    city_id_local, 
+                    city_display_name_local,
+                    latitude=city_latitude,
+                    longitude=city_longitude,
+                    bias_first=search_hints.get(city_id_local, False)
+                )
 
-            async with aiohttp.ClientSession() as session:
-                for i in range(0, total_cities, batch_size):
-                    batch_cities = cities[i:i+batch_size]
-                    logger.info(f"Starte Verarbeitung für Batch {i//batch_size + 1} (Städte {i+1} bis {min(i+batch_size, total_cities)})")
-                    
-                    tasks_for_batch = [process_city_with_rate_limit(city_item, session) for city_item in batch_cities]
-                    batch_api_results = []
-                    try:
-                        batch_api_results = await asyncio.gather(*tasks_for_batch, return_exceptions=True)
-                    except Exception as gather_exc:
-                        logger.error(f"Schwerwiegender Fehler während asyncio.gather für Batch {i//batch_size + 1}: {gather_exc}", exc_info=True)
-                        search_status_queue.put(f"FEHLER: Kritischer Fehler bei der Verarbeitung eines Batches: {gather_exc}")
-                        # Ggf. hier entscheiden, ob der gesamte Prozess abgebrochen werden soll
-
-                    current_batch_places_to_save_db = []
-                    for single_city_result in batch_api_results:
-                        if isinstance(single_city_result, Exception):
-                            logger.error(f"Exception in einem Task des Batches abgefangen: {single_city_result}", exc_info=True)
-                            search_status_queue.put(f"WARNUNG: Fehler bei der Verarbeitung einer Stadt im Batch: {single_city_result}")
-                            continue 
+            # Ein Writer-Thread speichert die Ergebnisse, während weiter abgerufen wird
+            writer = PlaceWriter(db_path, term_id, job_id=job_id).start()
+
+            # Langlebige Session des API-Event-Loops (Keep-Alive, DNS-Cache)
+            session = await places_api.get_async_session()
+            # Offene Städte dieses Laufs; fehlgeschlagene werden mit Backoff erneut versucht
+            remaining = {city['city_id']: city for city in cities}
+            attempts = {}
+            retry_at = {}
+            cancelled = False
+            while remaining and not cancelled:
+                now = time.monotonic()
+                due = [city for city_id, city in remaining.items() if retry_at.get(city_id, 0) <= now]
+                if not due:
+                    # Auf den nächsten fälligen Wiederholungsversuch warten (Abbruch bleibt möglich)
+                    wait = min(retry_at[city_id] for city_id in remaining) - now
+                    cancelled = await asyncio.to_thread(cancel_event.wait, wait)
+                    continue
+
+                # Immer SEARCH_CONCURRENCY Abrufe gleichzeitig; Ergebnisse kommen in Fertigstellungsreihenfolge.
+                # Die Rate (Anfragen pro Minute) begrenzt places_api.limiter.
+                async with aclosing(sliding_window(due, fetch_city, SEARCH_CONCURRENCY,
+                                                   timeout=CITY_FETCH_TIMEOUT, stats=stats)) as jobs:
+                    async for job in jobs:
+                        if cancel_event.is_set():
+                            cancelled = True
+                            break
+                        city_id = job.item['city_id']
+                        city_display_name_local = job.item['name']
+                        api_result = job.result
+
+                        error = None
+                        if isinstance(api_result, Exception):
+                            logger.error(f"Fehler bei der Verarbeitung von {city_display_name_local}: {api_result!r}")
+                            error = f"Fehler bei der Verarbeitung von {city_display_name_local}: {api_result}"
+                        elif "error" in api_result:
+                            logger.error(f"API Fehler für {city_display_name_local}: {api_result.get('error')} (Status: {api_result.get('status_code', 'N/A')})")
+                            error = f"API Fehler für {city_display_name_local} - {api_result.get('error')}"
+
+                        if error is not None:
+                            # Fehlerergebnisse werden nicht gespeichert, nur im Auftrag vermerkt
+                            await run_with_db(search_jobs.mark_city_failed, job_id, city_id, error)
+                            attempts[city_id] = attempts.get(city_id, 0) + 1
+                            if attempts[city_id] < search_jobs.JOB_MAX_ATTEMPTS:
+                                delay = search_jobs.retry_delay(attempts[city_id])
+                                retry_at[city_id] = time.monotonic() + delay
+                                publish(f"WARNUNG: {error} (neuer Versuch in {delay:.0f} s)")
+                            else:
+                                del remaining[city_id]
+                                processed_cities_count += 1
+                                failed_cities_count += 1
+                                publish(f"WARNUNG: {error} (nach {attempts[city_id]} Versuchen aufgegeben)")
+                            continue
+
+                        del remaining[city_id]
+                        processed_cities_count += 1
                         
-                        # Auch wenn ein "error"-Key im Result ist (von fetch_google_maps_data_async so zurückgegeben),
-                        # wollen wir ggf. die bis dahin gesammelten Orte speichern.
-                        current_batch_places_to_save_db.append(single_city_result)
-                    
-                    if current_batch_places_to_save_db:
-                        logger.info(f"Speichere {len(current_batch_places_to_save_db)} Ergebnisse (Städte) aus Batch {i//batch_size + 1} in der DB...")
-                        await save_places_to_db(db_path, term_id, current_batch_places_to_save_db)
-                        logger.info(f"Ergebnisse aus Batch {i//batch_size + 1} gespeichert.")
-                    else:
-                        logger.info(f"Keine Ergebnisse zum Speichern aus Batch {i//batch_size + 1}.")
+                        location_bias_needed = api_result.get("location_bias_needed")
+                        if location_bias_needed is not None and search_hints.get(api_result["city_id"]) != location_bias_needed:
+                            changed_hints[api_result["city_id"]] = location_bias_needed
                 
-                end_time = time.time()
-                total_duration = end_time - start_time
-                minutes, seconds = divmod(total_duration, 60)
+                        # An den Writer-Thread übergeben; wartet nur, wenn dessen Warteschlange voll ist
+                        await writer.submit(api_result)
                 
-                completion_message = f"Suche abgeschlossen. {total_places_found} Orte in {processed_cities_count} von {total_cities} Städten gefunden in {int(minutes)} min {int(seconds)} sek."
-                logger.info(completion_message)
-                search_status_queue.put(completion_message)
+                        places_in_city_count = len(api_result.get("places", []))
+                        total_places_found += places_in_city_count
+
+                        elapsed_time = time.time() - start_time
+                        estimated_remaining = (elapsed_time / processed_cities_count) * (total_cities - processed_cities_count)
+                        minutes, seconds = divmod(estimated_remaining, 60)
+                    
+                        status_message = f"{processed_cities_count}/{total_cities} Städte verarbeitet ({city_display_name_local}: {places_in_city_count} Orte). {stats.summary()}, Limit {places_api.limiter.qpm:.0f} QPM. Geschätzte Restzeit: {int(minutes)} min {int(seconds)} sek."
+                        publish(status_message)
+                        logger.info(status_message)
+            
+            # Restliche Ergebnisse schreiben lassen und auf den Writer warten
+            await asyncio.to_thread(writer.close)
+            await run_with_db(save_search_hints, changed_hints)
+            logger.info(f"{writer.places_written} Orte aus {writer.results_written} Städten gespeichert.")
+            
+            end_time = time.time()
+            total_duration = end_time - start_time
+            minutes, seconds = divmod(total_duration, 60)
+            
+            if cancelled:
+                job_status = 'cancelled'
+                completion_message = f"Suche abgebrochen. {total_places_found} Orte in {processed_cities_count} von {total_cities} Städten gefunden in {int(minutes)} min {int(seconds)} sek. Suchauftrag #{job_id} kann fortgesetzt werden."
+            else:
+                job_status = 'incomplete' if failed_cities_count else 'completed'
+                completion_message = f"Suche abgeschlossen. {total_places_found} Orte in {processed_cities_count} von {total_cities} Städten gefunden in {int(minutes)} min {int(seconds)} sek. ({stats.summary()})"
+            if failed_cities_count:
+                completion_message += f" {failed_cities_count} Städte fehlgeschlagen; Suchauftrag #{job_id} kann fortgesetzt werden."
+            await run_with_db(search_jobs.finish_job, job_id, job_status, completion_message)
+            logger.info(completion_message)
+            publish(completion_message)
         
         except Exception as e:
             import traceback
             error_msg = f"Schwerwiegender Fehler im Hintergrund-Suchprozess: {e}"
             logger.error(f"{error_msg}\n{traceback.format_exc()}", exc_info=True)
-            search_status_queue.put(f"FEHLER: {error_msg}")
+            publish(f"FEHLER: {error_msg}")
+            try:
+                # Bereits gespeicherte Städte sind im Auftrag erledigt; der Rest kann fortgesetzt werden
+                await run_with_db(search_jobs.finish_job, job_id, 'interrupted', error_msg)
+            except sqlite3.Error as status_error:
+                logger.error(f"Status von Suchauftrag #{job_id} konnte nicht gespeichert werden: {status_error}")
             
         finally:
-            search_status_queue.put("DONE")
-            if db:
-                db.close()
-                logger.info("Datenbankverbindung im Hintergrundprozess geschlossen.")
-    
-    asyncio.run(run_search_async())
+            if writer is not None:
+                try:
+                    await asyncio.to_thread(writer.close)
+                except Exception as e:
+                    # z.B. abgebrochener Writer; der Auftrag ist dann bereits als unterbrochen markiert
+                    logger.error(f"Place-Writer von Suchauftrag #{job_id}: {e}")
+            if lease_task is not None:
+                lease_task.cancel()
+            search_jobs.unregister_active(job_id)
+            publish(STATUS_DONE)
+    
+    # Auf dem dauerhaften Event-Loop ausführen, damit die HTTP-Verbindungen über Suchläufe hinweg bestehen bleiben
+    places_api.run_async(run_search_async())
     return True
 
-def process_data(min_age, max_age, w_pop, w_age, w_income):
-    # --- Daten aus der Datenbank laden ---
-    conn = None
-    try:
-        conn = get_db() # Verbindung zur data.db herstellen
-        cursor = conn.cursor()
-
-        # 1. Finde das aktuellste Jahr in den Demografie-Daten
-        cursor.execute("SELECT MAX(year) FROM demographics")
-        latest_year = cursor.fetchone()[0]
-        if not latest_year:
-            raise ValueError("Keine Demografie-Daten in der Datenbank gefunden.")
-
-        # 2. Lade Stadt-, Demografie- und Altersverteilungsdaten für das aktuellste Jahr
-        # Hauptabfrage für Stadt- und Demografiedaten, jetzt mit Modus (häufigster Wert) für Event/Gastro
-        query_main = f'''
-            WITH CityEventCounts AS (
-                -- Zähle Vorkommen jedes Event-Textes pro Stadt
-                SELECT
-                    pc.city_id,
-                    peg.event_gastro_text,
-                    COUNT(peg.event_gastro_text) AS text_count
-                FROM postal_code pc
-                JOIN plz_event_gastro peg ON pc.postal_code_id = peg.postal_code_id
-                -- Nur Texte berücksichtigen, die nicht leer oder NULL sind
-                WHERE peg.event_gastro_text IS NOT NULL AND peg.event_gastro_text != \'\'
-                GROUP BY pc.city_id, peg.event_gastro_text
-            ),
-            RankedCityEvents AS (
-                -- Weise jedem Text pro Stadt einen Rang basierend auf der Häufigkeit zu
-                SELECT
-                    city_id,
-                    event_gastro_text,
-                    -- Rang 1 für den häufigsten. Bei Gleichstand wird der (alphabetisch) erste genommen.
-                    ROW_NUMBER() OVER (PARTITION BY city_id ORDER BY text_count DESC, event_gastro_text ASC) AS rn
-                FROM CityEventCounts
-            )
-            -- Hauptabfrage: Verbinde Stadt-/Demografie-Daten mit dem häufigsten Event-Text
+# --- Städtedatensatz (wird prozessweit im Speicher gehalten) ---
+# Spalten, die nur für den Excel-Export benötigt werden
+EXPORT_ONLY_COLUMNS = ['name', 'bundesland', 'region_code', 'latitude', 'longitude']
+
+def load_city_dataset(conn):
+    """Lädt Stadt-, Demografie- und Altersverteilungsdaten des aktuellsten Jahres als ein DataFrame."""
+    cursor = conn.cursor()
+
+    # 1. Finde das aktuellste Jahr in den Demografie-Daten
+    cursor.execute("SELECT MAX(year) FROM demographics")
+    latest_year = cursor.fetchone()[0]
+    if not latest_year:
+        raise ValueError("Keine Demografie-Daten in der Datenbank gefunden.")
+
+    # 2. Lade Stadt-, Demografie- und Altersverteilungsdaten für das aktuellste Jahr
+    # Hauptabfrage für Stadt- und Demografiedaten, jetzt mit Modus (häufigster Wert) für Event/Gastro
+    # Die Einkommensspalte heißt unabhängig vom Jahr 'Einkommen_2022', da der restliche Code diesen Namen erwartet.
+    query_main = '''
+        WITH CityEventCounts AS (
+            -- Zähle Vorkommen jedes Event-Textes pro Stadt
             SELECT
-                c.city_id,
-                c.name AS location_name,
-                c.simplified_name,
-                c.bundesland AS Land,
-                d.total_population AS total,
-                d.income AS Einkommen_{latest_year},
-                -- Hole den Text mit Rang 1 (den häufigsten) oder \'N/A\'
-                COALESCE(rce.event_gastro_text, \'N/A\') AS event_gastro_text
-            FROM city c
-            JOIN demographics d ON c.city_id = d.city_id
-            LEFT JOIN RankedCityEvents rce ON c.city_id = rce.city_id AND rce.rn = 1
-            WHERE d.year = ?
-            -- Kein GROUP BY c.city_id mehr nötig, da der Join nur den häufigsten Wert holt
-        '''
-        df_main = pd.read_sql_query(query_main, conn, params=(latest_year,))
-
-        # Abfrage für Altersverteilungsdaten
-        query_age = f"""
+                pc.city_id,
+                peg.event_gastro_text,
+                COUNT(peg.event_gastro_text) AS text_count
+            FROM postal_code pc
+            JOIN plz_event_gastro peg ON pc.postal_code_id = peg.postal_code_id
+            -- Nur Texte berücksichtigen, die nicht leer oder NULL sind
+            WHERE peg.event_gastro_text IS NOT NULL AND peg.event_gastro_text != \'\'
+            GROUP BY pc.city_id, peg.event_gastro_text
+        ),
+        RankedCityEvents AS (
+            -- Weise jedem Text pro Stadt einen Rang basierend auf der Häufigkeit zu
             SELECT
-                d.city_id,
-                ag.label AS age_group_label, -- Verwende Label für Pivot
-                dad.count
-            FROM demo_age_dist dad
-            JOIN demographics d ON dad.demography_id = d.demography_id
-            JOIN age_group ag ON dad.age_group_id = ag.age_group_id
-            WHERE d.year = ?
-        """
-        df_age_dist = pd.read_sql_query(query_age, conn, params=(latest_year,))
-        df_age_pivot = df_age_dist.pivot(index='city_id', columns='age_group_label', values='count').reset_index()
-        df_age_pivot = df_age_pivot.fillna(0)
-
-        # Zusammenführen der Hauptdaten mit den Altersdaten
-        df = pd.merge(df_main, df_age_pivot, on='city_id', how='left')
-        if not df.empty:
-            if 'event_gastro_text' in df.columns:
-                pass  # event_gastro_text ist vorhanden
-
-        # Einkommensspalte umbenennen, falls nötig, damit sie generisch 'Einkommen' heißt
-        # Der Rest des Codes erwartet 'Einkommen_2022'
-        # Wir benennen die dynamische Spalte in die erwartete um
-        # Vorsicht: Wenn latest_year nicht 2022 ist, könnte dies irreführend sein.
-        # Besser wäre es, den restlichen Code anzupassen, aber für minimale Änderungen machen wir es so:
-        if f'Einkommen_{latest_year}' in df.columns and 'Einkommen_2022' not in df.columns:
-            df = df.rename(columns={f'Einkommen_{latest_year}': 'Einkommen_2022'})
-        elif 'Einkommen_2022' not in df.columns:
-            # Fallback, falls die Spalte fehlt (sollte nicht passieren)
-            print(f"Warnung: Erwartete Einkommensspalte 'Einkommen_{latest_year}' oder 'Einkommen_2022' nicht im DataFrame.")
-            df['Einkommen_2022'] = 0 # Standardwert setzen
-
-        # --- Bundesland-Abkürzungen durch volle Namen ersetzen ---
-        if 'Land' in df.columns:
-             # .map() ersetzt Werte basierend auf dem Dictionary
-             # .fillna(df['Land']) behält den Originalwert (Abkürzung), falls keine Übereinstimmung gefunden wird
-             df['Land'] = df['Land'].str.strip() # Entferne führende/nachgestellte Leerzeichen
-             df['Land'] = df['Land'].map(BUNDESLAND_MAP).fillna(df['Land'])
-             # Optional: Falls Nicht-Gemappte zu 'N/A' werden sollen:
-             # df['Land'] = df['Land'].map(BUNDESLAND_MAP).fillna('N/A')
-        else:
-             print("Warnung: Spalte 'Land' (Bundesland) nicht im DataFrame nach SQL-Abfrage gefunden.")
-        # --- Ende Bundesland Mapping ---
-
-    except sqlite3.Error as e:
-        print(f"Datenbankfehler beim Laden der Daten: {e}")
-        # Hier könnte man eine leere Tabelle zurückgeben oder einen Fehler werfen
-        return {'error': f"Datenbankfehler: {e}"}
-    finally:
-        if conn:
-            conn.close()
+                city_id,
+                event_gastro_text,
+                -- Rang 1 für den häufigsten. Bei Gleichstand wird der (alphabetisch) erste genommen.
+                ROW_NUMBER() OVER (PARTITION BY city_id ORDER BY text_count DESC, event_gastro_text ASC) AS rn
+            FROM CityEventCounts
+        )
+        -- Hauptabfrage: Verbinde Stadt-/Demografie-Daten mit dem häufigsten Event-Text
+        SELECT
+            c.city_id,
+            c.name AS location_name,
+            c.simplified_name,
+            c.bundesland AS Land,
+            d.total_population AS total,
+            d.income AS Einkommen_2022,
+            -- Hole den Text mit Rang 1 (den häufigsten) oder \'N/A\'
+            COALESCE(rce.event_gastro_text, \'N/A\') AS event_gastro_text,
+            -- Zusätzliche Spalten für den Excel-Export
+            c.name, c.bundesland, c.region_code, c.latitude, c.longitude
+        FROM city c
+        JOIN demographics d ON c.city_id = d.city_id
+        LEFT JOIN RankedCityEvents rce ON c.city_id = rce.city_id AND rce.rn = 1
+        WHERE d.year = ?
+    '''
+    df_main = pd.read_sql_query(query_main, conn, params=(latest_year,))
+
+    # Abfrage für Altersverteilungsdaten
+    query_age = """
+        SELECT
+            d.city_id,
+            ag.label AS age_group_label, -- Verwende Label für Pivot
+            dad.count
+        FROM demo_age_dist dad
+        JOIN demographics d ON dad.demography_id = d.demography_id
+        JOIN age_group ag ON dad.age_group_id = ag.age_group_id
+        WHERE d.year = ?
+    """
+    df_age_dist = pd.read_sql_query(query_age, conn, params=(latest_year,))
+    df_age_pivot = df_age_dist.pivot(index='city_id', columns='age_group_label', values='count').reset_index()
+    df_age_pivot = df_age_pivot.fillna(0)
 
-    # --- Datenverarbeitung (ab hier weitgehend wie vorher) ---
+    # Zusammenführen der Hauptdaten mit den Altersdaten
+    df = pd.merge(df_main, df_age_pivot, on='city_id', how='left')
 
-    # Stelle sicher, dass simplified_name existiert (sollte aus DB kommen)
-    if 'simplified_name' not in df.columns:
-        print("Warnung: Spalte 'simplified_name' nicht in Datenbank gefunden. Verwende 'location_name'.")
-        df['simplified_name'] = df['location_name']
     # Fülle fehlende simplified_name mit location_name als Fallback
     df['simplified_name'] = df['simplified_name'].fillna(df['location_name'])
+    df['bundesland'] = df['bundesland'].fillna('N/A')
+
+    # --- Bundesland-Abkürzungen durch volle Namen ersetzen ---
+    # .fillna(df['Land']) behält den Originalwert (Abkürzung), falls keine Übereinstimmung gefunden wird
+    df['Land'] = df['Land'].str.strip() # Entferne führende/nachgestellte Leerzeichen
+    df['Land'] = df['Land'].map(BUNDESLAND_MAP).fillna(df['Land'])
+
+    # Altersgruppen-Spalten auf interne Namen (z.B. 'age_18_29') umbenennen und Matrix für die
+    # Zielgruppenberechnung einmalig aufbauen
+    age_columns = age_band_rename_map(df.columns)
+    df = df.rename(columns=age_columns)
+    for col in age_columns.values():
+        df[col] = pd.to_numeric(df[col], errors='coerce').fillna(0)
+    target_engine = TargetGroupEngine.from_frame(df)
+
+    print(f"Städtedatensatz für {latest_year} geladen ({len(df)} Städte).")
+    return latest_year, df, target_engine
+
+city_dataset_cache = CityDatasetCache(load_city_dataset)
+
+# Auswertungen aus einer In-Memory-Kopie der Datensatztabellen lesen (sonst über schreibgeschützte Verbindungen)
+ANALYTICS_REPLICA = os.environ.get('ANALYTICS_REPLICA', '1').lower() in ('1', 'true', 'yes')
+city_dataset_replica = TableReplica(lambda: db_pool.connect(DATABASE, readonly=True, check_same_thread=False))
+
+def get_city_dataset():
+    """Gibt den (gecachten) Städtedatensatz zurück."""
+    if ANALYTICS_REPLICA:
+        return city_dataset_cache.get_replicated(city_dataset_replica)
+    return city_dataset_cache.get(get_readonly_db)
+
+# --- Ergebnis-Cache für /process (LRU, begrenzt nach Anzahl und Größe) ---
+process_result_cache = ResultCache(
+    max_entries=int(os.environ.get('PROCESS_CACHE_MAX_ENTRIES', 32)),
+    max_bytes=int(os.environ.get('PROCESS_CACHE_MAX_MB', 128)) * 1024 * 1024
+)
 
-    # Deutschland-Eintrag entfernen (sollte in DB nicht vorkommen)
+def analysis_cache_key(min_age, max_age, w_pop, w_age, w_income, dataset_version):
+    """Normalisierter Schlüssel für ein Parameter-Set (Gewichte wie in process_data auf Summe 1 normiert)."""
+    weights = (w_pop, w_age, w_income)
+    total_weight = sum(weights)
+    if total_weight:
+        weights = tuple(round(w / total_weight, 6) for w in weights)
+    return (int(min_age), int(max_age)) + weights + (dataset_version,)
+
+# --- Analyse-Zustand pro Parameter-Set (Grundlage für Tabelle und Diagramm-Endpunkte) ---
+# df/df_analysis/sorted_cities werden zwischen Requests geteilt und dürfen nicht verändert werden.
+AnalysisState = namedtuple('AnalysisState', ['df', 'df_analysis', 'sorted_cities', 'clustering_income', 'clustering_target'])
+
+analysis_state_cache = ResultCache(
+    max_entries=int(os.environ.get('ANALYSIS_CACHE_MAX_ENTRIES', 16)),
+    max_bytes=int(os.environ.get('ANALYSIS_CACHE_MAX_MB', 64)) * 1024 * 1024
+)
 
-    # Bundesland-Mapping entfernen (kommt direkt aus DB)
+def get_analysis_state(min_age, max_age, w_pop, w_age, w_income, dataset):
+    """Gibt den (gecachten) Analyse-Zustand für ein Parameter-Set zurück."""
+    cache_key = analysis_cache_key(min_age, max_age, w_pop, w_age, w_income, dataset.version)
+    state = analysis_state_cache.get(cache_key)
+    if state is None:
+        state = build_analysis(min_age, max_age, w_pop, w_age, w_income, dataset)
+        if isinstance(state, dict):
+            return state
+        size = int(state.df.memory_usage(deep=True).sum() + state.df_analysis.memory_usage(deep=True).sum()) * 2
+        analysis_state_cache.put(cache_key, state, size=size)
+    return state
+
+def build_analysis(min_age, max_age, w_pop, w_age, w_income, dataset):
+    """
+    Berechnet Zielgruppe, Scores und Clustering für ein Parameter-Set (ohne Diagramme).
 
-    # Zielgruppe berechnen
-    # WICHTIG: calculate_target_group benötigt die Altersspalten aus df_age_pivot.
-    # Stelle sicher, dass die Spaltennamen in df_age_pivot mit denen übereinstimmen,
-    # die calculate_target_group erwartet (z.B. '0-17', '18-24', ...)
-    # Falls calculate_target_group in utils.py angepasst werden muss, ist das ein separater Schritt.
+    Returns:
+        AnalysisState oder ein Dictionary mit 'error'
+    """
+    # Eigene Kopie ohne die reinen Export-Spalten (der gecachte Datensatz bleibt unverändert)
+    df = dataset.df.drop(columns=EXPORT_ONLY_COLUMNS)
+
+    # --- Datenverarbeitung (ab hier weitgehend wie vorher) ---
+
+    # Zielgruppe berechnen (vektorisiert über die vorberechnete Altersmatrix des Datensatzes)
     try:
-        df = calculate_target_group(df, min_age, max_age)
+        df = calculate_target_group(df, min_age, max_age, engine=dataset.target_engine)
     except KeyError as e:
         print(f"Fehler in calculate_target_group: Fehlende Spalte {e}. Überprüfe die Altersspaltennamen im DataFrame und in utils.py.")
         return {'error': f"Fehler bei der Zielgruppenberechnung: Spalte {e} fehlt."}
@@ -784,61 +822,13 @@ def process_data(min_age, max_age, w_pop, w_age, w_income):
             print(f"Warnung: NaN-Werte in Spalte '{col}' nach Konvertierung gefunden. Werden mit 0 gefüllt.")
             df[col] = df[col].fillna(0)
 
-    # Min/Max Werte für Normalisierung berechnen (nachdem NaN entfernt wurde)
-    total_min, total_max = df["total"].min(), df["total"].max()
-    income_min, income_max = df["Einkommen_2022"].min(), df["Einkommen_2022"].max()
-    target_min, target_max = df["target_group_percent"].min(), df["target_group_percent"].max()
-
-    # Normalisierungsfunktion anwenden
-    df["norm_pop"] = df["total"].apply(lambda x: normalize(x, total_min, total_max) if total_max > total_min else 0)
-    df["norm_income"] = df["Einkommen_2022"].apply(lambda x: normalize(x, income_min, income_max) if income_max > income_min else 0)
-    df["norm_target"] = df["target_group_percent"].apply(lambda x: normalize(x, target_min, target_max) if target_max > target_min else 0)
-
-    # Gewichte normalisieren
-    total_weight = w_pop + w_age + w_income
-    w_pop /= total_weight
-    w_age /= total_weight
-    w_income /= total_weight
-
-    # Score berechnen
-    df["score"] = df["norm_pop"] * w_pop + df["norm_income"] * w_income + df["norm_target"] * w_age
-
-    # Clustering durchführen, um Cluster-Namen zu erhalten
-    # Feature-Auswahl für Clustering
-    features_for_clustering = df[['total', 'Einkommen_2022', 'target_group_percent']].copy()
-    # Sicherstellen, dass keine NaN-Werte im Clustering sind
-    features_for_clustering = features_for_clustering.fillna(0)
-    
-    # Skalierung der Daten
-    scaler = StandardScaler()
-    scaled_features = scaler.fit_transform(features_for_clustering)
-    
-    # K-Means Clustering
-    kmeans = KMeans(n_clusters=5, random_state=42)
-    raw_clusters = kmeans.fit_predict(scaled_features)
-    
-    # Zentren berechnen
-    centers = scaler.inverse_transform(kmeans.cluster_centers_)
-    
-    # Zuordnung der Cluster zu den Interpretationen
-    cluster_mapping = {}
-    
-    # Finde den Cluster mit den höchsten Bevölkerungszahlen -> Großstädte (blau, Cluster 2)
-    cluster_mapping[np.argmax([center[0] for center in centers])] = 1  # Blau
-    
-    # Finde den Cluster mit dem höchsten Zielgruppenanteil -> Universitätsstädte (lila, Cluster 4)
-    cluster_mapping[np.argmax([center[2] for center in centers])] = 3  # Lila
-    
-    # Finde den Cluster mit dem höchsten Einkommen -> Wohlhabende Mittelstädte (orange, Cluster 5)
-    cluster_mapping[np.argmax([center[1] for center in centers])] = 4  # Orange
-    
-    # Finde den Cluster mit dem niedrigsten Einkommen -> Ländliche Regionen (grün, Cluster 3)
-    cluster_mapping[np.argmin([center[1] for center in centers])] = 2  # Grün
-    
-    # Der übrig gebliebene Cluster ist Mittelstädte (rot, Cluster 1)
-    for i in range(5):
-        if i not in cluster_mapping:
-            cluster_mapping[i] = 0  # Rot
+    # Normalisierung und gewichteten Score vektorisiert berechnen (Gewichte werden auf Summe 1 normiert)
+    df = apply_scores(df, w_pop, w_age, w_income)
+
+    # Clustering einmal pro Request durchführen; Tabelle, statischer und interaktiver
+    # Plot verwenden dasselbe Ergebnis
+    clustering_income = fit_clustering(df, n_clusters=5)
+    clustering_target = fit_clustering_population_target(df, n_clusters=5)
     
     # Cluster-Namen definieren
     cluster_names = {
@@ -850,9 +840,43 @@ def process_data(min_age, max_age, w_pop, w_age, w_income):
     }
     
     # Cluster-Zuweisungen und Namen zum Dataframe hinzufügen
-    df['cluster_id'] = [cluster_mapping[c] for c in raw_clusters]
+    df['cluster_id'] = clustering_income.labels
     df['cluster_name'] = df['cluster_id'].map(cluster_names)
 
+
+    # Erweiterte Analysen
+    # Stellen sicher, dass die benötigten Spalten numerisch sind
+    df_analysis = df.copy()
+    for col in ['total', 'Einkommen_2022', 'target_group_percent', 'score', 'norm_pop', 'norm_income', 'norm_target']:
+        if col in df_analysis.columns:
+            df_analysis[col] = pd.to_numeric(df_analysis[col], errors='coerce').fillna(0)
+        else:
+             print(f"Warnung: Spalte '{col}' für erweiterte Analyse nicht gefunden.")
+             df_analysis[col] = 0 # Fallback
+
+
+    # Alle Städte nach Score sortieren (Grundlage für Balkendiagramme und Kreisdiagramm)
+    sorted_cities = df.sort_values("score", ascending=False).copy()
+
+    return AnalysisState(df, df_analysis, sorted_cities, clustering_income, clustering_target)
+
+def process_data(min_age, max_age, w_pop, w_age, w_income, dataset=None):
+    """Tabellendaten und Diagramm-URLs für ein Parameter-Set; die Diagramme werden erst beim Abruf gerendert."""
+    # --- Daten aus dem Städtedatensatz-Cache laden ---
+    if dataset is None:
+        try:
+            dataset = get_city_dataset()
+        except sqlite3.Error as e:
+            print(f"Datenbankfehler beim Laden der Daten: {e}")
+            # Hier könnte man eine leere Tabelle zurückgeben oder einen Fehler werfen
+            return {'error': f"Datenbankfehler: {e}"}
+
+    state = get_analysis_state(min_age, max_age, w_pop, w_age, w_income, dataset)
+    if isinstance(state, dict):
+        return state  # Fehler aus build_analysis
+    df = state.df
+    sorted_cities = state.sorted_cities
+
     # Stelle sicher, dass die relevanten Namen im result DataFrame sind
     # Verwende city_id statt dem alten Hash für die ID
     result = df[["city_id", "location_name", "simplified_name", "Land", "total", "Einkommen_2022", "target_group_percent", "cluster_id", "cluster_name", "score", "event_gastro_text"]].copy() # Neue Spalte hinzugefügt
@@ -861,71 +885,30 @@ def process_data(min_age, max_age, w_pop, w_age, w_income):
     result["target_group_percent"] = (result["target_group_percent"] * 100).round(1).astype(str) + "%"
     
     # Formatiere Zahlen mit Tausendertrennzeichen (Punkt)
-    result["total"] = result["total"].apply(lambda x: f"{int(x):,}".replace(",", "."))
-    result["Einkommen_2022"] = result["Einkommen_2022"].apply(lambda x: f"{int(x):,}".replace(",", "."))
+    result["total"] = format_thousands(result["total"])
+    result["Einkommen_2022"] = format_thousands(result["Einkommen_2022"])
     
     # Score numerisch halten für korrekte Sortierung
     result["score"] = result["score"].round(4)
 
-    # Balken + Kreisdiagramm
-    # generate_charts erwartet Spaltennamen wie im Original-df
-    # df sollte jetzt kompatibel sein.
-    bar_chart_top10, sorted_cities, pie_chart = generate_charts(df)
-    
-    # Diagramme als base64 kodieren
-    bar_img_top10 = io.BytesIO()
-    bar_chart_top10.savefig(bar_img_top10, format='png', bbox_inches='tight')
-    bar_img_top10.seek(0)
-    bar_encoded_top10 = base64.b64encode(bar_img_top10.getvalue()).decode('utf-8')
-    
-    # Figur schließen, um Speicher freizugeben
-    plt.close(bar_chart_top10)
-    
-    # Finde den minimalen und maximalen Score-Wert für einheitliche Skalierung
-    min_score = sorted_cities['score'].min()
-    max_score = sorted_cities['score'].max()
-    x_min = max(0, min_score - (max_score - min_score) * 0.1)
-    
-    # Generiere weitere Plots für Städtegruppen (bis zu 5 Seiten)
+    # Diagramm-URLs (Parameter-Set + Datenstand in der URL, Rendern erst beim Abruf)
+    chart_params = {'min_age': min_age, 'max_age': max_age, 'w_pop': w_pop, 'w_age': w_age,
+                    'w_income': w_income, 'v': dataset.version}
+
+    # Weitere Balkendiagramme für Städtegruppen (bis zu 5 Seiten)
     more_charts = []
     total_cities = len(sorted_cities)
     max_pages = min(5, (total_cities + 9) // 10)  # Bis zu 5 Seiten oder alle verfügbaren Städte
-    
+
     for page in range(1, max_pages):
         start_idx = page * 10
         end_idx = min(start_idx + 10, total_cities)
         if start_idx < total_cities:
-            # Erstelle Diagramm für diese Gruppe - mit einheitlicher Skalierung
-            page_chart = generate_cities_chart(
-                sorted_cities.iloc[start_idx:end_idx], 
-                start_idx, 
-                x_min=x_min,
-                global_max=max_score
-            )
-            
-            # Als base64 kodieren
-            chart_img = io.BytesIO()
-            page_chart.savefig(chart_img, format='png', bbox_inches='tight')
-            chart_img.seek(0)
-            chart_encoded = base64.b64encode(chart_img.getvalue()).decode('utf-8')
-            
-            # Figur schließen, um Speicher freizugeben
-            plt.close(page_chart)
-            
-            # Zum Ergebnis hinzufügen
             more_charts.append({
                 'start': start_idx + 1,
                 'end': end_idx,
-                'chart': chart_encoded
+                'url': url_for('chart', chart_name='cities.png', page=page, **chart_params)
             })
-    
-    pie_img = io.BytesIO()
-    pie_chart.savefig(pie_img, format='png', bbox_inches='tight')
-    pie_img.seek(0)
-    pie_encoded = base64.b64encode(pie_img.getvalue()).decode('utf-8')
-    
-    # Figur schließen, um Speicher freizugeben
-    plt.close(pie_chart)
 
     # Extrahiere die Daten für die Frontend-Verarbeitung
     cities_data_for_charts = sorted_cities[['location_name', 'score']].copy()
@@ -1095,77 +1078,43 @@ def process_data(min_age, max_age, w_pop, w_age, w_income):
     # df enthält jetzt die kombinierten Daten aus der DB
     cities_data = df.copy()
     
-    # Erweiterte Analysen
-    # Stellen sicher, dass die benötigten Spalten numerisch sind
-    df_analysis = df.copy()
-    for col in ['total', 'Einkommen_2022', 'target_group_percent', 'score', 'norm_pop', 'norm_income', 'norm_target']:
-        if col in df_analysis.columns:
-            df_analysis[col] = pd.to_numeric(df_analysis[col], errors='coerce').fillna(0)
-        else:
-             print(f"Warnung: Spalte '{col}' für erweiterte Analyse nicht gefunden.")
-             df_analysis[col] = 0 # Fallback
-
-    # 1. Scatter Plot
-    scatter_fig = generate_scatter_plot(df_analysis)
-    scatter_encoded = encode_figure_to_base64(scatter_fig)
-    plt.close(scatter_fig)
-    
-    # 1b. Interaktiver Scatter Plot mit Plotly
-    interactive_scatter = generate_interactive_scatter_plot(df_analysis)
-    
-    # 2. Clustering-Analyse (Einwohner vs. Einkommen)
-    cluster_fig, cluster_summary = perform_clustering(df_analysis, n_clusters=5)
-    cluster_encoded = encode_figure_to_base64(cluster_fig)
-    plt.close(cluster_fig)
-    
-    cluster_table = cluster_summary.to_html(
+    # Cluster-Tabellen (ohne Rendern der Diagramme)
+    cluster_table = summarize_clustering(state.df_analysis, state.clustering_income).to_html(
         classes='table table-striped table-hover',
         index=False,
         justify='left',
         table_id='cluster-table'
     )
     
-    # 2b. Interaktives Clustering mit Plotly (mit 5 Clustern)
-    interactive_clustering = generate_interactive_clustering(df_analysis, n_clusters=5)
-    
-    # 3. Clustering-Analyse (Einwohner vs. Zielgruppe)
-    cluster2_fig, cluster2_summary = perform_clustering_population_target(df_analysis, n_clusters=5)
-    cluster2_encoded = encode_figure_to_base64(cluster2_fig)
-    plt.close(cluster2_fig)
-    
-    cluster2_table = cluster2_summary.to_html(
+    cluster2_table = summarize_clustering_population_target(state.df_analysis, state.clustering_target).to_html(
         classes='table table-striped table-hover',
         index=False,
         justify='left',
         table_id='cluster2-table'
     )
     
-    # 3b. Interaktives Clustering 2 mit Plotly (Einwohner vs. Zielgruppe, mit 5 Clustern)
-    interactive_clustering2 = generate_interactive_clustering_population_target(df_analysis, n_clusters=5)
-    
     # NaN-Werte durch None ersetzen, um gültiges JSON zu gewährleisten
-    # Verwende df_analysis oder df, je nachdem, was die vollständigen Daten enthält
-    cities_data_records = df_analysis.replace({np.nan: None}).to_dict(orient='records')
+    cities_data_records = state.df_analysis.replace({np.nan: None}).to_dict(orient='records')
     
     return {
         'table_html': table_html,
-        'bar_chart_top10': bar_encoded_top10,
+        'bar_chart_top10_url': url_for('chart', chart_name='top10.png', **chart_params),
         'more_charts': more_charts,
         'cities_for_charts': cities_data_for_charts,
-        'pie_chart': pie_encoded,
+        'pie_chart_url': url_for('chart', chart_name='pie.png', **chart_params),
         'advanced_analysis': {
-            'scatter_plot': scatter_encoded,
-            'interactive_scatter': interactive_scatter,
+            'scatter_plot_url': url_for('chart', chart_name='scatter.png', **chart_params),
+            'interactive_scatter_url': url_for('chart', chart_name='interactive_scatter.json', **chart_params),
             'clustering': {
-                'plot': cluster_encoded,
+                'plot_url': url_for('chart', chart_name='clustering.png', **chart_params),
                 'table': cluster_table
             },
-            'interactive_clustering': interactive_clustering,
+            'interactive_clustering_url': url_for('chart', chart_name='interactive_clustering.json', **chart_params),
             'clustering2': {
-                'plot': cluster2_encoded,
+                'plot_url': url_for('chart', chart_name='clustering2.png', **chart_params),
                 'table': cluster2_table
             },
-            'interactive_clustering2': interactive_clustering2
+            'interactive_clustering2_url': url_for('chart', chart_name='interactive_clustering2.json', **chart_params)
         },
         'cities_data': cities_data_records
     }
@@ -1215,57 +1164,21 @@ def update_display_names():
 @app.route('/city_chart/<int:city_id>', methods=['GET']) # Verwende city_id als Integer
 def city_chart(city_id):
     """Generiert ein Kreisdiagramm für eine bestimmte Stadt aus der Datenbank"""
-    conn = None
     try:
-        conn = get_db() # Verbindung zur data.db
-        cursor = conn.cursor()
-
-        # Finde das aktuellste Jahr
-        cursor.execute("SELECT MAX(year) FROM demographics")
-        latest_year = cursor.fetchone()[0]
-        if not latest_year:
-            return jsonify({'error': 'Keine Demografie-Daten gefunden'}), 500
+        # Stadtdaten inkl. Altersspalten aus dem Städtedatensatz-Cache holen
+        dataset = get_city_dataset()
+        city_df = dataset.df[dataset.df['city_id'] == city_id].copy()
 
-        # Lade die benötigten Daten für die spezifische Stadt
-        query_main = f"""
-            SELECT
-                c.city_id,
-                c.name AS location_name,
-                d.total_population AS total
-            FROM city c
-            JOIN demographics d ON c.city_id = d.city_id
-            WHERE c.city_id = ? AND d.year = ?
-        """
-        city_main_data = pd.read_sql_query(query_main, conn, params=(city_id, latest_year))
-
-        if city_main_data.empty:
+        if city_df.empty:
             return jsonify({'error': 'Stadt nicht gefunden oder keine Demografiedaten für das Jahr'}), 404
 
-        # Lade Altersverteilungsdaten für die Stadt
-        query_age = f"""
-            SELECT
-                ag.label AS age_group_label,
-                dad.count
-            FROM demo_age_dist dad
-            JOIN demographics d ON dad.demography_id = d.demography_id
-            JOIN age_group ag ON dad.age_group_id = ag.age_group_id
-            WHERE d.city_id = ? AND d.year = ?
-        """
-        df_age_dist = pd.read_sql_query(query_age, conn, params=(city_id, latest_year))
-
-        # Erstelle einen DataFrame für diese eine Stadt mit den Altersspalten
-        city_df = city_main_data.copy()
-        for _, row in df_age_dist.iterrows():
-            city_df[row['age_group_label']] = row['count']
-        city_df = city_df.fillna(0)
-
         # Aktuelle Parameter für Zielgruppe holen (aus Request oder Standard)
         min_age = int(request.args.get('min_age', 18))
         max_age = int(request.args.get('max_age', 35))
 
         # Zielgruppe für diese Stadt berechnen
         # calculate_target_group erwartet einen DataFrame, also übergeben wir city_df
-        city_data_processed = calculate_target_group(city_df, min_age, max_age)
+        city_data_processed = calculate_target_group(city_df, min_age, max_age, engine=dataset.target_engine)
 
         if city_data_processed.empty:
              return jsonify({'error': 'Fehler bei der Zielgruppenberechnung für die Stadt'}), 500
@@ -1280,14 +1193,9 @@ def city_chart(city_id):
              # Fallback oder Fehlermeldung
              return jsonify({'error': 'Daten für Kreisdiagramm unvollständig'}), 500
 
-        # Kreisdiagramm erstellen
-        pie_chart = generate_city_pie_chart(city_row)
-        
-        # Als base64 kodieren
-        pie_encoded = encode_figure_to_base64(pie_chart)
-        
-        # Figur schließen, um Speicher freizugeben
-        plt.close(pie_chart)
+        # Kreisdiagramm im Render-Pool erstellen und als base64 kodieren
+        pie_png = chart_renderer.render('pie', city_row)
+        pie_encoded = base64.b64encode(pie_png).decode('utf-8')
         
         return jsonify({
             'pie_chart': pie_encoded,
@@ -1301,9 +1209,6 @@ def city_chart(city_id):
         import traceback
         print(f"Allgemeiner Fehler in /city_chart/{city_id}: {traceback.format_exc()}")
         return jsonify({'error': f'Verarbeitungsfehler: {e}'}), 500
-    finally:
-        if conn:
-            conn.close()
 
 @app.route('/process', methods=['POST'])
 def process():
@@ -1316,11 +1221,260 @@ def process():
     
     # Daten verarbeiten
     try:
-        result = process_data(min_age, max_age, w_pop, w_age, w_income)
-        return jsonify(result)
+        try:
+            dataset = get_city_dataset()
+        except sqlite3.Error as e:
+            print(f"Datenbankfehler beim Laden der Daten: {e}")
+            return jsonify({'error': f"Datenbankfehler: {e}"})
+
+        # Gleiche Parameter + gleicher Datenstand -> fertiges JSON aus dem Cache liefern
+        cache_key = analysis_cache_key(min_age, max_age, w_pop, w_age, w_income, dataset.version)
+        cached_payload = process_result_cache.get(cache_key)
+        if cached_payload is not None:
+            return Response(cached_payload, mimetype='application/json')
+
+        result = process_data(min_age, max_age, w_pop, w_age, w_income, dataset=dataset)
+        if 'error' in result:
+            return jsonify(result)
+
+        payload = app.json.dumps(result).encode('utf-8')
+        process_result_cache.put(cache_key, payload)
+        return Response(payload, mimetype='application/json')
     except Exception as e:
         return jsonify({'error': str(e)}), 500
 
+# --- Diagramme auf Abruf (je Diagramm ein GET-Endpunkt mit ETag) ---
+
+chart_cache = ResultCache(
+    max_entries=int(os.environ.get('CHART_CACHE_MAX_ENTRIES', 256)),
+    max_bytes=int(os.environ.get('CHART_CACHE_MAX_MB', 64)) * 1024 * 1024
+)
+
+# Diagramme, die gerade im Render-Pool sind (gleiche Anfragen warten auf dasselbe Future)
+pending_charts = {}
+pending_charts_lock = threading.RLock()
+
+def bar_chart_spec(state, page=0):
+    """Balkendiagramm der Plätze page*10+1 bis page*10+10 (einheitliche Skalierung über alle Seiten)."""
+    sorted_cities = state.sorted_cities
+    min_score = sorted_cities['score'].min()
+    max_score = sorted_cities['score'].max()
+    x_min = max(0, min_score - (max_score - min_score) * 0.1)
+    start_idx = page * 10
+    if start_idx >= len(sorted_cities):
+        return None
+    return 'cities', (sorted_cities.iloc[start_idx:start_idx + 10], start_idx, x_min, max_score)
+
+# Matplotlib-Diagramme: Name -> Spezifikation (Typ, Argumente) für chart_renderer
+PNG_CHART_SPECS = {
+    'top10.png': lambda state, page=0: bar_chart_spec(state, 0),
+    'cities.png': bar_chart_spec,
+    'pie.png': lambda state, page=0: ('pie', (state.sorted_cities.iloc[0],)),
+    'scatter.png': lambda state, page=0: ('scatter', (state.df_analysis,)),
+    'clustering.png': lambda state, page=0: ('clustering', (state.df_analysis.copy(), state.clustering_income)),
+    'clustering2.png': lambda state, page=0: ('clustering2', (state.df_analysis.copy(), state.clustering_target)),
+}
+
+# Plotly-Figuren (ohne pyplot, werden direkt im Request-Thread erzeugt)
+JSON_CHART_RENDERERS = {
+    'interactive_scatter.json': lambda state: generate_interactive_scatter_plot(state.df_analysis.copy()),
+    'interactive_clustering.json': lambda state: json.dumps(generate_interactive_clustering(
+        state.df_analysis.copy(), n_clusters=5, clustering=state.clustering_income)),
+    'interactive_clustering2.json': lambda state: json.dumps(generate_interactive_clustering_population_target(
+        state.df_analysis.copy(), n_clusters=5, clustering=state.clustering_target)),
+}
+
+def _chart_rendered(cache_key, future):
+    with pending_charts_lock:
+        pending_charts.pop(cache_key, None)
+    if not future.cancelled() and future.exception() is None:
+        chart_cache.put(cache_key, future.result())
+
+def submit_chart(cache_key, spec):
+    """Gibt ein Diagramm an den Render-Pool (falls es nicht schon gerendert wird) und liefert das Future."""
+    with pending_charts_lock:
+        future = pending_charts.get(cache_key)
+        if future is None:
+            chart_type, args = spec
+            future = chart_renderer.submit(chart_type, *args)
+            pending_charts[cache_key] = future
+            future.add_done_callback(lambda f: _chart_rendered(cache_key, f))
+        return future
+
+def render_chart(cache_key, spec):
+    """Wartet auf die PNG-Bytes eines Diagramms aus dem Render-Pool."""
+    try:
+        return submit_chart(cache_key, spec).result(timeout=chart_renderer.RENDER_TIMEOUT)
+    except BrokenProcessPool:
+        chart_type, args = spec
+        return chart_renderer.render(chart_type, *args)
+
+@app.route('/charts/<chart_name>', methods=['GET'])
+def chart(chart_name):
+    """
+    Rendert ein einzelnes Diagramm für ein Parameter-Set (min_age, max_age, w_pop, w_age, w_income).
+
+    Das Ergebnis wird gecacht und mit ETag ausgeliefert; bei passendem If-None-Match folgt 304.
+    """
+    if chart_name not in PNG_CHART_SPECS and chart_name not in JSON_CHART_RENDERERS:
+        return jsonify({'error': f'Unbekanntes Diagramm: {chart_name}'}), 404
+
+    try:
+        min_age = int(request.args.get('min_age', 18))
+        max_age = int(request.args.get('max_age', 35))
+        w_pop = float(request.args.get('w_pop', 0.3))
+        w_age = float(request.args.get('w_age', 0.5))
+        w_income = float(request.args.get('w_income', 0.2))
+        page = int(request.args.get('page', 0))
+    except ValueError as e:
+        return jsonify({'error': f'Ungültige Parameter: {e}'}), 400
+
+    try:
+        dataset = get_city_dataset()
+        cache_key = analysis_cache_key(min_age, max_age, w_pop, w_age, w_income, dataset.version) + (chart_name, page)
+        etag = hashlib.sha1(repr(cache_key).encode('utf-8')).hexdigest()
+
+        # Der Browser hat das Diagramm bereits -> nichts rendern
+        if etag in request.if_none_match:
+            response = Response(status=304)
+        else:
+            content = chart_cache.get(cache_key)
+            if content is None:
+                state = get_analysis_state(min_age, max_age, w_pop, w_age, w_income, dataset)
+                if isinstance(state, dict):
+                    return jsonify(state), 500
+                if chart_name in PNG_CHART_SPECS:
+                    spec = PNG_CHART_SPECS[chart_name](state, page)
+                    if spec is None:
+                        return jsonify({'error': 'Keine Daten für dieses Diagramm'}), 404
+                    # Rendern in einem separaten Prozess; blockiert keine anderen Requests
+                    content = render_chart(cache_key, spec)
+                else:
+                    content = JSON_CHART_RENDERERS[chart_name](state)
+                    chart_cache.put(cache_key, content)
+            mimetype = 'image/png' if chart_name in PNG_CHART_SPECS else 'application/json'
+            response = Response(content, mimetype=mimetype)
+
+        response.set_etag(etag)
+        response.headers['Cache-Control'] = 'private, max-age=3600'
+        return response
+    except sqlite3.Error as e:
+        print(f"DB Fehler in /charts/{chart_name}: {e}")
+        return jsonify({'error': f'Datenbankfehler: {e}'}), 500
+    except Exception as e:
+        print(f"Fehler beim Rendern von {chart_name}: {e}")
+        return jsonify({'error': str(e)}), 500
+
+@app.route('/score_presets', methods=['POST'])
+def score_presets():
+    """
+    Berechnet Scores und Ränge für mehrere Gewichtungen in einem Aufruf (Vorschau für Presets).
+
+    Erwartet JSON: {"min_age": 18, "max_age": 35, "weights": [[w_pop, w_age, w_income], ...]}
+    """
+    try:
+        data = request.get_json() or {}
+        min_age = int(data.get('min_age', 18))
+        max_age = int(data.get('max_age', 35))
+        weights = np.asarray(data.get('weights') or [[0.3, 0.5, 0.2]], dtype=float)
+        if weights.ndim != 2 or weights.shape[1] != 3:
+            return jsonify({'error': 'weights muss eine Liste von [w_pop, w_age, w_income] sein'}), 400
+
+        dataset = get_city_dataset()
+        df = calculate_target_group(dataset.df, min_age, max_age, engine=dataset.target_engine)
+
+        # Eine Matrixmultiplikation für alle Gewichtungen (Gewichtungen × Städte)
+        scores = score_matrix(feature_matrix(df), weights)
+        ranks = rank_scores(scores)
+
+        return jsonify({
+            'city_ids': df['city_id'].tolist(),
+            'names': df['simplified_name'].tolist(),
+            'weights': normalize_weights(weights).round(6).tolist(),
+            'scores': scores.round(4).tolist(),
+            'ranks': ranks.tolist()
+        })
+    except sqlite3.Error as e:
+        print(f"DB Fehler in /score_presets: {e}")
+        return jsonify({'error': f'Datenbankfehler: {e}'}), 500
+    except (TypeError, ValueError) as e:
+        return jsonify({'error': f'Ungültige Parameter: {e}'}), 400
+    except Exception as e:
+        return jsonify({'error': str(e)}), 500
+
+# Obergrenze für die Anzahl Parameter-Sets pro Sweep (Altersbereiche × Gewichtungen)
+SCORE_SWEEP_MAX_SETS = int(os.environ.get('SCORE_SWEEP_MAX_SETS', 250000))
+
+@app.route('/score_sweep', methods=['POST'])
+def score_sweep():
+    """
+    Sensitivitätsanalyse: Scores und Ränge aller Städte für ein Raster aus Altersbereichen
+    und Gewichtungen, gestreamt als NDJSON (eine JSON-Zeile pro Parameter-Set).
+
+    Erwartet JSON mit
+        age_ranges: [[min_age, max_age], ...] oder age_grid: {"start": 16, "stop": 70, "step": 5}
+        weights: [[w_pop, w_age, w_income], ...] oder weight_step: 0.1
+        top_n: Grenze für den Top-N-Anteil in der Stabilitätsstatistik (Standard: 10)
+
+    Die erste Zeile enthält die Städte (type 'meta'), danach folgt je Parameter-Set eine Zeile
+    (type 'result'), zum Schluss die Rangstabilität je Stadt (type 'stability').
+    """
+    try:
+        data = request.get_json() or {}
+        if 'age_grid' in data:
+            grid = data['age_grid']
+            bounds = list(range(int(grid.get('start', 18)), int(grid.get('stop', 65)) + 1, int(grid.get('step', 5))))
+            age_ranges = [(a, b) for a in bounds for b in bounds if a <= b]
+        else:
+            age_ranges = [(int(a), int(b)) for a, b in data.get('age_ranges') or [[18, 35]]]
+        if 'weight_step' in data:
+            weights = weight_simplex_grid(float(data['weight_step']))
+        else:
+            weights = [tuple(float(w) for w in row) for row in data.get('weights') or [[0.3, 0.5, 0.2]]]
+        if any(len(row) != 3 for row in weights):
+            return jsonify({'error': 'weights muss eine Liste von [w_pop, w_age, w_income] sein'}), 400
+        top_n = int(data.get('top_n', 10))
+    except (TypeError, ValueError, ZeroDivisionError, AttributeError) as e:
+        return jsonify({'error': f'Ungültige Parameter: {e}'}), 400
+
+    n_sets = len(age_ranges) * len(weights)
+    if n_sets == 0:
+        return jsonify({'error': 'Keine Parameter-Sets angegeben'}), 400
+    if n_sets > SCORE_SWEEP_MAX_SETS:
+        return jsonify({'error': f'Zu viele Parameter-Sets ({n_sets}, maximal {SCORE_SWEEP_MAX_SETS})'}), 400
+
+    try:
+        dataset = get_city_dataset()
+    except sqlite3.Error as e:
+        print(f"DB Fehler in /score_sweep: {e}")
+        return jsonify({'error': f'Datenbankfehler: {e}'}), 500
+
+    df = dataset.df
+    city_ids = df['city_id'].tolist()
+
+    def generate():
+        stability = RankStability(len(city_ids), top_n=top_n)
+        yield json.dumps({'type': 'meta', 'city_ids': city_ids,
+                          'names': df['simplified_name'].tolist(), 'parameter_sets': n_sets}) + '\n'
+        try:
+            for min_age, max_age, norm_weights, scores, ranks in sweep_scores(dataset.target_engine, df, age_ranges, weights):
+                stability.update(ranks)
+                for k in range(len(norm_weights)):
+                    yield json.dumps({
+                        'type': 'result',
+                        'min_age': min_age,
+                        'max_age': max_age,
+                        'weights': norm_weights[k].round(6).tolist(),
+                        'scores': scores[k].round(4).tolist(),
+                        'ranks': ranks[k].tolist()
+                    }) + '\n'
+            yield json.dumps(dict(stability.summary(), type='stability', city_ids=city_ids)) + '\n'
+        except Exception as e:
+            print(f"Fehler in /score_sweep: {e}")
+            yield json.dumps({'type': 'error', 'error': str(e)}) + '\n'
+
+    return Response(stream_with_context(generate()), mimetype='application/x-ndjson')
+
 @app.route('/interactive_scatter', methods=['GET'])
 def interactive_scatter():
     """Stellt die interaktive Scatter-Plot-Seite bereit"""
@@ -1356,56 +1510,18 @@ def filtered_clustering():
         selected_clusters = request.form.getlist('selected_clusters[]')
         selected_clusters = [int(cluster) for cluster in selected_clusters]
         
-        # --- Daten aus DB laden (ähnlich wie in process_data) ---
-        conn = None
+        # --- Daten aus dem Städtedatensatz-Cache laden ---
         try:
-            conn = get_db() 
-            cursor = conn.cursor()
-            cursor.execute("SELECT MAX(year) FROM demographics")
-            latest_year = cursor.fetchone()[0]
-            if not latest_year:
-                raise ValueError("Keine Demografie-Daten.")
-
-            query_main = f"""
-                SELECT c.city_id, c.name AS location_name, c.simplified_name,
-                       c.bundesland AS Land, d.total_population AS total,
-                       d.income AS Einkommen_{latest_year}
-                FROM city c JOIN demographics d ON c.city_id = d.city_id
-                WHERE d.year = ?
-            """
-            df_main = pd.read_sql_query(query_main, conn, params=(latest_year,))
-
-            query_age = f"""
-                SELECT d.city_id, ag.label AS age_group_label, dad.count
-                FROM demo_age_dist dad
-                JOIN demographics d ON dad.demography_id = d.demography_id
-                JOIN age_group ag ON dad.age_group_id = ag.age_group_id
-                WHERE d.year = ?
-            """
-            df_age_dist = pd.read_sql_query(query_age, conn, params=(latest_year,))
-            df_age_pivot = df_age_dist.pivot(index='city_id', columns='age_group_label', values='count').reset_index().fillna(0)
-            df = pd.merge(df_main, df_age_pivot, on='city_id', how='left')
-            
-            if f'Einkommen_{latest_year}' in df.columns and 'Einkommen_2022' not in df.columns:
-                df = df.rename(columns={f'Einkommen_{latest_year}': 'Einkommen_2022'})
-            elif 'Einkommen_2022' not in df.columns:
-                df['Einkommen_2022'] = 0
-                
-            if 'simplified_name' not in df.columns:
-                 df['simplified_name'] = df['location_name']
-            df['simplified_name'] = df['simplified_name'].fillna(df['location_name'])
-                 
+            dataset = get_city_dataset()
+            df = dataset.df.drop(columns=EXPORT_ONLY_COLUMNS)
         except sqlite3.Error as e:
             print(f"DB Fehler in filtered_clustering: {e}")
             return jsonify({'error': f'Datenbankfehler: {e}'}), 500
-        finally:
-            if conn:
-                conn.close()
         # --- Ende Datenladen aus DB ---
 
         # Zielgruppe berechnen
         try:
-            df = calculate_target_group(df, min_age, max_age)
+            df = calculate_target_group(df, min_age, max_age, engine=dataset.target_engine)
         except Exception as e:
             print(f"Fehler calculate_target_group in filtered_clustering: {e}")
             return jsonify({'error': f'Fehler Zielgruppenberechnung: {e}'}), 500
@@ -1416,19 +1532,7 @@ def filtered_clustering():
                 df[col] = 0
             df[col] = pd.to_numeric(df[col], errors='coerce').fillna(0)
 
-        total_min, total_max = df["total"].min(), df["total"].max()
-        income_min, income_max = df["Einkommen_2022"].min(), df["Einkommen_2022"].max()
-        target_min, target_max = df["target_group_percent"].min(), df["target_group_percent"].max()
-        
-        df["norm_pop"] = df["total"].apply(lambda x: normalize(x, total_min, total_max) if total_max > total_min else 0)
-        df["norm_income"] = df["Einkommen_2022"].apply(lambda x: normalize(x, income_min, income_max) if income_max > income_min else 0)
-        df["norm_target"] = df["target_group_percent"].apply(lambda x: normalize(x, target_min, target_max) if target_max > target_min else 0)
-        
-        total_weight_norm = w_pop + w_age + w_income
-        w_pop_norm = w_pop / total_weight_norm
-        w_age_norm = w_age / total_weight_norm
-        w_income_norm = w_income / total_weight_norm
-        df["score"] = df["norm_pop"] * w_pop_norm + df["norm_income"] * w_income_norm + df["norm_target"] * w_age_norm
+        df = apply_scores(df, w_pop, w_age, w_income)
         
         # Clustering mit gefilterten Daten durchführen
         # Wichtig: generate_filtered_clustering ist in utils.py definiert
@@ -1456,56 +1560,18 @@ def filtered_clustering2():
         selected_clusters = request.form.getlist('selected_clusters[]')
         selected_clusters = [int(cluster) for cluster in selected_clusters]
         
-        # --- Daten aus DB laden (Code wie oben) ---
-        conn = None
+        # --- Daten aus dem Städtedatensatz-Cache laden ---
         try:
-            conn = get_db()
-            cursor = conn.cursor()
-            cursor.execute("SELECT MAX(year) FROM demographics")
-            latest_year = cursor.fetchone()[0]
-            if not latest_year:
-                raise ValueError("Keine Demografie-Daten.")
-
-            query_main = f"""
-                SELECT c.city_id, c.name AS location_name, c.simplified_name,
-                       c.bundesland AS Land, d.total_population AS total,
-                       d.income AS Einkommen_{latest_year}
-                FROM city c JOIN demographics d ON c.city_id = d.city_id
-                WHERE d.year = ?
-            """
-            df_main = pd.read_sql_query(query_main, conn, params=(latest_year,))
-
-            query_age = f"""
-                SELECT d.city_id, ag.label AS age_group_label, dad.count
-                FROM demo_age_dist dad
-                JOIN demographics d ON dad.demography_id = d.demography_id
-                JOIN age_group ag ON dad.age_group_id = ag.age_group_id
-                WHERE d.year = ?
-            """
-            df_age_dist = pd.read_sql_query(query_age, conn, params=(latest_year,))
-            df_age_pivot = df_age_dist.pivot(index='city_id', columns='age_group_label', values='count').reset_index().fillna(0)
-            df = pd.merge(df_main, df_age_pivot, on='city_id', how='left')
-            
-            if f'Einkommen_{latest_year}' in df.columns and 'Einkommen_2022' not in df.columns:
-                df = df.rename(columns={f'Einkommen_{latest_year}': 'Einkommen_2022'})
-            elif 'Einkommen_2022' not in df.columns:
-                df['Einkommen_2022'] = 0
-                
-            if 'simplified_name' not in df.columns:
-                 df['simplified_name'] = df['location_name']
-            df['simplified_name'] = df['simplified_name'].fillna(df['location_name'])
-
+            dataset = get_city_dataset()
+            df = dataset.df.drop(columns=EXPORT_ONLY_COLUMNS)
         except sqlite3.Error as e:
             print(f"DB Fehler in filtered_clustering2: {e}")
             return jsonify({'error': f'Datenbankfehler: {e}'}), 500
-        finally:
-            if conn:
-                conn.close()
         # --- Ende Datenladen aus DB ---
         
         # Zielgruppe berechnen
         try:
-            df = calculate_target_group(df, min_age, max_age)
+            df = calculate_target_group(df, min_age, max_age, engine=dataset.target_engine)
         except Exception as e:
              print(f"Fehler calculate_target_group in filtered_clustering2: {e}")
              return jsonify({'error': f'Fehler Zielgruppenberechnung: {e}'}), 500
@@ -1516,19 +1582,7 @@ def filtered_clustering2():
                 df[col] = 0
             df[col] = pd.to_numeric(df[col], errors='coerce').fillna(0)
             
-        total_min, total_max = df["total"].min(), df["total"].max()
-        income_min, income_max = df["Einkommen_2022"].min(), df["Einkommen_2022"].max()
-        target_min, target_max = df["target_group_percent"].min(), df["target_group_percent"].max()
-
-        df["norm_pop"] = df["total"].apply(lambda x: normalize(x, total_min, total_max) if total_max > total_min else 0)
-        df["norm_income"] = df["Einkommen_2022"].apply(lambda x: normalize(x, income_min, income_max) if income_max > income_min else 0)
-        df["norm_target"] = df["target_group_percent"].apply(lambda x: normalize(x, target_min, target_max) if target_max > target_min else 0)
-        
-        total_weight_norm = w_pop + w_age + w_income
-        w_pop_norm = w_pop / total_weight_norm
-        w_age_norm = w_age / total_weight_norm
-        w_income_norm = w_income / total_weight_norm
-        df["score"] = df["norm_pop"] * w_pop_norm + df["norm_income"] * w_income_norm + df["norm_target"] * w_age_norm
+        df = apply_scores(df, w_pop, w_age, w_income)
         
         # Clustering mit gefilterten Daten durchführen 
         # Diese Hilfsfunktion ist direkt hier in app.py definiert
@@ -1543,7 +1597,7 @@ def filtered_clustering2():
 
 
 # --- Hilfsfunktion für gefiltertes Clustering 2 (bleibt in app.py) ---
-def generate_filtered_clustering_population_target(df, n_clusters=5, selected_clusters=None):
+def generate_filtered_clustering_population_target(df, n_clusters=5, selected_clusters=None, clustering=None):
     """
     Erstellt ein interaktives Clustering für Einwohner vs. Zielgruppe mit Plotly, 
     zeigt aber nur die ausgewählten Cluster an
@@ -1552,6 +1606,7 @@ def generate_filtered_clustering_population_target(df, n_clusters=5, selected_cl
         df: DataFrame mit den Daten
         n_clusters: Anzahl der Cluster (Standard: 5)
         selected_clusters: Liste der Cluster-Indizes, die angezeigt werden sollen (0-4)
+        clustering: Optional bereits berechnetes ClusteringResult (siehe fit_clustering_population_target)
     
     Returns:
         Dictionary mit Plotly-JSON und HTML-Tabelle für die Statistiken
@@ -1559,59 +1614,20 @@ def generate_filtered_clustering_population_target(df, n_clusters=5, selected_cl
     if selected_clusters is None:
         selected_clusters = list(range(n_clusters))  # Standardmäßig alle Cluster anzeigen
     
-    # Feature-Auswahl - nur Einwohnerzahl und Zielgruppenanteil
-    features = df[['total', 'target_group_percent']].copy()
-    
-    # Skalierung der Daten
-    scaler = StandardScaler()
-    scaled_features = scaler.fit_transform(features)
-    
-    # K-Means Clustering
-    kmeans = KMeans(n_clusters=n_clusters, random_state=42)
-    # Wichtig: Hier den originalen DataFrame verwenden für die Zuordnung!
-    # df_clustered = df.copy() # Nicht nötig, wir fügen zu df hinzu
-    
-    # Cluster-Zuweisungen basierend auf K-Means
-    raw_clusters = kmeans.fit_predict(scaled_features)
-    
-    # Zentren berechnen
-    centers = scaler.inverse_transform(kmeans.cluster_centers_)
-    
-    # Zuordnung der Cluster zu den Interpretationen basierend auf ihren Charakteristika
-    cluster_mapping = {}
-    
-    # Finde den Cluster mit den höchsten Bevölkerungszahlen -> Großstädte
-    cluster_mapping[np.argmax([center[0] for center in centers])] = 1  # Blau
-    
-    # Finde den Cluster mit dem höchsten Zielgruppenanteil -> Große Universitätsstädte
-    cluster_mapping[np.argmax([center[1] for center in centers])] = 3  # Lila
-    
-    # Finde den Cluster mit dem niedrigsten Zielgruppenanteil -> Städte mit geringem Zielgruppenanteil
-    cluster_mapping[np.argmin([center[1] for center in centers])] = 2  # Grün
-    
-    # Finde den Cluster mit den wenigsten Einwohnern und mittlerem/hohem Zielgruppenanteil -> Kleinere Universitätsstädte
-    remaining = [i for i in range(n_clusters) if i not in cluster_mapping.keys()]
-    if len(remaining) >= 2:
-        pop_sorted = sorted(remaining, key=lambda i: centers[i][0])
-        target_sorted = sorted(pop_sorted, key=lambda i: centers[i][1], reverse=True)
-        cluster_mapping[target_sorted[0]] = 4  # Orange
-        for i in target_sorted[1:]:
-            if i not in cluster_mapping:
-                cluster_mapping[i] = 0  # Rot
-    else:
-        for i in remaining:
-            cluster_mapping[i] = 0  # Rot
+    if clustering is None:
+        clustering = fit_clustering_population_target(df, n_clusters)
+    centers = clustering.centers
     
     # Remapping der Cluster-Zuweisungen zum DataFrame hinzufügen
-    df['cluster'] = [cluster_mapping[c] for c in raw_clusters]
+    df['cluster'] = clustering.labels
     
     # Formatierung für Hover-Text
     # Sicherstellen, dass Einkommen vorhanden ist
     if 'Einkommen_2022' not in df.columns:
         df['Einkommen_2022'] = 0 # Fallback
         
-    df['formatted_total'] = df['total'].apply(lambda x: f"{int(x):,}".replace(",", "."))
-    df['formatted_income'] = df['Einkommen_2022'].apply(lambda x: f"{int(x):,}".replace(",", "."))
+    df['formatted_total'] = format_thousands(df['total'])
+    df['formatted_income'] = format_thousands(df['Einkommen_2022'])
     df['target_percent_display'] = (df['target_group_percent'] * 100).round(1).astype(str) + "%"
     
     # Filtere auf die ausgewählten Cluster
@@ -1739,7 +1755,7 @@ def generate_filtered_clustering_population_target(df, n_clusters=5, selected_cl
     centers_df = pd.DataFrame({
         'total': [centers[i][0] for i in range(n_clusters)],
         'target_group_percent': [centers[i][1] for i in range(n_clusters)],
-        'cluster_name': [f'Zentrum C{cluster_mapping[i]+1}' for i in range(n_clusters)] 
+        'cluster_name': clustering.center_labels()
     })
     # Filtere Zentren basierend auf den ausgewählten Clustern
     centers_df_filtered = centers_df[centers_df['cluster_name'].str.contains(f'C[{ "".join(map(str, [c+1 for c in selected_clusters])) }]')]
@@ -1813,104 +1829,25 @@ def export_selected():
         # oder process_data anpassen, damit es optional das DataFrame zurückgibt.
         
         # === Extraktion der Logik aus process_data (vereinfacht) ===
-        conn = None
         try:
-            conn = get_db()
-            cursor = conn.cursor()
-            cursor.execute("SELECT MAX(year) FROM demographics")
-            latest_year = cursor.fetchone()[0]
-            if not latest_year: raise ValueError("Keine Demografie-Daten.")
-
-            query_main = f"""
-                WITH CityEventCounts AS (
-                    -- Zähle Vorkommen jedes Event-Textes pro Stadt
-                    SELECT
-                        pc.city_id,
-                        peg.event_gastro_text,
-                        COUNT(peg.event_gastro_text) AS text_count
-                    FROM postal_code pc
-                    JOIN plz_event_gastro peg ON pc.postal_code_id = peg.postal_code_id
-                    WHERE peg.event_gastro_text IS NOT NULL AND peg.event_gastro_text != ''
-                    GROUP BY pc.city_id, peg.event_gastro_text
-                ),
-                RankedCityEvents AS (
-                    -- Weise jedem Text pro Stadt einen Rang basierend auf der Häufigkeit zu
-                    SELECT
-                        city_id,
-                        event_gastro_text,
-                        ROW_NUMBER() OVER (PARTITION BY city_id ORDER BY text_count DESC, event_gastro_text ASC) AS rn
-                    FROM CityEventCounts
-                )
-                SELECT
-                    c.city_id, c.name AS location_name, c.name, c.region_code, -- c.name doppelt auswählen
-                    c.latitude, c.longitude, c.simplified_name, c.bundesland,
-                    d.total_population AS total,
-                    d.income AS Einkommen_{latest_year},
-                    -- Hole den Text mit Rang 1 (den häufigsten) oder 'N/A'
-                    COALESCE(rce.event_gastro_text, 'N/A') AS event_gastro_text
-                FROM city c
-                JOIN demographics d ON c.city_id = d.city_id
-                LEFT JOIN RankedCityEvents rce ON c.city_id = rce.city_id AND rce.rn = 1 -- Join hinzugefügt
-                WHERE d.year = ?
-            """
-            df_main = pd.read_sql_query(query_main, conn, params=(latest_year,))
-
-            query_age = f""" 
-                SELECT d.city_id, ag.label AS age_group_label, dad.count
-                FROM demo_age_dist dad 
-                JOIN demographics d ON dad.demography_id = d.demography_id 
-                JOIN age_group ag ON dad.age_group_id = ag.age_group_id WHERE d.year = ?
-            """
-            df_age_dist = pd.read_sql_query(query_age, conn, params=(latest_year,))
-            df_age_pivot = df_age_dist.pivot(index='city_id', columns='age_group_label', values='count').reset_index().fillna(0)
-            df = pd.merge(df_main, df_age_pivot, on='city_id', how='left')
-            
-            if f'Einkommen_{latest_year}' in df.columns and 'Einkommen_2022' not in df.columns:
-                 df = df.rename(columns={f'Einkommen_{latest_year}': 'Einkommen_2022'})
-            elif 'Einkommen_2022' not in df.columns: df['Einkommen_2022'] = 0
-            if 'simplified_name' not in df.columns: df['simplified_name'] = df['name']
-            df['simplified_name'] = df['simplified_name'].fillna(df['name'])
-            if 'bundesland' not in df.columns: df['bundesland'] = 'N/A' # Fallback
-            df['bundesland'] = df['bundesland'].fillna('N/A')
+            # Stadtdaten aus dem Städtedatensatz-Cache (enthält auch die Export-Spalten)
+            dataset = get_city_dataset()
+            df = dataset.df.copy()
 
             # Zielgruppe berechnen
-            df = calculate_target_group(df, min_age, max_age)
+            df = calculate_target_group(df, min_age, max_age, engine=dataset.target_engine)
             
             # Normalisierung und Score-Berechnung
             for col in ['total', 'Einkommen_2022', 'target_group_percent']:
                 if col not in df.columns: df[col] = 0
                 df[col] = pd.to_numeric(df[col], errors='coerce').fillna(0)
 
-            total_min, total_max = df["total"].min(), df["total"].max()
-            income_min, income_max = df["Einkommen_2022"].min(), df["Einkommen_2022"].max()
-            target_min, target_max = df["target_group_percent"].min(), df["target_group_percent"].max()
-            df["norm_pop"] = df["total"].apply(lambda x: normalize(x, total_min, total_max) if total_max > total_min else 0)
-            df["norm_income"] = df["Einkommen_2022"].apply(lambda x: normalize(x, income_min, income_max) if income_max > income_min else 0)
-            df["norm_target"] = df["target_group_percent"].apply(lambda x: normalize(x, target_min, target_max) if target_max > target_min else 0)
+            df = apply_scores(df, w_pop, w_age, w_income)
             
-            total_weight_norm = w_pop + w_age + w_income
-            if total_weight_norm == 0: total_weight_norm = 1 # Verhindere Division durch 0
-            w_pop_norm = w_pop / total_weight_norm
-            w_age_norm = w_age / total_weight_norm
-            w_income_norm = w_income / total_weight_norm
-            df["score"] = df["norm_pop"] * w_pop_norm + df["norm_income"] * w_income_norm + df["norm_target"] * w_age_norm
-            
-            # Clustering durchführen (vereinfacht, nur zur Namensfindung)
-            features_for_clustering = df[['total', 'Einkommen_2022', 'target_group_percent']].fillna(0)
-            scaler = StandardScaler()
-            scaled_features = scaler.fit_transform(features_for_clustering)
-            kmeans = KMeans(n_clusters=5, random_state=42)
-            raw_clusters = kmeans.fit_predict(scaled_features)
-            centers = scaler.inverse_transform(kmeans.cluster_centers_)
-            cluster_mapping = {}
-            cluster_mapping[np.argmax([center[0] for center in centers])] = 1
-            cluster_mapping[np.argmax([center[2] for center in centers])] = 3
-            cluster_mapping[np.argmax([center[1] for center in centers])] = 4
-            cluster_mapping[np.argmin([center[1] for center in centers])] = 2
-            for i in range(5): 
-                if i not in cluster_mapping: cluster_mapping[i] = 0
+            # Clustering durchführen (nur zur Namensfindung)
+            clustering = fit_clustering(df, n_clusters=5)
             cluster_names = {0: "Mittelstädte", 1: "Großstädte", 2: "Ländliche Regionen", 3: "Universitätsstädte", 4: "Wohlhabende Mittelstädte"}
-            df['cluster_id'] = [cluster_mapping[c] for c in raw_clusters]
+            df['cluster_id'] = clustering.labels
             df['cluster_name'] = df['cluster_id'].map(cluster_names)
             
         except sqlite3.Error as e:
@@ -1920,8 +1857,6 @@ def export_selected():
              import traceback
              print(f"Allgemeiner Fehler in /export_selected Datenaufbereitung: {traceback.format_exc()}")
              return jsonify({'error': f'Fehler bei Datenaufbereitung: {e}'}), 500
-        finally:
-            if conn: conn.close()
         # === Ende Datenaufbereitung ===
 
 
@@ -2044,24 +1979,28 @@ def live_search(stadt_search_name, suchbegriff):
     # Hole simplified_name und Koordinaten aus der Datenbank
     city_latitude = None
     city_longitude = None
+    city_id = None
+    search_hints = {}
     try:
         db = get_db()
         cursor = db.cursor()
         cursor.execute(
-            "SELECT simplified_name, latitude, longitude FROM city WHERE simplified_name = ? OR name = ?",
+            "SELECT city_id, simplified_name, latitude, longitude FROM city WHERE simplified_name = ? OR name = ?",
             (stadt_search_name, stadt_search_name)
         )
         city_data = cursor.fetchone()
-        db.close()
 
         if city_data and city_data['simplified_name']:
             city_simplified_name = city_data['simplified_name']
-            city_latitude = city_data.get('latitude')
-            city_longitude = city_data.get('longitude')
+            city_latitude = city_data['latitude']
+            city_longitude = city_data['longitude']
+            city_id = city_data['city_id']
+            search_hints = load_search_hints(db, city_id)
         else:
             # Fallback: verwende den übergebenen Namen
             city_simplified_name = stadt_search_name
             print(f"Warnung: Kein simplified_name für '{stadt_search_name}' gefunden, verwende Original-Namen")
+        db.close()
 
     except Exception as e:
         print(f"Fehler beim Laden des simplified_name für {stadt_search_name}: {e}")
@@ -2074,13 +2013,25 @@ def live_search(stadt_search_name, suchbegriff):
         print(f"Mit Koordinaten: lat={city_latitude}, lon={city_longitude}")
 
     # --- API Aufruf ---
-    search_result_api = fetch_google_maps_data(API_KEY, query, latitude=city_latitude, longitude=city_longitude)
+    search_result_api = fetch_google_maps_data(
+        API_KEY, query, latitude=city_latitude, longitude=city_longitude,
+        bias_first=search_hints.get(city_id, False)
+    )
 
     if "error" in search_result_api:
         status_code = search_result_api.get('status_code', 500)
         return jsonify({'error': search_result_api.get('error', 'Unbekannter API Fehler'), 'data': {'places': search_result_api.get('places', [])} }), status_code
 
     places_from_api = search_result_api.get("places", [])
+
+    location_bias_needed = search_result_api.get("location_bias_needed")
+    if city_id is not None and location_bias_needed is not None and search_hints.get(city_id) != location_bias_needed:
+        try:
+            db = get_db()
+            save_search_hints(db, {city_id: location_bias_needed})
+            db.close()
+        except sqlite3.Error as e:
+            print(f"Fehler beim Speichern des Suchhinweises für {stadt_search_name}: {e}")
     
     # Explizit loggen, wenn keine Ergebnisse gefunden wurden
     if len(places_from_api) == 0:
@@ -2192,6 +2143,13 @@ def get_cached_data(stadt_search_name, suchbegriff):
         print(f"Fehler beim Abrufen der Cache-Daten: {e}")
         return jsonify({'error': str(e)}), 500
 
+def start_mass_search_thread(term_name, job_id):
+    """Führt den (von diesem Prozess übernommenen) Suchauftrag in einem Hintergrund-Thread aus."""
+    # Starte die Suche in einem separaten Thread, um den Request nicht zu blockieren
+    thread = threading.Thread(target=run_place_search_for_all_cities, args=(term_name, API_KEY), kwargs={'job_id': job_id})
+    thread.daemon = True # Thread stirbt, wenn Hauptprogramm endet
+    thread.start()
+
 @app.route('/start_search/<term_name>', methods=['POST'])
 def start_search(term_name):
     """Startet die Massensuche für einen gegebenen Suchbegriff im Hintergrund."""
@@ -2199,53 +2157,172 @@ def start_search(term_name):
     if not API_KEY or API_KEY == 'DEIN_API_KEY':
          return jsonify({'error': 'Google Maps API Key nicht konfiguriert.'}), 500
 
-    # Starte die Suche in einem separaten Thread, um den Request nicht zu blockieren
-    import threading
-    thread = threading.Thread(
-        target=run_place_search_for_all_cities, 
-        args=(term_name, API_KEY)
-    )
-    thread.daemon = True # Thread stirbt, wenn Hauptprogramm endet
-    thread.start()
-    
-    return jsonify({'message': f'Suche für "{term_name}" gestartet.'}), 202 # Accepted
+    # Optional: {"incremental": true, "max_age_days": 7} überspringt Städte mit aktuellen Ergebnissen
+    options = request.get_json(silent=True) or {}
+    incremental = bool(options.get('incremental', False))
+    max_age_days = options.get('max_age_days')
+    try:
+        max_age_days = float(max_age_days) if max_age_days is not None else None
+    except (TypeError, ValueError):
+        return jsonify({'error': 'max_age_days muss eine Zahl sein.'}), 400
+
+    # Auftrag direkt anlegen, damit der Client sofort /search_status/<job_id> abonnieren kann.
+    # Pro Suchbegriff darf nur eine Massensuche gleichzeitig laufen (über alle Worker-Prozesse)
+    db = get_db()
+    try:
+        job_id = create_search_job(db, term_name, incremental, max_age_days)
+    except search_jobs.JobConflict:
+        return jsonify({'error': f'Für "{term_name}" läuft bereits eine Suche.'}), 409
+    except (sqlite3.Error, ValueError) as e:
+        app.logger.error(f"Suchauftrag für '{term_name}' konnte nicht angelegt werden: {e}")
+        return jsonify({'error': f'Suche für "{term_name}" konnte nicht gestartet werden: {e}'}), 500
+    finally:
+        db.close()
+
+    start_mass_search_thread(term_name, job_id)
+    return jsonify({'message': f'Suche für "{term_name}" gestartet.', 'job_id': job_id, 'status_url': search_status_url(job_id)}), 202 # Accepted
+
+@app.route('/search_jobs', methods=['GET'])
+def list_search_jobs():
+    """Listet die letzten Suchaufträge mit Fortschritt (Städte je Zustand)."""
+    try:
+        db = get_db()
+        try:
+            jobs = search_jobs.list_jobs(db, limit=request.args.get('limit', 50, type=int))
+        finally:
+            db.close()
+        return jsonify({'jobs': jobs})
+    except Exception as e:
+        print(f"Fehler beim Abrufen der Suchaufträge: {e}")
+        return jsonify({'error': str(e)}), 500
+
+@app.route('/search_jobs/<int:job_id>', methods=['GET'])
+def get_search_job(job_id):
+    """Gibt einen Suchauftrag mit seinen fehlgeschlagenen Städten zurück."""
+    db = get_db()
+    try:
+        job = search_jobs.get_job(db, job_id)
+    finally:
+        db.close()
+    if job is None:
+        return jsonify({'error': f'Suchauftrag #{job_id} nicht gefunden.'}), 404
+    return jsonify(job)
+
+@app.route('/search_jobs/<int:job_id>/resume', methods=['POST'])
+def resume_search_job(job_id):
+    """Setzt einen unterbrochenen, abgebrochenen oder unvollständigen Suchauftrag ab seinem Checkpoint fort."""
+    if not API_KEY or API_KEY == 'DEIN_API_KEY':
+         return jsonify({'error': 'Google Maps API Key nicht konfiguriert.'}), 500
+
+    db = get_db()
+    try:
+        job = search_jobs.get_job(db, job_id)
+        if job is None:
+            return jsonify({'error': f'Suchauftrag #{job_id} nicht gefunden.'}), 404
+        if job['active']:
+            return jsonify({'error': f'Suchauftrag #{job_id} läuft bereits.'}), 409
+        if job['done'] == job['total']:
+            return jsonify({'error': f'Suchauftrag #{job_id} ist bereits vollständig.'}), 409
+        # Atomar übernehmen: von zwei Workern, die gleichzeitig fortsetzen wollen, gewinnt einer
+        if not search_jobs.claim_job(db, job_id):
+            return jsonify({'error': f'Suchauftrag #{job_id} oder eine andere Suche für "{job["term_name"]}" läuft bereits.'}), 409
+    finally:
+        db.close()
+    # Meldungen des vorherigen Laufs (samt DONE) verwerfen, damit Abonnenten den neuen Lauf sehen
+    status_bus.start_run(job_id, f"Suchauftrag #{job_id} wird fortgesetzt ({job['total'] - job['done']} offene Städte).")
+    start_mass_search_thread(job['term_name'], job_id)
+    return jsonify({'message': f'Suchauftrag #{job_id} wird mit {job["total"] - job["done"]} offenen Städten fortgesetzt.', 'job_id': job_id, 'status_url': search_status_url(job_id)}), 202
+
+@app.route('/search_jobs/<int:job_id>/cancel', methods=['POST'])
+def cancel_search_job(job_id):
+    """Bricht einen laufenden Suchauftrag ab; bereits gespeicherte Städte bleiben erledigt."""
+    db = get_db()
+    try:
+        job = search_jobs.get_job(db, job_id)
+        if job is None:
+            return jsonify({'error': f'Suchauftrag #{job_id} nicht gefunden.'}), 404
+        # Läuft er in einem anderen Worker-Prozess, bricht dieser beim nächsten Heartbeat ab
+        result = search_jobs.request_cancel(db, job_id)
+        if result == 'requested':
+            return jsonify({'message': f'Abbruch von Suchauftrag #{job_id} angefordert.'}), 202
+        if result is None:
+            return jsonify({'error': f'Suchauftrag #{job_id} ist bereits beendet ({job["status"]}).'}), 409
+        # Lief in keinem Prozess (z.B. nach einem Absturz): nur als abgebrochen markiert
+        return jsonify({'message': f'Suchauftrag #{job_id} als abgebrochen markiert.'}), 200
+    finally:
+        db.close()
+
+def ensure_status_channel(job_id):
+    """
+    Stellt sicher, dass es für den Auftrag einen Statuskanal gibt.
+
+    Hat der Auftrag in diesem Prozess keinen Kanal (z.B. nach einem Neustart), wird sein Stand
+    aus der Datenbank als Meldung veröffentlicht. Gibt False zurück, wenn der Auftrag unbekannt ist.
+    """
+    def stored_state():
+        db = get_db()
+        try:
+            job = search_jobs.get_job(db, job_id)
+        finally:
+            db.close()
+        if job is None:
+            return None
+        if job['active'] and search_jobs.runs_locally(job_id):
+            return []
+        if job['active']:
+            # Die Meldungen entstehen im Worker-Prozess, der den Auftrag ausführt
+            return [
+                f"Suchauftrag #{job_id} läuft in einem anderen Prozess ({job['done']}/{job['total']} Städte erledigt).",
+                STATUS_DONE,
+            ]
+        return [
+            job['message'] or f"Suchauftrag #{job_id}: {job['status']} ({job['done']}/{job['total']} Städte erledigt).",
+            STATUS_DONE,
+        ]
+
+    return status_bus.ensure_channel(job_id, stored_state)
+
+def event_status_url(job_id):
+    """
+    URL des Auftrags auf dem eventbasierten SSE-Server oder None (Stream bleibt bei Flask).
+
+    Der Server wird beim ersten Aufruf gestartet, also nur in einem Prozess, der Anfragen
+    bedient (nicht im Reloader-Elternprozess oder in spawn-Kindprozessen).
+    """
+    if status_server.start(status_bus, ensure_status_channel) is None:
+        return None
+    return status_server.status_url(job_id, request.scheme, request.host)
+
+def search_status_url(job_id):
+    """URL, unter der ein Client die Statusmeldungen des Auftrags abonniert."""
+    return event_status_url(job_id) or url_for('search_status', job_id=job_id)
+
+@app.route('/search_status/<int:job_id>')
+def search_status(job_id):
+    """
+    Streamt die Statusmeldungen eines Suchauftrags mittels SSE.
+
+    Beliebig viele Clients können denselben Auftrag verfolgen. Nach einem Verbindungsabbruch
+    sendet der Browser Last-Event-ID und bekommt die verpassten Meldungen aus dem Ringpuffer.
+    Ist der eventbasierte SSE-Server erreichbar (STATUS_SSE_PORT), wird dorthin umgeleitet,
+    damit die Verbindung keinen Worker-Thread belegt.
+    """
+    event_url = event_status_url(job_id)
+    if event_url:
+        return redirect(event_url, code=307)
+    last_event_id = request.headers.get('Last-Event-ID', type=int) or request.args.get('last_event_id', 0, type=int)
+    if not ensure_status_channel(job_id):
+        return jsonify({'error': f'Suchauftrag #{job_id} nicht gefunden.'}), 404
 
-@app.route('/search_status')
-def search_status():
-    """Streamt Statusmeldungen der laufenden Suche mittels SSE."""
     def generate():
-        global search_status_queue
         retry_timeout = 2000  # Retry-Timeout in ms für den Client
         
         try:
-            # Sende einen initialen keep-alive, damit die Verbindung etabliert wird
-            yield f"retry: {retry_timeout}\n"
-            yield f"data: Verbindung hergestellt. Warte auf Statusmeldungen...\n\n"
-            
-            while True:
-                try:
-                    # Warte auf eine neue Nachricht (mit Timeout, um blockieren zu verhindern)
-                    message = search_status_queue.get(timeout=5)  # Reduziert auf 5 Sekunden für schnelleres Feedback
-                    
-                    if message == "DONE":
-                        # Sende eindeutige Abschlussnachricht und beende
-                        yield f"data: DONE\n\n"
-                        # Sende noch eine explizite Abschlussmeldung
-                        yield f"data: Suche abgeschlossen. Die Verbindung wird jetzt geschlossen.\n\n"
-                        break  # Beende den Stream
-                    elif message.startswith("FEHLER"):
-                        # Sende Fehlermeldung als 'error' Event
-                        yield f"event: error\ndata: {message}\n\n"
-                    else:
-                        # Sende normale Statusmeldung
-                        yield f"data: {message}\n\n"
-                    
-                    search_status_queue.task_done()
-                    
-                except queue.Empty:
-                    # Sende keep-alive mit retry-Anweisung
-                    yield f"retry: {retry_timeout}\n"
-                    yield f": keep-alive\n\n"
+            yield f"retry: {retry_timeout}\n\n"
+            # FEHLER-Meldungen gehen als normale Nachricht raus: ein 'error'-Event würde der
+            # Browser als Verbindungsfehler behandeln und neu verbinden
+            for event_id, message in status_bus.subscribe(job_id, last_event_id):
+                yield format_sse(event_id, message)
         
         except GeneratorExit:
             # Client hat die Verbindung geschlossen
@@ -2255,7 +2332,6 @@ def search_status():
             error_msg = f"Fehler im SSE Generator: {e}"
             print(error_msg)
             yield f"event: error\ndata: {error_msg}\n\n"
-            yield f"data: Verbindung wird aufgrund eines Fehlers beendet.\n\n"
 
     # Server-Sent Event Header setzen
     response = Response(stream_with_context(generate()), 
@@ -2310,6 +2386,115 @@ def add_search_term():
         print(f"Fehler beim Hinzufügen des Suchbegriffs '{term_name}': {e}")
         return jsonify({'error': str(e)}), 500
 
+def load_keyword_results(db, city_ids, keyword_ids):
+    """
+    Lädt die Orte, die in den Städten mit einem der Suchbegriffe gefunden wurden, inkl. neuester
+    Bewertung, passender Suchbegriffe und Reviews.
+
+    Statt mehrerer Abfragen je Stadt und je Ort gibt es eine Abfrage pro Tabelle über alle
+    (city_id, place_id)-Paare; zusammengesetzt wird in Python.
+
+    Returns:
+        {city_id: {'city_name': ..., 'places': [...]}} in der Reihenfolge von city_ids,
+        Orte nach Bewertung und Anzahl Bewertungen absteigend sortiert
+    """
+    cursor = db.cursor()
+    city_placeholders = ','.join(['?'] * len(city_ids))
+    keyword_placeholders = ','.join(['?'] * len(keyword_ids))
+    # Alle (Stadt, Ort)-Paare der Auswahl; die folgenden Abfragen beziehen sich darauf
+    hits_cte = f"""
+        WITH hits AS (
+            SELECT DISTINCT city_id, place_id FROM place_search
+            WHERE city_id IN ({city_placeholders}) AND term_id IN ({keyword_placeholders})
+        )
+    """
+    hits_params = list(city_ids) + list(keyword_ids)
+
+    cursor.execute(f"SELECT city_id, name FROM city WHERE city_id IN ({city_placeholders})", list(city_ids))
+    # Schlüssel als Text, da city_ids aus JSON auch als Strings kommen können
+    city_names = {str(row['city_id']): row['name'] for row in cursor.fetchall()}
+
+    # Orte mit Öffnungszeiten und Summary
+    cursor.execute(hits_cte + """
+        SELECT
+            h.city_id AS search_city_id,
+            p.*,
+            oh.weekday_text as opening_hours_text
+        FROM hits h
+        JOIN place p ON p.place_id = h.place_id
+        LEFT JOIN opening_hours oh ON p.place_id = oh.place_id
+    """, hits_params)
+    place_rows = cursor.fetchall()
+
+    # Neueste Bewertung je Ort (Gesamtbewertung)
+    cursor.execute(hits_cte + """
+        SELECT place_id, rating, user_rating_count FROM place_rating_current
+        WHERE place_id IN (SELECT place_id FROM hits)
+    """, hits_params)
+    latest_ratings = {row['place_id']: row for row in cursor.fetchall()}
+
+    # Suchbegriffe, mit denen der Ort in der jeweiligen Stadt gefunden wurde
+    cursor.execute(f"""
+        SELECT ps.city_id, ps.place_id, json_group_array(t.name) AS keywords
+        FROM place_search ps
+        JOIN search_term t ON t.term_id = ps.term_id
+        WHERE ps.city_id IN ({city_placeholders}) AND ps.term_id IN ({keyword_placeholders})
+        GROUP BY ps.city_id, ps.place_id
+    """, hits_params)
+    keywords = {(str(row['city_id']), row['place_id']): json.loads(row['keywords']) for row in cursor.fetchall()}
+
+    # Alle Reviews je Ort (neueste zuerst)
+    cursor.execute(hits_cte + """
+        SELECT
+            place_id, author_name, rating, relative_publish_time_description, text
+        FROM review
+        WHERE place_id IN (SELECT place_id FROM hits)
+        ORDER BY place_id, publish_time DESC
+    """, hits_params)
+    reviews = {}
+    for row in cursor.fetchall():
+        review = dict(row)
+        reviews.setdefault(review.pop('place_id'), []).append(review)
+
+    places_by_city = {}
+    for place in place_rows:
+        place_dict = dict(place)
+        city_id = str(place_dict.pop('search_city_id'))
+
+        rating_data = latest_ratings.get(place_dict['place_id'])
+        if rating_data:
+            place_dict['rating'] = rating_data['rating']
+            place_dict['user_rating_count'] = rating_data['user_rating_count']
+
+        place_dict['keywords'] = keywords.get((city_id, place_dict['place_id']), [])
+
+        # Für die Anzeige: Stelle sicher, dass alle Places eine displayName-Struktur haben
+        # Verwende den display_name aus der Datenbank falls vorhanden, sonst den normalen Namen
+        if place_dict.get('display_name'):
+            place_dict['displayName'] = {'text': place_dict['display_name']}
+        elif 'displayName' not in place_dict or not place_dict['displayName']:
+            place_dict['displayName'] = {'text': place_dict['name']}
+
+        place_dict['reviews'] = list(reviews.get(place_dict['place_id'], []))
+        places_by_city.setdefault(city_id, []).append(place_dict)
+
+    results = {}
+    for city_id in city_ids:
+        city_name = city_names.get(str(city_id))
+        if city_name is None:
+            continue
+        places_list = places_by_city.get(str(city_id), [])
+        if not places_list:
+            # Explizit loggen; die Stadt erscheint trotzdem (mit leerer Liste) in den Ergebnissen
+            print(f"Keine Ergebnisse für Stadt '{city_name}' (ID: {city_id}) mit den ausgewählten Keywords gefunden.")
+        # Sortiere die Ergebnisliste nach Bewertung (falls vorhanden), dann nach Anzahl Bewertungen
+        places_list.sort(key=lambda x: (
+            x.get('rating') if x.get('rating') is not None else -1, 
+            x.get('user_rating_count') if x.get('user_rating_count') is not None else -1
+        ), reverse=True)
+        results[city_id] = {'city_name': city_name, 'places': places_list}
+    return results
+
 @app.route('/get_keyword_results_for_cities', methods=['POST'])
 def get_keyword_results_for_cities():
     """Ruft Ergebnisse von Keyword-Suchen für ausgewählte Städte ab."""
@@ -2325,112 +2510,7 @@ def get_keyword_results_for_cities():
     
     try:
         db = get_db()
-        cursor = db.cursor()
-        
-        results = {}
-        
-        # Für jede Stadt
-        for city_id in city_ids:
-            # Hole Stadt-Namen
-            cursor.execute("SELECT name FROM city WHERE city_id = ?", (city_id,))
-            city_result = cursor.fetchone()
-            
-            if not city_result:
-                continue
-                
-            city_name = city_result['name']
-            results[city_id] = {
-                'city_name': city_name,
-                'places': []
-            }
-            
-            # Hole alle Orte, die in der Stadt durch eine der ausgewählten Suchbegriffe gefunden wurden
-            place_ids_query = """
-                SELECT DISTINCT place_id FROM place_search 
-                WHERE city_id = ? AND term_id IN ({})
-            """.format(','.join(['?'] * len(keyword_ids)))
-            
-            cursor.execute(place_ids_query, [city_id] + keyword_ids)
-            place_id_results = cursor.fetchall()
-            
-            if not place_id_results:
-                # Explizit loggen, wenn keine Ergebnisse für diese Stadt gefunden wurden
-                print(f"Keine Ergebnisse für Stadt '{city_name}' (ID: {city_id}) mit den ausgewählten Keywords gefunden.")
-                # Leere places-Liste beibehalten, damit die Stadt trotzdem in den Ergebnissen erscheint
-                continue
-                
-            place_ids = [r['place_id'] for r in place_id_results]
-            
-            # Hole alle Details zu den gefundenen Orten, inklusive Öffnungszeiten und Summary
-            places_query = f"""
-                SELECT 
-                    p.*, 
-                    oh.weekday_text as opening_hours_text
-                FROM place p 
-                LEFT JOIN opening_hours oh ON p.place_id = oh.place_id
-                WHERE p.place_id IN ({','.join(['?'] * len(place_ids))})
-            """
-            
-            cursor.execute(places_query, place_ids)
-            places = cursor.fetchall()
-            
-            # Konvertiere Row-Objekte in Dictionaries
-            places_list = []
-            for place in places:
-                place_dict = dict(place)
-                
-                # Hole die neueste Bewertung für diesen Ort (Gesamtbewertung)
-                cursor.execute("""
-                    SELECT rating, user_rating_count FROM rating_history 
-                    WHERE place_id = ? 
-                    ORDER BY timestamp DESC LIMIT 1
-                """, (place['place_id'],))
-                
-                rating_data = cursor.fetchone()
-                if rating_data:
-                    place_dict['rating'] = rating_data['rating']
-                    place_dict['user_rating_count'] = rating_data['user_rating_count']
-                
-                # Hole die Keywords, mit denen dieser Ort gefunden wurde
-                cursor.execute("""
-                    SELECT t.name FROM search_term t
-                    JOIN place_search ps ON t.term_id = ps.term_id
-                    WHERE ps.place_id = ? AND ps.city_id = ? AND t.term_id IN ({})
-                """.format(','.join(['?'] * len(keyword_ids))), 
-                [place['place_id'], city_id] + keyword_ids)
-                
-                found_keywords = cursor.fetchall()
-                place_dict['keywords'] = [kw['name'] for kw in found_keywords]
-                
-                # Für die Anzeige: Stelle sicher, dass alle Places eine displayName-Struktur haben
-                # Verwende den display_name aus der Datenbank falls vorhanden, sonst den normalen Namen
-                if place_dict.get('display_name'):
-                    place_dict['displayName'] = {'text': place_dict['display_name']}
-                elif 'displayName' not in place_dict or not place_dict['displayName']:
-                    place_dict['displayName'] = {'text': place_dict['name']}
-                
-                # Hole alle Reviews für diesen Ort (neueste zuerst)
-                cursor.execute("""
-                    SELECT 
-                        author_name, rating, relative_publish_time_description, text
-                    FROM review
-                    WHERE place_id = ?
-                    ORDER BY publish_time DESC
-                    -- LIMIT 5 -- Entfernt, um alle Reviews anzuzeigen
-                """, (place['place_id'],))
-                reviews_data = cursor.fetchall()
-                place_dict['reviews'] = [dict(rev) for rev in reviews_data] # Alle Reviews
-                
-                places_list.append(place_dict)
-            
-            # Sortiere die Ergebnisliste nach Bewertung (falls vorhanden), dann nach Anzahl Bewertungen
-            places_list.sort(key=lambda x: (
-                x.get('rating') if x.get('rating') is not None else -1, 
-                x.get('user_rating_count') if x.get('user_rating_count') is not None else -1
-            ), reverse=True)
-            
-            results[city_id]['places'] = places_list
-        
+        results = load_keyword_results(db, city_ids, keyword_ids)
         db.close()
         return jsonify({'results': results})
     
@@ -2455,94 +2535,11 @@ def keyword_search_results():
     except ValueError:
         return render_template('keyword_search_results.html', results=None, error="Ungültige Städte- oder Keyword-IDs.")
 
-    # --- Daten aus der Datenbank holen (Logik aus /get_keyword_results_for_cities wiederverwendet) ---
+    # --- Daten aus der Datenbank holen (gemeinsam mit /get_keyword_results_for_cities) ---
     db = None
     try:
         db = get_db()
-        cursor = db.cursor()
-        results = {}
-
-        for city_id in city_ids:
-            cursor.execute("SELECT name FROM city WHERE city_id = ?", (city_id,))
-            city_result = cursor.fetchone()
-            if not city_result: continue
-            city_name = city_result['name']
-            results[city_id] = {'city_name': city_name, 'places': []}
-
-            place_ids_query = """
-                SELECT DISTINCT place_id FROM place_search 
-                WHERE city_id = ? AND term_id IN ({})
-            """.format(','.join(['?'] * len(keyword_ids)))
-            cursor.execute(place_ids_query, [city_id] + keyword_ids)
-            place_id_results = cursor.fetchall()
-            
-            if not place_id_results:
-                # Explizit loggen, wenn keine Ergebnisse für diese Stadt gefunden wurden
-                print(f"Keine Ergebnisse für Stadt '{city_name}' (ID: {city_id}) mit den ausgewählten Keywords gefunden.")
-                # Leere places-Liste beibehalten, damit die Stadt trotzdem in den Ergebnissen erscheint
-                continue
-                
-            place_ids = [r['place_id'] for r in place_id_results]
-
-            places_query = f"""
-                SELECT 
-                    p.*, 
-                    oh.weekday_text as opening_hours_text
-                FROM place p 
-                LEFT JOIN opening_hours oh ON p.place_id = oh.place_id
-                WHERE p.place_id IN ({','.join(['?'] * len(place_ids))})
-            """
-            cursor.execute(places_query, place_ids)
-            places = cursor.fetchall()
-
-            places_list = []
-            for place in places:
-                place_dict = dict(place)
-                cursor.execute("""
-                    SELECT rating, user_rating_count FROM rating_history 
-                    WHERE place_id = ? 
-                    ORDER BY timestamp DESC LIMIT 1
-                """, (place['place_id'],))
-                rating_data = cursor.fetchone()
-                if rating_data:
-                    place_dict['rating'] = rating_data['rating']
-                    place_dict['user_rating_count'] = rating_data['user_rating_count']
-                
-                cursor.execute("""
-                    SELECT t.name FROM search_term t
-                    JOIN place_search ps ON t.term_id = ps.term_id
-                    WHERE ps.place_id = ? AND ps.city_id = ? AND t.term_id IN ({})
-                """.format(','.join(['?'] * len(keyword_ids))), 
-                [place['place_id'], city_id] + keyword_ids)
-                found_keywords = cursor.fetchall()
-                place_dict['keywords'] = [kw['name'] for kw in found_keywords]
-
-                if place_dict.get('display_name'):
-                    place_dict['displayName'] = {'text': place_dict['display_name']}
-                elif 'displayName' not in place_dict or not place_dict['displayName']:
-                    place_dict['displayName'] = {'text': place_dict['name']}
-
-                cursor.execute("""
-                    SELECT 
-                        author_name, rating, relative_publish_time_description, text
-                    FROM review
-                    WHERE place_id = ?
-                    ORDER BY publish_time DESC
-                    -- LIMIT 5 -- Entfernt, um alle Reviews anzuzeigen
-                """, (place['place_id'],))
-                reviews_data = cursor.fetchall()
-                place_dict['reviews'] = [dict(rev) for rev in reviews_data] # Alle Reviews
-                
-                places_list.append(place_dict)
-            
-            # Sortiere die Ergebnisliste nach Bewertung (falls vorhanden), dann nach Anzahl Bewertungen
-            places_list.sort(key=lambda x: (
-                x.get('rating') if x.get('rating') is not None else -1, 
-                x.get('user_rating_count') if x.get('user_rating_count') is not None else -1
-            ), reverse=True)
-            
-            results[city_id]['places'] = places_list
-        
+        results = load_keyword_results(db, city_ids, keyword_ids)
         db.close()
         return render_template('keyword_search_results.html', results=results)
 
@@ -2666,9 +2663,12 @@ def export_keyword_results():
                     p.website_uri,
                     p.google_maps_uri,
                     c.name AS city_name,
-                    p.postal_code
+                    p.postal_code,
+                    r.rating,
+                    r.user_rating_count
                 FROM place p
                 JOIN city c ON p.city_id = c.city_id
+                LEFT JOIN place_rating_current r ON r.place_id = p.place_id
                 WHERE p.place_id IN ({','.join(['?'] * len(place_ids_tuple))})
             """
             logger.debug(f"Führe Hauptabfrage aus: {query} mit Parametern: {place_ids_tuple}")
@@ -2686,16 +2686,7 @@ def export_keyword_results():
                     place_dict = dict(place_row)
                     logger.debug(f"Verarbeite zusätzlichen Daten für Place ID: {place_id}")
 
-                    # 1. Neueste Bewertung holen
-                    logger.debug(f"Hole Bewertung für {place_id}")
-                    cursor.execute("""
-                        SELECT rating, user_rating_count FROM rating_history
-                        WHERE place_id = ?
-                        ORDER BY timestamp DESC LIMIT 1
-                    """, (place_id,))
-                    rating_result = cursor.fetchone()
-                    place_dict['rating'] = rating_result['rating'] if rating_result else None
-                    place_dict['user_rating_count'] = rating_result['user_rating_count'] if rating_result else None
+                    # 1. Neueste Bewertung kommt aus place_rating_current (Hauptabfrage)
 
                     # 2. Zugehörige Suchbegriffe holen
                     logger.debug(f"Hole Keywords für {place_id}")
@@ -2928,6 +2919,10 @@ def api_metrics():
                 ]
             }), 200
         
+        # Erst hier importieren: die Google-Cloud-Bibliotheken sind groß und werden nur für diese Route gebraucht
+        from google.cloud import monitoring_v3
+        from google.oauth2 import service_account
+
         # Authentifizierung
         credentials = service_account.Credentials.from_service_account_file(service_account_file)
         
@@ -3022,4 +3017,8 @@ if __name__ == '__main__':
     # if os.environ.get('WERKZEUG_RUN_MAIN') != 'true':
     #     init_db() # Initialisiere die Datenbank nur einmal
 
+    # Render-Prozesse vorab starten (nur im eigentlichen Server-Prozess, nicht im Reloader)
+    if os.environ.get('WERKZEUG_RUN_MAIN') == 'true':
+        chart_renderer.warm_up_pool()
+
     app.run(debug=True, threaded=True) # threaded=True ist wichtig für Hintergrundsuche und SSE
@@ -0,0 +1,116 @@
+"""
+Rendert Matplotlib-Diagramme in einem Pool separater Prozesse und liefert PNG-Bytes zurück.
+
+Das Rendern ist CPU-lastig und hält den GIL; in eigenen Prozessen können mehrere Diagramme
+(auch verschiedener Requests) parallel gerendert werden, ohne dass ein Request die anderen
+blockiert. Die Worker starten über render_worker (ohne app.py) und importieren
+matplotlib/seaborn beim Start, sodass der erste Auftrag nicht die Importzeit bezahlt.
+"""
+import multiprocessing.context
+import os
+import sys
+import threading
+import types
+from concurrent.futures import Future, ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+
+from render_worker import render_png, warm_up
+
+# Anzahl Render-Prozesse; 0 rendert im aufrufenden Prozess
+RENDER_WORKERS = int(os.environ.get('CHART_RENDER_WORKERS', min(4, os.cpu_count() or 1)))
+
+# Maximale Wartezeit auf ein Diagramm in Sekunden
+RENDER_TIMEOUT = float(os.environ.get('CHART_RENDER_TIMEOUT', 60))
+
+_pool = None
+_pool_lock = threading.Lock()
+
+# Hauptmodul, das die Worker beim Start erben: ohne __file__ und __spec__ führt spawn im
+# Kindprozess kein Hauptskript aus (sonst liefe z.B. app.py dort als __mp_main__ erneut)
+_worker_main = types.ModuleType('__mp_main__')
+_spawn_lock = threading.Lock()
+
+
+class _WorkerProcess(multiprocessing.context.SpawnProcess):
+    """Render-Prozess, der nur die Module der übergebenen Aufträge (render_worker) importiert."""
+
+    def start(self):
+        # spawn liest das Hauptmodul beim Start aus sys.modules['__main__']; nur für diesen
+        # Moment das leere Modul einsetzen
+        with _spawn_lock:
+            main_module = sys.modules['__main__']
+            sys.modules['__main__'] = _worker_main
+            try:
+                super().start()
+            finally:
+                sys.modules['__main__'] = main_module
+
+
+class _WorkerContext(multiprocessing.context.SpawnContext):
+    Process = _WorkerProcess
+
+
+def _get_pool():
+    global _pool
+    with _pool_lock:
+        if _pool is None:
+            # 'spawn' statt fork: der Flask-Prozess ist multithreaded, und unter Windows gibt es nur spawn
+            _pool = ProcessPoolExecutor(max_workers=RENDER_WORKERS, mp_context=_WorkerContext(),
+                                        initializer=warm_up)
+            # Alle Worker sofort starten, nicht erst einzeln bei Bedarf
+            for _ in range(RENDER_WORKERS):
+                _pool.submit(warm_up)
+        return _pool
+
+
+def _reset_pool():
+    """Verwirft einen defekten Pool; der nächste Auftrag startet einen neuen."""
+    global _pool
+    with _pool_lock:
+        if _pool is not None:
+            _pool.shutdown(wait=False, cancel_futures=True)
+        _pool = None
+
+
+def _render_local(chart_type, *args):
+    # Die Renderer arbeiten ohne pyplot auf eigenen Figuren und sind damit threadsicher
+    return render_png(chart_type, *args)
+
+
+def submit(chart_type, *args):
+    """Gibt einen Auftrag an den Pool und liefert ein Future mit den PNG-Bytes."""
+    if RENDER_WORKERS <= 0:
+        future = Future()
+        try:
+            future.set_result(_render_local(chart_type, *args))
+        except Exception as e:
+            future.set_exception(e)
+        return future
+    try:
+        return _get_pool().submit(render_png, chart_type, *args)
+    except (BrokenProcessPool, RuntimeError) as e:
+        print(f"Render-Pool nicht verfügbar ({e}), starte neu.")
+        _reset_pool()
+        return _get_pool().submit(render_png, chart_type, *args)
+
+
+def render(chart_type, *args):
+    """Rendert ein Diagramm (über den Pool) und wartet auf die PNG-Bytes."""
+    try:
+        return submit(chart_type, *args).result(timeout=RENDER_TIMEOUT)
+    except BrokenProcessPool as e:
+        # Worker abgestürzt: Pool neu aufsetzen und diesen Auftrag lokal rendern
+        print(f"Render-Worker abgestürzt ({e}), rendere im Hauptprozess.")
+        _reset_pool()
+        return _render_local(chart_type, *args)
+
+
+def warm_up_pool():
+    """Startet die Worker vorab, damit der erste Request nicht auf die Prozessstarts wartet."""
+    if RENDER_WORKERS > 0:
+        _get_pool()
+
+
+def shutdown():
+    """Beendet den Pool (z.B. beim Herunterfahren der Anwendung)."""
+    _reset_pool()
@@ -0,0 +1,242 @@
+"""Prozessweite Caches für die Analyse-Routen (Städtedatensatz und Ergebnisse)."""
+import hashlib
+import sqlite3
+import sys
+import threading
+from collections import OrderedDict, namedtuple
+
+# Tabellen, deren Inhalt in den Städtedatensatz einfließt. Ändert sich eine davon,
+# wird der Datensatz neu geladen.
+DATASET_TABLES = ('city', 'demographics', 'demo_age_dist', 'age_group', 'postal_code', 'plz_event_gastro')
+
+# Schnappschuss des geladenen Datensatzes. `df` wird zwischen allen Requests geteilt
+# und darf nicht verändert werden (bei Bedarf vorher .copy() aufrufen).
+# `target_engine` hält die Altersverteilung als Matrix für die Zielgruppenberechnung.
+CityDataset = namedtuple('CityDataset', ['latest_year', 'version', 'df', 'target_engine'])
+
+
+# Änderungszähler je Tabelle, von Triggern bei jedem INSERT/UPDATE/DELETE erhöht (angelegt von
+# migrations.py). Ohne ihn bliebe ein UPDATE (z.B. korrigiertes Einkommen) im Fingerabdruck unsichtbar.
+SQL_CREATE_CHANGE_COUNTER = """
+    CREATE TABLE IF NOT EXISTS table_change_counter (
+        table_name TEXT PRIMARY KEY,
+        changes INTEGER NOT NULL
+    )
+"""
+
+
+def change_counter_triggers(table):
+    """CREATE TRIGGER-Anweisungen, die table_change_counter für eine Tabelle hochzählen."""
+    return [
+        f"""
+        CREATE TRIGGER IF NOT EXISTS trg_{table}_{operation.lower()}_count AFTER {operation} ON {table}
+        BEGIN
+            INSERT INTO table_change_counter (table_name, changes) VALUES ('{table}', 1)
+            ON CONFLICT(table_name) DO UPDATE SET changes = changes + 1;
+        END
+        """
+        for operation in ('INSERT', 'UPDATE', 'DELETE')
+    ]
+
+
+def data_fingerprint(conn, tables=DATASET_TABLES):
+    """Ermittelt einen Fingerabdruck (Zeilenanzahl + höchste rowid + Änderungszähler) der angegebenen Tabellen."""
+    try:
+        changes = dict(conn.execute("SELECT table_name, changes FROM table_change_counter").fetchall())
+    except sqlite3.OperationalError:
+        # Migration noch nicht angewendet: nur Zeilenanzahl und rowid
+        changes = {}
+    parts = []
+    for table in tables:
+        try:
+            row = conn.execute(f"SELECT COUNT(*), MAX(rowid) FROM {table}").fetchone()
+        except sqlite3.OperationalError:
+            # Tabelle ohne rowid (oder nicht vorhanden): nur die Zeilenanzahl verwenden
+            try:
+                row = (conn.execute(f"SELECT COUNT(*) FROM {table}").fetchone()[0], None)
+            except sqlite3.OperationalError:
+                row = (None, None)
+        parts.append((table, row[0], row[1], changes.get(table)))
+    return tuple(parts)
+
+
+class CityDatasetCache:
+    """
+    Hält den zusammengeführten Städtedatensatz (Stadt-/Demografiedaten + Altersverteilung
+    des aktuellsten Jahres) im Speicher.
+
+    Bei jedem Zugriff wird nur der Fingerabdruck der Quelltabellen geprüft; der teure
+    Ladevorgang (SQL + Pivot + Merge) läuft erst, wenn sich die Daten geändert haben.
+    """
+
+    def __init__(self, loader, tables=DATASET_TABLES):
+        # loader(conn) -> (latest_year, DataFrame, TargetGroupEngine)
+        self._loader = loader
+        self._tables = tables
+        self._lock = threading.Lock()
+        self._dataset = None
+        self._fingerprint = None
+
+    def get(self, conn_factory):
+        """Gibt den aktuellen Datensatz zurück und lädt ihn bei geänderten Daten neu."""
+        conn = conn_factory()
+        try:
+            return self._get(conn, data_fingerprint(conn, self._tables))
+        finally:
+            conn.close()
+
+    def get_replicated(self, replica):
+        """Wie get, liest aber aus der In-Memory-Kopie der Quelltabellen (TableReplica)."""
+        conn, fingerprint = replica.snapshot()
+        return self._get(conn, fingerprint)
+
+    def _get(self, conn, fingerprint):
+        with self._lock:
+            if self._dataset is None or fingerprint != self._fingerprint:
+                latest_year, df, target_engine = self._loader(conn)
+                version = hashlib.sha1(repr(fingerprint).encode('utf-8')).hexdigest()[:16]
+                self._dataset = CityDataset(latest_year, version, df, target_engine)
+                self._fingerprint = fingerprint
+            return self._dataset
+
+    def invalidate(self):
+        """Verwirft den Datensatz, der nächste Zugriff lädt ihn neu."""
+        with self._lock:
+            self._dataset = None
+            self._fingerprint = None
+
+
+class TableReplica:
+    """
+    In-Memory-Kopie der Quelltabellen des Städtedatensatzes.
+
+    Änderungen an der Datei werden über PRAGMA data_version einer dauerhaft geöffneten
+    (schreibgeschützten) Quellverbindung erkannt; das kostet keinen Tabellenzugriff. Erst wenn
+    sich der Wert ändert, wird der Fingerabdruck der Tabellen geprüft und die Kopie bei Bedarf
+    neu aufgebaut. Schreibvorgänge auf anderen Tabellen (z.B. durch die Massensuche) führen
+    daher höchstens zu einer Fingerabdruck-Prüfung.
+    """
+
+    def __init__(self, source_factory, tables=DATASET_TABLES):
+        # source_factory() -> Verbindung zur Datenbankdatei (wird dauerhaft gehalten)
+        self._source_factory = source_factory
+        self._tables = tables
+        self._lock = threading.Lock()
+        self._source = None
+        self._data_version = None
+        self._conn = None
+        self._fingerprint = None
+
+    def snapshot(self):
+        """Gibt (Verbindung zur aktuellen Kopie, Fingerabdruck der Quelltabellen) zurück."""
+        with self._lock:
+            if self._source is None:
+                self._source = self._source_factory()
+            data_version = self._source.execute("PRAGMA data_version").fetchone()[0]
+            if self._conn is None or data_version != self._data_version:
+                self._refresh()
+                self._data_version = data_version
+            return self._conn, self._fingerprint
+
+    def _refresh(self):
+        source = self._source
+        # Fingerabdruck und Kopie in derselben Lesetransaktion, damit beide zum selben Stand gehören
+        source.execute("BEGIN")
+        try:
+            fingerprint = data_fingerprint(source, self._tables)
+            if self._conn is not None and fingerprint == self._fingerprint:
+                return
+            self._conn = self._copy_tables(source)
+            self._fingerprint = fingerprint
+        finally:
+            source.rollback()
+
+    def _copy_tables(self, source):
+        # Verbindungen, die noch die alte Kopie lesen, behalten sie; sie wird danach freigegeben
+        conn = sqlite3.connect(':memory:', check_same_thread=False)
+        placeholders = ','.join('?' * len(self._tables))
+        # Nur Tabellen und Indizes: Trigger (z.B. die Änderungszähler) würden beim Kopieren
+        # feuern und auf Tabellen zeigen, die in der Kopie fehlen
+        schema = source.execute(
+            f"SELECT type, name, sql FROM sqlite_master "
+            f"WHERE tbl_name IN ({placeholders}) AND type IN ('table', 'index') AND sql IS NOT NULL",
+            self._tables
+        ).fetchall()
+        with conn:
+            for object_type, name, sql in schema:
+                if object_type == 'table':
+                    conn.execute(sql)
+                    cursor = source.execute(f"SELECT * FROM {name}")
+                    columns = ','.join('?' * len(cursor.description))
+                    conn.executemany(f"INSERT INTO {name} VALUES ({columns})", cursor)
+            # Indizes erst nach den Daten anlegen (einmal sortiert aufbauen statt bei jedem INSERT pflegen)
+            for object_type, name, sql in schema:
+                if object_type == 'index':
+                    conn.execute(sql)
+        return conn
+
+    def close(self):
+        with self._lock:
+            if self._source is not None:
+                self._source.close()
+            self._source = self._conn = self._fingerprint = self._data_version = None
+
+
+class ResultCache:
+    """
+    LRU-Cache für fertig berechnete Ergebnisse, begrenzt nach Anzahl der Einträge
+    und nach Speicherverbrauch (Summe der Eintragsgrößen in Bytes).
+    """
+
+    def __init__(self, max_entries=64, max_bytes=64 * 1024 * 1024):
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self._entries = OrderedDict()  # key -> (value, size)
+        self._total_bytes = 0
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, key):
+        """Gibt den gespeicherten Wert zurück (oder None) und markiert ihn als zuletzt benutzt."""
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                self.misses += 1
+                return None
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return entry[0]
+
+    def put(self, key, value, size=None):
+        """Speichert einen Wert; verdrängt bei Bedarf die am längsten nicht benutzten Einträge."""
+        if size is None:
+            size = len(value) if isinstance(value, (bytes, bytearray, str)) else sys.getsizeof(value)
+        if size > self.max_bytes:
+            return  # Einzelner Eintrag zu groß für den Cache
+        with self._lock:
+            old = self._entries.pop(key, None)
+            if old is not None:
+                self._total_bytes -= old[1]
+            self._entries[key] = (value, size)
+            self._total_bytes += size
+            while len(self._entries) > self.max_entries or self._total_bytes > self.max_bytes:
+                _, (_, evicted_size) = self._entries.popitem(last=False)
+                self._total_bytes -= evicted_size
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self._total_bytes = 0
+
+    def stats(self):
+        """Kennzahlen für Diagnosezwecke."""
+        with self._lock:
+            return {
+                'entries': len(self._entries),
+                'bytes': self._total_bytes,
+                'max_entries': self.max_entries,
+                'max_bytes': self.max_bytes,
+                'hits': self.hits,
+                'misses': self.misses,
+            }
@@ -0,0 +1,146 @@
+"""
+Wiederverwendbare SQLite-Verbindungen mit WAL-Modus und abgestimmten PRAGMAs.
+
+Statt für jede Anfrage und jede Hilfsfunktion eine neue Verbindung zu öffnen, bekommt jeder
+Thread über ConnectionPool.acquire() eine Verbindung, die er bis zur Freigabe behält; weitere
+acquire()-Aufrufe im selben Thread liefern dieselbe Verbindung. close() gibt eine Referenz
+zurück, mit der letzten (oder spätestens beim Teardown des Flask-App-Kontexts über release())
+wandert die Verbindung in den Pool und wird vom nächsten Thread wiederverwendet.
+
+Im WAL-Modus blockiert ein laufender Schreibvorgang (z.B. der PlaceWriter der Massensuche)
+keine Leser mehr; gleichzeitige Schreiber warten höchstens SQLITE_BUSY_TIMEOUT_MS, statt
+sofort mit "database is locked" abzubrechen.
+"""
+import os
+import pathlib
+import sqlite3
+import threading
+
+# Freie Verbindungen, die der Pool höchstens vorhält (weitere werden beim Freigeben geschlossen)
+SQLITE_POOL_SIZE = int(os.environ.get('SQLITE_POOL_SIZE', 8))
+
+# Seiten-Cache je Verbindung (KiB)
+SQLITE_CACHE_SIZE_KB = int(os.environ.get('SQLITE_CACHE_SIZE_KB', 32 * 1024))
+
+# Per mmap gelesener Teil der Datenbankdatei (Bytes, 0 = aus)
+SQLITE_MMAP_SIZE = int(os.environ.get('SQLITE_MMAP_SIZE', 256 * 1024 * 1024))
+
+# Wartezeit auf eine Sperre, bevor "database is locked" gemeldet wird (Millisekunden)
+SQLITE_BUSY_TIMEOUT_MS = int(os.environ.get('SQLITE_BUSY_TIMEOUT_MS', 10000))
+
+
+def configure(conn, readonly=False):
+    """Setzt WAL-Modus und PRAGMAs für eine Verbindung (readonly: query_only statt WAL-Umstellung)."""
+    if readonly:
+        # Schreibende Anweisungen werden abgewiesen, auch wenn die Datei beschreibbar ist
+        conn.execute("PRAGMA query_only=ON")
+    else:
+        # journal_mode=WAL bleibt in der Datei gespeichert; schlägt fehl, solange eine andere
+        # Verbindung eine Transaktion offen hat, wird dann aber beim nächsten Öffnen nachgeholt
+        try:
+            conn.execute("PRAGMA journal_mode=WAL")
+        except sqlite3.OperationalError as e:
+            print(f"WARNUNG: WAL-Modus konnte nicht aktiviert werden: {e}")
+        conn.execute("PRAGMA synchronous=NORMAL")
+    conn.execute(f"PRAGMA cache_size=-{SQLITE_CACHE_SIZE_KB}")
+    conn.execute(f"PRAGMA mmap_size={SQLITE_MMAP_SIZE}")
+    conn.execute(f"PRAGMA busy_timeout={SQLITE_BUSY_TIMEOUT_MS}")
+    return conn
+
+
+def connect(db_path, readonly=False, **kwargs):
+    """
+    Öffnet eine einzelne, konfigurierte Verbindung außerhalb des Pools (z.B. für Schreib-Threads).
+
+    Mit readonly=True wird die Datei über eine URI mit mode=ro geöffnet; solche Verbindungen
+    setzen keine Schreibsperren und können das Schema nicht verändern.
+    """
+    if readonly:
+        uri = f"{pathlib.Path(db_path).resolve().as_uri()}?mode=ro"
+        conn = sqlite3.connect(uri, uri=True, timeout=SQLITE_BUSY_TIMEOUT_MS / 1000, **kwargs)
+    else:
+        conn = sqlite3.connect(db_path, timeout=SQLITE_BUSY_TIMEOUT_MS / 1000, **kwargs)
+    return configure(conn, readonly)
+
+
+class PooledConnection(sqlite3.Connection):
+    """Verbindung aus dem Pool: close() gibt sie an den Pool zurück, statt sie zu schließen."""
+
+    pool = None
+
+    def close(self):
+        if self.pool is None:
+            super().close()
+        else:
+            self.pool.put_back(self)
+
+    def close_for_real(self):
+        super().close()
+
+
+class ConnectionPool:
+    """Pool von SQLite-Verbindungen zu einer Datenbankdatei, je Thread eine Verbindung."""
+
+    def __init__(self, db_path, max_idle=None, readonly=False):
+        self.db_path = db_path
+        self.readonly = readonly
+        self.max_idle = SQLITE_POOL_SIZE if max_idle is None else max_idle
+        self._idle = []
+        self._lock = threading.Lock()
+        # Verbindung des aktuellen Threads und Anzahl der offenen acquire()-Aufrufe
+        self._local = threading.local()
+
+    def _open(self):
+        # Verbindungen wechseln zwischen Threads, werden aber nie von zwei Threads gleichzeitig benutzt
+        conn = connect(self.db_path, self.readonly, factory=PooledConnection, check_same_thread=False)
+        conn.pool = self
+        return conn
+
+    def acquire(self):
+        """Verbindung des aktuellen Threads (aus dem Pool oder neu geöffnet)."""
+        conn = getattr(self._local, 'conn', None)
+        if conn is None:
+            with self._lock:
+                conn = self._idle.pop() if self._idle else None
+            if conn is None:
+                conn = self._open()
+            self._local.conn = conn
+            self._local.refs = 0
+        self._local.refs += 1
+        return conn
+
+    def put_back(self, conn):
+        """Gibt eine mit acquire() geholte Referenz zurück (wird von conn.close() aufgerufen)."""
+        if getattr(self._local, 'conn', None) is not conn:
+            # Bereits über release() zurückgegeben
+            return
+        self._local.refs -= 1
+        if self._local.refs <= 0:
+            self.release()
+
+    def release(self):
+        """Gibt die Verbindung des aktuellen Threads an den Pool zurück, unabhängig von offenen Referenzen."""
+        conn = getattr(self._local, 'conn', None)
+        if conn is None:
+            return
+        self._local.conn = None
+        self._local.refs = 0
+        try:
+            # Nicht abgeschlossene Transaktion verwerfen, damit keine Sperre am Pool hängen bleibt
+            if conn.in_transaction:
+                conn.rollback()
+        except sqlite3.Error:
+            conn.close_for_real()
+            return
+        with self._lock:
+            if len(self._idle) < self.max_idle:
+                self._idle.append(conn)
+                return
+        conn.close_for_real()
+
+    def close_all(self):
+        """Schließt alle freien Verbindungen."""
+        with self._lock:
+            idle, self._idle = self._idle, []
+        for conn in idle:
+            conn.close_for_real()
@@ -0,0 +1,104 @@
+"""
+Sliding-Window-Scheduler für asynchrone API-Abrufe.
+
+Statt Städte in festen Batches abzuarbeiten (ein langsamer Abruf hält den ganzen Batch auf),
+sind immer genau `concurrency` Abrufe aktiv: Sobald einer fertig ist, startet der nächste.
+Ergebnisse werden in der Reihenfolge ihrer Fertigstellung geliefert.
+"""
+import asyncio
+import time
+from collections import namedtuple
+from itertools import islice
+
+import numpy as np
+
+# Ergebnis eines Auftrags: result ist entweder der Rückgabewert oder die aufgetretene Exception
+JobResult = namedtuple('JobResult', ['item', 'result', 'latency'])
+
+
+class LatencyStats:
+    """Durchsatz und Latenzverteilung der bisher abgeschlossenen Abrufe."""
+
+    def __init__(self):
+        self.started_at = time.monotonic()
+        self.latencies = []
+
+    def record(self, seconds):
+        self.latencies.append(seconds)
+
+    @property
+    def count(self):
+        return len(self.latencies)
+
+    def throughput(self):
+        """Abgeschlossene Abrufe pro Sekunde seit dem Start."""
+        elapsed = time.monotonic() - self.started_at
+        return self.count / elapsed if elapsed > 0 else 0.0
+
+    def percentile(self, q):
+        """Latenz-Perzentil in Sekunden (0, solange noch nichts abgeschlossen ist)."""
+        return float(np.percentile(self.latencies, q)) if self.latencies else 0.0
+
+    def summary(self):
+        return f"{self.throughput():.1f} Anfragen/s, Latenz p50 {self.percentile(50):.1f} s / p95 {self.percentile(95):.1f} s"
+
+
+async def _run_job(job, item, timeout, cooldown):
+    """Führt einen Auftrag mit Timeout aus; Exceptions werden als Ergebnis zurückgegeben."""
+    start = time.monotonic()
+    try:
+        if timeout:
+            result = await asyncio.wait_for(job(item), timeout)
+        else:
+            result = await job(item)
+    except asyncio.TimeoutError:
+        result = asyncio.TimeoutError(f"Zeitüberschreitung nach {timeout:.0f} s")
+    except Exception as e:
+        result = e
+    latency = time.monotonic() - start
+    if cooldown:
+        # Pause pro Slot nach jedem Abruf (einfache Drosselung gegenüber der API)
+        await asyncio.sleep(cooldown)
+    return JobResult(item, result, latency)
+
+
+async def sliding_window(items, job, concurrency, timeout=None, cooldown=0, stats=None):
+    """
+    Führt job(item) für alle items mit konstant `concurrency` parallelen Aufträgen aus.
+
+    Args:
+        items: Iterierbare Aufträge (z.B. Städte)
+        job: Coroutine-Funktion job(item)
+        concurrency: Anzahl gleichzeitig laufender Aufträge
+        timeout: Maximale Dauer eines Auftrags in Sekunden (None = unbegrenzt)
+        cooldown: Pause in Sekunden, bevor ein Slot den nächsten Auftrag startet
+        stats: Optional LatencyStats, die mit den Latenzen gefüllt wird
+
+    Yields:
+        JobResult(item, Ergebnis oder Exception, Latenz in Sekunden), sobald ein Auftrag fertig ist
+    """
+    pending = iter(items)
+    exhausted = object()
+    in_flight = set()
+
+    def start(item):
+        in_flight.add(asyncio.create_task(_run_job(job, item, timeout, cooldown)))
+
+    for item in islice(pending, concurrency):
+        start(item)
+    try:
+        while in_flight:
+            done, _ = await asyncio.wait(in_flight, return_when=asyncio.FIRST_COMPLETED)
+            for task in done:
+                in_flight.discard(task)
+                # Slot sofort neu belegen, bevor der Aufrufer das Ergebnis verarbeitet
+                next_item = next(pending, exhausted)
+                if next_item is not exhausted:
+                    start(next_item)
+                job_result = task.result()
+                if stats is not None:
+                    stats.record(job_result.latency)
+                yield job_result
+    finally:
+        for task in in_flight:
+            task.cancel()
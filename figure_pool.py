@@ -0,0 +1,74 @@
+"""
+Wiederverwendbare Matplotlib-Figuren ohne pyplot.
+
+Die Diagramme werden auf eigenen Figure/FigureCanvasAgg-Objekten gezeichnet statt über den
+globalen Figure-Manager von pyplot. Dadurch können mehrere Threads gleichzeitig rendern, und
+eine Figur, die nicht zurückgegeben wird, wird einfach vom Garbage Collector freigegeben
+(kein plt.close() nötig). Pro Diagrammtyp werden einige vorab dimensionierte Figuren
+vorgehalten und nach dem Export geleert wiederverwendet.
+"""
+import io
+import os
+import threading
+
+import matplotlib
+from matplotlib.backends.backend_agg import FigureCanvasAgg
+from matplotlib.figure import Figure, SubplotParams
+
+# Maximale Anzahl freier Figuren je Diagrammtyp
+FIGURE_POOL_SIZE = int(os.environ.get('FIGURE_POOL_SIZE', 4))
+
+# Feste Größen der Diagrammtypen (Zoll)
+FIGURE_SIZES = {
+    'cities': (8, 4),
+    'pie': (4, 4),
+    'scatter': (10, 6),
+    'clustering': (10, 6),
+    'clustering2': (10, 6),
+}
+
+_free_figures = {}
+_lock = threading.Lock()
+
+
+def _default_subplot_params():
+    return SubplotParams(**{
+        key: matplotlib.rcParams[f'figure.subplot.{key}']
+        for key in ('left', 'right', 'bottom', 'top', 'wspace', 'hspace')
+    })
+
+
+def acquire(chart_type):
+    """Gibt eine leere Figur für den Diagrammtyp zurück (aus dem Pool oder neu erstellt)."""
+    with _lock:
+        free = _free_figures.get(chart_type)
+        if free:
+            return free.pop()
+    fig = Figure(figsize=FIGURE_SIZES.get(chart_type, (10, 6)))
+    FigureCanvasAgg(fig)
+    fig._pool_chart_type = chart_type
+    return fig
+
+
+def release(fig):
+    """Leert die Figur und legt sie zurück in den Pool (Figuren ohne Pool-Typ werden verworfen)."""
+    chart_type = getattr(fig, '_pool_chart_type', None)
+    if chart_type is None:
+        return
+    fig.clear()
+    # tight_layout() verändert die Ränder; für den nächsten Einsatz auf die Standardwerte zurücksetzen
+    fig.subplotpars = _default_subplot_params()
+    with _lock:
+        free = _free_figures.setdefault(chart_type, [])
+        if len(free) < FIGURE_POOL_SIZE:
+            free.append(fig)
+
+
+def figure_to_png(fig):
+    """Exportiert die Figur als PNG-Bytes und gibt sie anschließend an den Pool zurück."""
+    img = io.BytesIO()
+    try:
+        fig.savefig(img, format='png', bbox_inches='tight')
+    finally:
+        release(fig)
+    return img.getvalue()
@@ -0,0 +1,272 @@
+"""
+Versionierte Schema-Migrationen für data.db.
+
+Jede Migration hat eine feste Versionsnummer und wird genau einmal ausgeführt; angewendete
+Versionen stehen in der Tabelle schema_version. Fehlt eine Tabelle, die eine Migration
+verändert (z.B. weil die Datentabellen noch nicht importiert sind), wird sie zurückgestellt,
+nicht eingetragen und beim nächsten Start erneut versucht. Neue Änderungen am Schema (Spalten, Tabellen,
+Indizes) werden als weiterer Eintrag am Ende von MIGRATIONS ergänzt, bestehende Einträge
+werden nicht mehr verändert.
+
+Diagnose: `python migrations.py [data.db] --explain` (oder DB_DIAGNOSTICS=1 beim Start von
+app.py) gibt für die häufigsten Abfragen den Plan aus EXPLAIN QUERY PLAN aus.
+"""
+import os
+import sqlite3
+import sys
+from datetime import datetime
+
+import search_jobs
+from data_cache import DATASET_TABLES, SQL_CREATE_CHANGE_COUNTER, change_counter_triggers
+from place_store import (
+    SQL_BACKFILL_RATING_CURRENT, SQL_CREATE_RATING_CURRENT, SQL_CREATE_SEARCH_HINT, SQL_CREATE_SEARCH_LOG,
+)
+
+# Abfrageplan der häufigsten Abfragen beim Start ausgeben
+DB_DIAGNOSTICS = os.environ.get('DB_DIAGNOSTICS', '').lower() in ('1', 'true', 'yes')
+
+SQL_CREATE_SCHEMA_VERSION = """
+    CREATE TABLE IF NOT EXISTS schema_version (
+        version INTEGER PRIMARY KEY,
+        name TEXT NOT NULL,
+        applied_at TIMESTAMP NOT NULL
+    )
+"""
+
+
+class MissingTable(Exception):
+    """Eine Migration braucht eine Tabelle, die (noch) nicht existiert."""
+
+
+def _table_exists(conn, table_name):
+    return conn.execute(
+        "SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = ?", (table_name,)
+    ).fetchone() is not None
+
+
+def _require_table(conn, table_name):
+    if not _table_exists(conn, table_name):
+        raise MissingTable(table_name)
+
+
+def _add_column(conn, table_name, column_name, column_type):
+    """Fügt eine Spalte hinzu, falls sie fehlt (MissingTable, wenn die Tabelle fehlt)."""
+    _require_table(conn, table_name)
+    columns = [row[1] for row in conn.execute(f"PRAGMA table_info({table_name})")]
+    if column_name not in columns:
+        print(f"  Füge Spalte '{column_name}' zur Tabelle '{table_name}' hinzu...")
+        conn.execute(f"ALTER TABLE {table_name} ADD COLUMN {column_name} {column_type}")
+
+
+def _create_index(conn, index_name, table_name, columns):
+    """Legt einen Index an (MissingTable, wenn die Tabelle fehlt)."""
+    _require_table(conn, table_name)
+    conn.execute(f"CREATE INDEX IF NOT EXISTS {index_name} ON {table_name} ({columns})")
+
+
+def _migrate_place_postal_code(conn):
+    _add_column(conn, 'place', 'postal_code', 'TEXT')
+
+
+def _migrate_search_cache_filters(conn):
+    _add_column(conn, 'search_cache', 'min_rating', 'REAL')
+    _add_column(conn, 'search_cache', 'min_user_ratings', 'INTEGER')
+
+
+def _migrate_mass_search_tables(conn):
+    conn.execute(SQL_CREATE_SEARCH_LOG)
+    conn.execute(SQL_CREATE_SEARCH_HINT)
+    conn.execute(search_jobs.SQL_CREATE_SEARCH_JOB)
+    conn.execute(search_jobs.SQL_CREATE_SEARCH_JOB_CITY)
+
+
+def _migrate_rating_current(conn):
+    # Aus der Historie befüllen; ohne rating_history zurückstellen, sonst bliebe die Tabelle leer
+    _require_table(conn, 'rating_history')
+    if not _table_exists(conn, 'place_rating_current'):
+        conn.execute(SQL_CREATE_RATING_CURRENT)
+        conn.execute(SQL_BACKFILL_RATING_CURRENT)
+
+
+# (Indexname, Tabelle, Spalten) für die häufigsten Abfragen
+QUERY_INDEXES = (
+    # Keyword-Ergebnisse: place_search WHERE city_id IN (...) AND term_id IN (...) -> place_id
+    ('idx_place_search_city_term', 'place_search', 'city_id, term_id, place_id'),
+    # Inkrementelle Suche: place_search WHERE term_id = ? AND search_timestamp >= ?
+    ('idx_place_search_term_time', 'place_search', 'term_id, search_timestamp, city_id'),
+    # Neueste Bewertung je Ort (Backfill, Auswertungen der Historie)
+    ('idx_rating_history_place_time', 'rating_history', 'place_id, timestamp DESC, rating, user_rating_count'),
+    # Reviews je Ort, neueste zuerst
+    ('idx_review_place_time', 'review', 'place_id, publish_time DESC'),
+    # Live-Suche: search_cache WHERE stadt = ? AND suchbegriff = ? ORDER BY last_updated DESC
+    ('idx_search_cache_lookup', 'search_cache', 'stadt, suchbegriff, last_updated DESC'),
+    # Vertriebsnummer: postal_code WHERE postal_code = ?, plz_event_gastro WHERE postal_code_id = ?
+    ('idx_postal_code_code', 'postal_code', 'postal_code, postal_code_id'),
+    ('idx_postal_code_city', 'postal_code', 'city_id, postal_code_id'),
+    ('idx_plz_event_gastro_postal_code', 'plz_event_gastro', 'postal_code_id, event_gastro_text'),
+    # Städtedatensatz: demographics WHERE year = ?, Altersverteilung je demography_id
+    ('idx_demographics_year_city', 'demographics', 'year, city_id'),
+    ('idx_demo_age_dist_demography', 'demo_age_dist', 'demography_id, age_group_id, count'),
+)
+
+
+def _index_migration(table_name):
+    """Migration, die die QUERY_INDEXES einer Tabelle anlegt (je Tabelle eine eigene Version,
+    damit eine fehlende Tabelle nicht die Indizes der anderen zurückstellt)."""
+    def migrate_indexes(conn):
+        for index_name, index_table, columns in QUERY_INDEXES:
+            if index_table == table_name:
+                _create_index(conn, index_name, index_table, columns)
+    return migrate_indexes
+
+
+def _migrate_change_counter(conn):
+    # Alle Tabellen des Städtedatensatzes werden gemeinsam importiert; fehlt eine, zurückstellen
+    for table_name in DATASET_TABLES:
+        _require_table(conn, table_name)
+    conn.execute(SQL_CREATE_CHANGE_COUNTER)
+    for table_name in DATASET_TABLES:
+        for sql in change_counter_triggers(table_name):
+            conn.execute(sql)
+
+
+def _migrate_search_job_lease(conn):
+    # Lease des ausführenden Prozesses (Heartbeat in updated_at) und prozessübergreifender Abbruch
+    _add_column(conn, 'search_job', 'owner', 'TEXT')
+    _add_column(conn, 'search_job', 'cancel_requested', 'INTEGER NOT NULL DEFAULT 0')
+
+
+# (Version, Beschreibung, Funktion(conn)) in Ausführungsreihenfolge
+MIGRATIONS = (
+    (1, 'place.postal_code', _migrate_place_postal_code),
+    (2, 'search_cache: min_rating, min_user_ratings', _migrate_search_cache_filters),
+    (3, 'Tabellen der Massensuche (Suchprotokoll, Hinweise, Aufträge)', _migrate_mass_search_tables),
+    (4, 'Indizes für place_search', _index_migration('place_search')),
+    (5, 'place_rating_current (aktuelle Bewertung je Ort)', _migrate_rating_current),
+    (6, 'Indizes für rating_history', _index_migration('rating_history')),
+    (7, 'Indizes für review', _index_migration('review')),
+    (8, 'Indizes für search_cache', _index_migration('search_cache')),
+    (9, 'Indizes für postal_code', _index_migration('postal_code')),
+    (10, 'Indizes für plz_event_gastro', _index_migration('plz_event_gastro')),
+    (11, 'Indizes für demographics', _index_migration('demographics')),
+    (12, 'Indizes für demo_age_dist', _index_migration('demo_age_dist')),
+    (13, 'Änderungszähler für die Tabellen des Städtedatensatzes', _migrate_change_counter),
+    (14, 'Lease und Abbruchanforderung für Suchaufträge', _migrate_search_job_lease),
+)
+
+
+def pending_versions(conn):
+    """Versionen, die noch nicht angewendet (oder zurückgestellt) sind."""
+    conn.execute(SQL_CREATE_SCHEMA_VERSION)
+    applied = {row[0] for row in conn.execute("SELECT version FROM schema_version")}
+    return [version for version, _, _ in MIGRATIONS if version not in applied]
+
+
+def current_version(conn):
+    """Höchste Version, bis zu der alle Migrationen angewendet sind."""
+    pending = pending_versions(conn)
+    if pending:
+        return pending[0] - 1
+    return MIGRATIONS[-1][0]
+
+
+def migrate(conn):
+    """
+    Führt alle noch nicht angewendeten Migrationen aus, jede in einer eigenen Transaktion.
+    Migrationen, denen eine Tabelle fehlt, werden zurückgerollt und nicht eingetragen.
+
+    Returns:
+        Liste der angewendeten Versionen
+    """
+    conn.execute(SQL_CREATE_SCHEMA_VERSION)
+    conn.commit()
+    applied = []
+    for version, name, step in MIGRATIONS:
+        # BEGIN IMMEDIATE sperrt für andere Schreiber; erneut prüfen, falls ein anderer Prozess
+        # (z.B. der Reloader) die Migration gerade ausgeführt hat
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            done = conn.execute("SELECT 1 FROM schema_version WHERE version = ?", (version,)).fetchone()
+            if not done:
+                print(f"Migration {version}: {name}...")
+                step(conn)
+                conn.execute(
+                    "INSERT INTO schema_version (version, name, applied_at) VALUES (?, ?, ?)",
+                    (version, name, datetime.now())
+                )
+                applied.append(version)
+            conn.execute("COMMIT")
+        except MissingTable as e:
+            conn.execute("ROLLBACK")
+            print(f"Migration {version} zurückgestellt: Tabelle '{e}' existiert noch nicht (wird beim nächsten Start erneut versucht).")
+        except Exception:
+            conn.execute("ROLLBACK")
+            raise
+    return applied
+
+
+# (Beschreibung, SQL, Parameter) der Abfragen, deren Plan der Diagnosemodus zeigt
+HOT_QUERIES = (
+    ('Keyword-Ergebnisse: Orte je Stadt und Suchbegriff',
+     "SELECT DISTINCT city_id, place_id FROM place_search WHERE city_id IN (?, ?) AND term_id IN (?, ?)",
+     (1, 2, 1, 2)),
+    ('Inkrementelle Suche: aktuelle Städte',
+     "SELECT city_id FROM place_search WHERE term_id = ? AND search_timestamp >= ?",
+     (1, '2000-01-01')),
+    ('Neueste Bewertung aus der Historie',
+     "SELECT rating, user_rating_count FROM rating_history WHERE place_id = ? ORDER BY timestamp DESC LIMIT 1",
+     ('x',)),
+    ('Aktuelle Bewertung',
+     "SELECT rating, user_rating_count FROM place_rating_current WHERE place_id = ?",
+     ('x',)),
+    ('Reviews je Ort',
+     "SELECT author_name, rating, relative_publish_time_description, text FROM review WHERE place_id = ? ORDER BY publish_time DESC",
+     ('x',)),
+    ('Live-Suche: Cache',
+     "SELECT response_json, last_updated FROM search_cache WHERE stadt = ? AND suchbegriff = ? ORDER BY last_updated DESC LIMIT 1",
+     ('x', 'y')),
+    ('Vertriebsnummer: PLZ',
+     "SELECT postal_code_id FROM postal_code WHERE postal_code = ?",
+     ('12345',)),
+    ('Vertriebsnummer: Text',
+     "SELECT event_gastro_text FROM plz_event_gastro WHERE postal_code_id = ? AND event_gastro_text IS NOT NULL AND event_gastro_text != '' LIMIT 1",
+     (1,)),
+    ('Städtedatensatz: Demografie eines Jahres',
+     "SELECT c.city_id, d.total_population, d.income FROM city c JOIN demographics d ON c.city_id = d.city_id WHERE d.year = ?",
+     (2022,)),
+    ('Städtedatensatz: Altersverteilung',
+     "SELECT d.city_id, ag.label, dad.count FROM demo_age_dist dad JOIN demographics d ON dad.demography_id = d.demography_id "
+     "JOIN age_group ag ON dad.age_group_id = ag.age_group_id WHERE d.year = ?",
+     (2022,)),
+)
+
+
+def explain_report(conn):
+    """Gibt den Abfrageplan der HOT_QUERIES aus; vollständige Tabellenscans werden markiert."""
+    print(f"--- EXPLAIN QUERY PLAN (Schema-Version {current_version(conn)}) ---")
+    for label, sql, params in HOT_QUERIES:
+        print(f"{label}:")
+        try:
+            plan = conn.execute(f"EXPLAIN QUERY PLAN {sql}", params).fetchall()
+        except sqlite3.Error as e:
+            print(f"    nicht verfügbar: {e}")
+            continue
+        for row in plan:
+            detail = row[-1]
+            full_scan = detail.startswith('SCAN') and 'INDEX' not in detail
+            print(f"    {detail}{'   <-- Tabellenscan' if full_scan else ''}")
+
+
+if __name__ == '__main__':
+    args = [arg for arg in sys.argv[1:] if not arg.startswith('--')]
+    connection = sqlite3.connect(args[0] if args else 'data.db')
+    try:
+        applied_versions = migrate(connection)
+        print(f"Schema-Version {current_version(connection)} ({len(applied_versions)} Migrationen angewendet).")
+        pending = pending_versions(connection)
+        if pending:
+            print(f"Zurückgestellt: {', '.join(map(str, pending))}")
+        if '--explain' in sys.argv or DB_DIAGNOSTICS:
+            explain_report(connection)
+    finally:
+        connection.close()
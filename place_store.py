@@ -0,0 +1,480 @@
+"""
+Speichert Ergebnisse der Google Places Suche gebündelt in der Datenbank.
+
+Ein Batch von API-Ergebnissen wird zuerst in Zeilenlisten pro Tabelle umgewandelt und danach
+mit executemany und festen Statements in einer einzigen Transaktion geschrieben. Für die
+Massensuche übernimmt ein eigener Writer-Thread (PlaceWriter) das Schreiben, sodass Abrufe
+und Speichern parallel laufen.
+"""
+import asyncio
+import json
+import os
+import queue
+import sqlite3
+import threading
+from collections import namedtuple
+from datetime import datetime, timedelta
+
+import db_pool
+from search_jobs import SQL_MARK_CITY_DONE
+
+# Feste Spaltenreihenfolge für die place-Tabelle
+PLACE_COLUMNS = (
+    'place_id', 'name', 'display_name', 'formatted_address', 'latitude', 'longitude',
+    'phone_number', 'website_uri', 'google_maps_uri', 'price_level', 'primary_type',
+    'city_id', 'last_updated', 'postal_code', 'supports_live_music', 'outdoor_seating',
+    'editorial_summary',
+)
+
+# UPSERT: fehlende Werte (NULL) überschreiben vorhandene Daten nicht
+SQL_UPSERT_PLACE = """
+    INSERT INTO place ({columns}) VALUES ({placeholders})
+    ON CONFLICT(place_id) DO UPDATE SET {setters}
+""".format(
+    columns=', '.join(PLACE_COLUMNS),
+    placeholders=', '.join(['?'] * len(PLACE_COLUMNS)),
+    setters=', '.join(f"{col} = COALESCE(excluded.{col}, place.{col})" for col in PLACE_COLUMNS if col != 'place_id'),
+)
+
+SQL_INSERT_PLACE_TYPE = "INSERT OR IGNORE INTO place_type (place_id, type) VALUES (?, ?)"
+
+SQL_INSERT_PLACE_SEARCH = """
+    INSERT OR IGNORE INTO place_search (term_id, city_id, place_id, search_timestamp)
+    VALUES (?, ?, ?, ?)
+"""
+
+SQL_INSERT_RATING = """
+    INSERT INTO rating_history (place_id, rating, user_rating_count, timestamp)
+    VALUES (?, ?, ?, ?)
+"""
+
+# Aktuelle Bewertung je Ort (entspricht dem neuesten rating_history-Eintrag); wird mit jeder
+# Bewertung mitgeschrieben, damit Leser nicht die ganze Historie durchsuchen müssen
+SQL_CREATE_RATING_CURRENT = """
+    CREATE TABLE IF NOT EXISTS place_rating_current (
+        place_id TEXT PRIMARY KEY,
+        rating REAL,
+        user_rating_count INTEGER,
+        updated_at TIMESTAMP
+    )
+"""
+
+SQL_UPSERT_RATING_CURRENT = """
+    INSERT INTO place_rating_current (place_id, rating, user_rating_count, updated_at)
+    VALUES (?, ?, ?, ?)
+    ON CONFLICT(place_id) DO UPDATE SET
+        rating = excluded.rating,
+        user_rating_count = excluded.user_rating_count,
+        updated_at = excluded.updated_at
+    WHERE excluded.updated_at >= place_rating_current.updated_at
+"""
+
+# Einmalige Befüllung aus der bestehenden Historie
+SQL_BACKFILL_RATING_CURRENT = """
+    INSERT OR REPLACE INTO place_rating_current (place_id, rating, user_rating_count, updated_at)
+    SELECT place_id, rating, user_rating_count, timestamp FROM (
+        SELECT
+            place_id, rating, user_rating_count, timestamp,
+            ROW_NUMBER() OVER (PARTITION BY place_id ORDER BY timestamp DESC) AS rn
+        FROM rating_history
+    )
+    WHERE rn = 1
+"""
+
+SQL_UPSERT_OPENING_HOURS = """
+    INSERT INTO opening_hours (place_id, weekday_text, periods_json)
+    VALUES (?, ?, ?)
+    ON CONFLICT(place_id) DO UPDATE SET
+        weekday_text = excluded.weekday_text,
+        periods_json = excluded.periods_json
+"""
+
+SQL_INSERT_REVIEW = """
+    INSERT OR IGNORE INTO review (
+        place_id, author_name, rating,
+        relative_publish_time_description, text, language_code, publish_time
+    )
+    VALUES (?, ?, ?, ?, ?, ?, ?)
+"""
+
+# Letzte erfolgreiche Suche je Suchbegriff und Stadt (auch ohne Treffer), Grundlage der inkrementellen Suche
+SQL_CREATE_SEARCH_LOG = """
+    CREATE TABLE IF NOT EXISTS city_search_log (
+        term_id INTEGER NOT NULL,
+        city_id INTEGER NOT NULL,
+        searched_at TIMESTAMP NOT NULL,
+        result_count INTEGER,
+        PRIMARY KEY (term_id, city_id)
+    )
+"""
+
+SQL_UPSERT_SEARCH_LOG = """
+    INSERT INTO city_search_log (term_id, city_id, searched_at, result_count)
+    VALUES (?, ?, ?, ?)
+    ON CONFLICT(term_id, city_id) DO UPDATE SET
+        searched_at = excluded.searched_at,
+        result_count = excluded.result_count
+"""
+
+# Zeilen eines Batches, je Tabelle eine Liste von Tupeln in der Spaltenreihenfolge des Statements
+PlaceBatch = namedtuple('PlaceBatch', ['places', 'place_types', 'place_searches', 'ratings', 'opening_hours', 'reviews', 'search_log', 'job_cities'])
+
+# Tabelle -> (Statement, Position der place_id im Tupel oder None), in Schreibreihenfolge
+_BATCH_TABLES = (
+    ('places', SQL_UPSERT_PLACE, 0),
+    ('place_types', SQL_INSERT_PLACE_TYPE, 0),
+    ('place_searches', SQL_INSERT_PLACE_SEARCH, 2),
+    ('ratings', SQL_INSERT_RATING, 0),
+    ('ratings', SQL_UPSERT_RATING_CURRENT, 0),
+    ('opening_hours', SQL_UPSERT_OPENING_HOURS, 0),
+    ('reviews', SQL_INSERT_REVIEW, 0),
+    ('search_log', SQL_UPSERT_SEARCH_LOG, None),
+    ('job_cities', SQL_MARK_CITY_DONE, None),
+)
+
+
+def _text(value):
+    """Liest das 'text'-Feld eines lokalisierten API-Objekts (z.B. displayName)."""
+    if value and value.get('text'):
+        return value['text']
+    return None
+
+
+def _postal_code(place_data):
+    """PLZ aus den addressComponents (erste gefundene)."""
+    for component in place_data.get('addressComponents') or []:
+        if 'postal_code' in component.get('types', []):
+            return component.get('longText') or component.get('shortText')
+    return None
+
+
+def _price_level(place_data):
+    price_level = place_data.get('priceLevel')
+    if isinstance(price_level, str):
+        return price_level.split('$')[-1].count('€')
+    return None
+
+
+def _publish_time(review):
+    publish_time_str = review.get('publishTime')
+    if not publish_time_str:
+        return None
+    try:
+        # ISO 8601 mit 'Z'
+        return datetime.fromisoformat(publish_time_str.replace('Z', '+00:00'))
+    except ValueError:
+        print(f"Warnung: Konnte publishTime '{publish_time_str}' für Review von {review.get('authorAttribution', {}).get('displayName')} nicht parsen.")
+        return None
+
+
+def collect_batch(term_id, results):
+    """
+    Wandelt API-Ergebnisse (je Stadt ein Dictionary mit 'city_id' und 'places') in Zeilenlisten um.
+
+    Ergebnisse mit 'error' und Orte ohne ID werden übersprungen.
+    """
+    batch = PlaceBatch([], [], [], [], [], [], [], [])
+    for result in results:
+        if "error" in result:
+            continue
+
+        city_id = result["city_id"]
+        city_display_name = result.get("city_display_name", f"Stadt ID {city_id}")
+        found_places = result.get("places", [])
+        batch.search_log.append((term_id, city_id, datetime.now(), len(found_places)))
+
+        # Explizit loggen, wenn keine Orte für eine Stadt gefunden wurden
+        if len(found_places) == 0:
+            print(f"Keine Orte zum Speichern für {city_display_name} (city_id: {city_id})")
+            continue
+
+        for place_data in found_places:
+            place_id = place_data.get('id')
+            if not place_id:
+                continue
+            now_ts = datetime.now()
+            location = place_data.get('location', {})
+            types = place_data.get('types') or []
+
+            batch.places.append((
+                place_id,
+                place_data.get('name'),
+                _text(place_data.get('displayName')),
+                place_data.get('formattedAddress'),
+                location.get('latitude'),
+                location.get('longitude'),
+                place_data.get('internationalPhoneNumber'),
+                place_data.get('websiteUri'),
+                place_data.get('googleMapsUri'),
+                _price_level(place_data),
+                types[0] if types else None,
+                city_id,
+                now_ts,
+                _postal_code(place_data),
+                place_data.get('liveMusic'),
+                place_data.get('outdoorSeating'),
+                _text(place_data.get('editorialSummary')),
+            ))
+            batch.place_types.extend((place_id, place_type) for place_type in types)
+            batch.place_searches.append((term_id, city_id, place_id, now_ts))
+
+            rating = place_data.get('rating')
+            user_rating_count = place_data.get('userRatingCount')
+            if rating is not None and user_rating_count is not None:
+                batch.ratings.append((place_id, rating, user_rating_count, now_ts))
+
+            opening_hours_data = place_data.get('regularOpeningHours')
+            if opening_hours_data:
+                batch.opening_hours.append((
+                    place_id,
+                    "\n".join(opening_hours_data.get('weekdayDescriptions', [])),
+                    json.dumps(opening_hours_data.get('periods', [])),
+                ))
+
+            for review in place_data.get('reviews') or []:
+                batch.reviews.append((
+                    place_id,
+                    review.get('authorAttribution', {}).get('displayName'),
+                    review.get('rating'),
+                    review.get('relativePublishTimeDescription'),
+                    review.get('text', {}).get('text'),
+                    review.get('text', {}).get('languageCode'),
+                    _publish_time(review),
+                ))
+    return batch
+
+
+# Position der city_id in den Zeilen der Tabellen, die eine Stadt als erledigt kennzeichnen
+_PLACE_CITY_POS = 11
+_CITY_TABLES = {'search_log': 1, 'job_cities': 2}
+
+
+def _write_rows_individually(cursor, batch):
+    """
+    Fallback: schreibt Zeile für Zeile und überspringt fehlerhafte Zeilen (und abhängige Zeilen eines Ortes).
+
+    Städte mit einem fehlgeschlagenen Ort werden weder im Suchprotokoll noch im Suchauftrag als
+    erledigt eingetragen, damit inkrementelle Suche und Fortsetzen sie erneut abfragen.
+    """
+    failed_places = set()
+    failed_cities = set()
+    for table, sql, place_pos in _BATCH_TABLES:
+        for row in getattr(batch, table):
+            if place_pos is not None and row[place_pos] in failed_places:
+                continue
+            if table in _CITY_TABLES and row[_CITY_TABLES[table]] in failed_cities:
+                continue
+            try:
+                cursor.execute(sql, row)
+            except sqlite3.Error as e:
+                print(f"FEHLER beim Speichern in {table} für {row[place_pos] if place_pos is not None else row}: {e}")
+                if table == 'places':
+                    failed_places.add(row[place_pos])
+                    failed_cities.add(row[_PLACE_CITY_POS])
+
+
+def write_batch_to_connection(conn, batch):
+    """
+    Schreibt einen PlaceBatch über eine bestehende Verbindung in einer Transaktion (executemany je Tabelle).
+
+    Schlägt eine Tabelle fehl, wird die Transaktion zurückgerollt und der Batch zeilenweise
+    geschrieben, damit einzelne fehlerhafte Datensätze nicht den ganzen Batch verwerfen.
+
+    Returns:
+        Anzahl geschriebener Orte
+    """
+    if not any(batch):
+        return 0
+    cursor = conn.cursor()
+    try:
+        with conn:
+            for table, sql, _ in _BATCH_TABLES:
+                rows = getattr(batch, table)
+                if rows:
+                    cursor.executemany(sql, rows)
+    except sqlite3.Error as e:
+        print(f"FEHLER beim gebündelten Speichern ({e}), speichere zeilenweise...")
+        with conn:
+            _write_rows_individually(cursor, batch)
+    return len(batch.places)
+
+
+def write_batch(db_path, batch):
+    """Schreibt einen PlaceBatch über eine eigene, kurzlebige Verbindung (siehe write_batch_to_connection)."""
+    if not any(batch):
+        return 0
+    conn = db_pool.connect(db_path)
+    try:
+        return write_batch_to_connection(conn, batch)
+    finally:
+        conn.close()
+
+
+# Merkt sich pro Stadt, ob die Suche zuletzt nur mit locationBias Treffer lieferte
+SQL_CREATE_SEARCH_HINT = """
+    CREATE TABLE IF NOT EXISTS city_search_hint (
+        city_id INTEGER PRIMARY KEY,
+        needs_location_bias INTEGER NOT NULL,
+        updated_at TIMESTAMP
+    )
+"""
+
+
+def load_search_hints(conn, city_id=None):
+    """Gibt {city_id: braucht locationBias} zurück (alle Städte oder nur city_id)."""
+    if city_id is None:
+        rows = conn.execute("SELECT city_id, needs_location_bias FROM city_search_hint").fetchall()
+    else:
+        rows = conn.execute("SELECT city_id, needs_location_bias FROM city_search_hint WHERE city_id = ?", (city_id,)).fetchall()
+    return {row[0]: bool(row[1]) for row in rows}
+
+
+def save_search_hints(conn, hints):
+    """Speichert geänderte Hinweise {city_id: braucht locationBias}."""
+    if not hints:
+        return
+    now = datetime.now()
+    with conn:
+        conn.executemany(
+            """
+            INSERT INTO city_search_hint (city_id, needs_location_bias, updated_at) VALUES (?, ?, ?)
+            ON CONFLICT(city_id) DO UPDATE SET
+                needs_location_bias = excluded.needs_location_bias,
+                updated_at = excluded.updated_at
+            """,
+            [(city_id, int(needed), now) for city_id, needed in hints.items()]
+        )
+
+
+def fresh_city_ids(conn, term_id, max_age_days):
+    """
+    Städte, für die der Suchbegriff innerhalb der letzten max_age_days Tage gesucht wurde.
+
+    Berücksichtigt place_search.search_timestamp und city_search_log (dort stehen auch Suchen ohne Treffer).
+    """
+    cutoff = datetime.now() - timedelta(days=max_age_days)
+    rows = conn.execute(
+        """
+        SELECT city_id FROM place_search WHERE term_id = ? AND search_timestamp >= ?
+        UNION
+        SELECT city_id FROM city_search_log WHERE term_id = ? AND searched_at >= ?
+        """,
+        (term_id, cutoff, term_id, cutoff)
+    ).fetchall()
+    return {row[0] for row in rows}
+
+
+# Maximale Anzahl Stadt-Ergebnisse in der Warteschlange des Writers (Rückstau für die Abrufe)
+WRITER_QUEUE_SIZE = int(os.environ.get('PLACE_WRITER_QUEUE_SIZE', 100))
+
+# Maximale Anzahl Stadt-Ergebnisse, die der Writer in einer Transaktion zusammenfasst
+WRITER_MAX_GROUP = int(os.environ.get('PLACE_WRITER_MAX_GROUP', 50))
+
+_STOP = object()
+
+
+class PlaceWriter:
+    """
+    Eigener Thread, der Suchergebnisse aus einer begrenzten Warteschlange in die Datenbank schreibt.
+
+    Der Thread hält eine langlebige SQLite-Verbindung. Alles, was beim Abholen bereits in der
+    Warteschlange liegt, wird in einer Transaktion geschrieben. Ist die Warteschlange voll,
+    warten die Abrufe (submit), bis der Writer aufgeholt hat. Bricht der Thread mit einem
+    Fehler ab (z.B. Verbindung nicht möglich), lösen put/submit und close diesen Fehler aus,
+    statt auf eine Warteschlange zu warten, die niemand mehr leert.
+    """
+
+    def __init__(self, db_path, term_id, queue_size=None, max_group=None, job_id=None):
+        self.db_path = db_path
+        self.term_id = term_id
+        # Optional: Suchauftrag, dessen Städte mit ihren Ergebnissen als erledigt markiert werden
+        self.job_id = job_id
+        self.max_group = max_group or WRITER_MAX_GROUP
+        self.places_written = 0
+        self.results_written = 0
+        self._queue = queue.Queue(maxsize=queue_size or WRITER_QUEUE_SIZE)
+        # Fehler, mit dem der Thread abgebrochen ist
+        self._error = None
+        self._thread = threading.Thread(target=self._run, name=f'place-writer-{term_id}', daemon=True)
+
+    def start(self):
+        self._thread.start()
+        return self
+
+    def _check_running(self):
+        if not self._thread.is_alive():
+            raise RuntimeError(f"Place-Writer läuft nicht mehr: {self._error or 'bereits beendet'}") from self._error
+
+    def put(self, result):
+        """Reiht ein Stadt-Ergebnis ein (blockiert, solange die Warteschlange voll ist und der Writer läuft)."""
+        while True:
+            self._check_running()
+            try:
+                self._queue.put(result, timeout=0.5)
+                return
+            except queue.Full:
+                continue
+
+    async def submit(self, result):
+        """Wie put, aber ohne den Event-Loop zu blockieren, wenn die Warteschlange voll ist."""
+        self._check_running()
+        try:
+            self._queue.put_nowait(result)
+        except queue.Full:
+            await asyncio.to_thread(self.put, result)
+
+    def close(self):
+        """
+        Schreibt alle noch wartenden Ergebnisse und beendet den Thread (mehrfacher Aufruf möglich).
+
+        Raises:
+            RuntimeError: wenn der Thread mit einem Fehler abgebrochen ist
+        """
+        if self._thread.is_alive():
+            try:
+                self.put(_STOP)
+            except RuntimeError:
+                pass
+            self._thread.join()
+        if self._error is not None:
+            raise RuntimeError(f"Place-Writer abgebrochen: {self._error}") from self._error
+
+    def _next_group(self):
+        """Wartet auf das nächste Ergebnis und nimmt alle bereits wartenden dazu (bis max_group)."""
+        group = [self._queue.get()]
+        while len(group) < self.max_group and group[-1] is not _STOP:
+            try:
+                group.append(self._queue.get_nowait())
+            except queue.Empty:
+                break
+        return group
+
+    def _run(self):
+        try:
+            self._write_loop()
+        except BaseException as e:
+            self._error = e
+            print(f"FEHLER: Place-Writer abgebrochen: {e}")
+
+    def _write_loop(self):
+        conn = db_pool.connect(self.db_path)
+        try:
+            stop = False
+            while not stop:
+                group = self._next_group()
+                if group[-1] is _STOP:
+                    stop = True
+                    group.pop()
+                if not group:
+                    continue
+                try:
+                    batch = collect_batch(self.term_id, group)
+                    if self.job_id is not None:
+                        now = datetime.now()
+                        batch.job_cities.extend((now, self.job_id, result['city_id']) for result in group if "error" not in result)
+                    self.places_written += write_batch_to_connection(conn, batch)
+                    self.results_written += len(group)
+                except Exception as e:
+                    print(f"FEHLER im Place-Writer beim Speichern von {len(group)} Ergebnissen: {e}")
+        finally:
+            conn.close()
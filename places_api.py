@@ -0,0 +1,337 @@
+"""
+Gemeinsame Ratenbegrenzung für Anfragen an die Google Places API.
+
+Ein Token-Bucket begrenzt alle Anfragen des Prozesses (asynchrone Massensuche und synchrone
+Live-Suche) auf eine konfigurierbare Anzahl pro Minute (QPM). Antwortet die API mit 429 oder
+503, wird die Rate halbiert und bis zum Ablauf von Retry-After pausiert; jede erfolgreiche
+Anfrage hebt die Rate wieder schrittweise an (AIMD), höchstens bis zum konfigurierten Limit.
+
+Gleiche Suchanfragen (Suchtext, Feldmaske, Koordinaten), die gleichzeitig laufen, werden
+zusammengefasst: Nur der erste Aufrufer fragt die API ab, alle weiteren warten auf dessen
+Ergebnis (InFlightRegistry).
+
+Verbindungen werden wiederverwendet: synchrone Aufrufer teilen sich eine requests.Session mit
+Connection-Pool, die Massensuche läuft auf einem dauerhaften Event-Loop in einem eigenen
+Thread mit einer langlebigen aiohttp.ClientSession (Keep-Alive, DNS-Cache).
+"""
+import asyncio
+import atexit
+import os
+import threading
+import time
+from concurrent.futures import Future
+from datetime import datetime, timezone
+from email.utils import parsedate_to_datetime
+
+import aiohttp
+import requests
+from requests.adapters import HTTPAdapter
+
+# Obergrenze der Anfragen pro Minute (Kontingent der Places API)
+PLACES_API_QPM = float(os.environ.get('PLACES_API_QPM', 500))
+
+# Untergrenze, auf die die Rate bei wiederholtem 429 höchstens abgesenkt wird
+PLACES_API_MIN_QPM = float(os.environ.get('PLACES_API_MIN_QPM', 30))
+
+# Anzahl Anfragen, die nach einer Pause sofort gestartet werden dürfen
+PLACES_API_BURST = float(os.environ.get('PLACES_API_BURST', 10))
+
+# Erhöhung der Rate (QPM) pro erfolgreicher Anfrage nach einer Drosselung
+PLACES_API_QPM_STEP = float(os.environ.get('PLACES_API_QPM_STEP', 5))
+
+# Wiederholungen einer Anfrage nach 429/503
+PLACES_API_MAX_RETRIES = int(os.environ.get('PLACES_API_MAX_RETRIES', 3))
+
+# Pause, wenn die API keinen Retry-After-Header mitschickt (Sekunden)
+DEFAULT_RETRY_AFTER = 2.0
+
+THROTTLE_STATUS_CODES = (429, 503)
+
+# Maximale Anzahl offener Verbindungen zur API (je Client)
+PLACES_HTTP_POOL_SIZE = int(os.environ.get('PLACES_HTTP_POOL_SIZE', 10))
+
+# Timeouts für Verbindungsaufbau und Antwort (Sekunden)
+PLACES_HTTP_CONNECT_TIMEOUT = float(os.environ.get('PLACES_HTTP_CONNECT_TIMEOUT', 5))
+PLACES_HTTP_READ_TIMEOUT = float(os.environ.get('PLACES_HTTP_READ_TIMEOUT', 30))
+
+# Gültigkeit von DNS-Einträgen im aiohttp-Connector (Sekunden)
+PLACES_DNS_CACHE_TTL = int(os.environ.get('PLACES_DNS_CACHE_TTL', 300))
+
+
+def parse_retry_after(value):
+    """Retry-After als Sekunden (Ganzzahl oder HTTP-Datum); None, wenn nicht lesbar."""
+    if not value:
+        return None
+    try:
+        return max(0.0, float(value))
+    except ValueError:
+        pass
+    try:
+        retry_at = parsedate_to_datetime(value)
+    except (TypeError, ValueError):
+        return None
+    if retry_at.tzinfo is None:
+        retry_at = retry_at.replace(tzinfo=timezone.utc)
+    return max(0.0, (retry_at - datetime.now(timezone.utc)).total_seconds())
+
+
+class RateLimiter:
+    """
+    Thread-sicherer Token-Bucket mit adaptiver Rate, nutzbar aus Threads und Coroutinen.
+
+    Jede Anfrage reserviert ein Token; ist der Bucket leer, wartet sie so lange, bis ihr
+    Token nachgefüllt ist. Dadurch bleibt die Reihenfolge fair und die Rate exakt.
+    """
+
+    def __init__(self, qpm=PLACES_API_QPM, min_qpm=PLACES_API_MIN_QPM, burst=PLACES_API_BURST, step=PLACES_API_QPM_STEP):
+        self.max_qpm = qpm
+        self.min_qpm = min(min_qpm, qpm)
+        self.qpm = qpm
+        self.burst = burst
+        self.step = step
+        self.tokens = burst
+        self.throttled = 0
+        self._updated = time.monotonic()
+        self._blocked_until = 0.0
+        self._lock = threading.Lock()
+
+    def _refill(self, now):
+        self.tokens = min(self.burst, self.tokens + (now - self._updated) * self.qpm / 60)
+        self._updated = now
+
+    def reserve(self):
+        """Reserviert ein Token und gibt die nötige Wartezeit in Sekunden zurück."""
+        with self._lock:
+            now = time.monotonic()
+            self._refill(now)
+            self.tokens -= 1
+            wait = -self.tokens * 60 / self.qpm if self.tokens < 0 else 0.0
+            return max(wait, self._blocked_until - now)
+
+    def acquire(self):
+        """Wartet (blockierend) auf ein Token."""
+        wait = self.reserve()
+        if wait > 0:
+            time.sleep(wait)
+
+    async def acquire_async(self):
+        """Wartet auf ein Token, ohne den Event-Loop zu blockieren."""
+        wait = self.reserve()
+        if wait > 0:
+            await asyncio.sleep(wait)
+
+    def on_success(self):
+        """Additive Erhöhung der Rate nach einer erfolgreichen Anfrage."""
+        with self._lock:
+            if self.qpm < self.max_qpm:
+                self._refill(time.monotonic())
+                self.qpm = min(self.max_qpm, self.qpm + self.step)
+
+    def on_throttle(self, retry_after=None):
+        """Multiplikative Senkung der Rate und Pause nach 429/503."""
+        with self._lock:
+            now = time.monotonic()
+            self._refill(now)
+            self.throttled += 1
+            # Gleichzeitige 429-Antworten derselben Überlastung senken die Rate nur einmal
+            if now >= self._blocked_until:
+                self.qpm = max(self.min_qpm, self.qpm / 2)
+            pause = retry_after if retry_after is not None else DEFAULT_RETRY_AFTER
+            self._blocked_until = max(self._blocked_until, now + pause)
+            # Angesammelte Tokens verwerfen, damit nach der Pause kein voller Burst folgt
+            self.tokens = min(self.tokens, 1)
+            print(f"Places API drosselt (Anfrage #{self.throttled}): Rate auf {self.qpm:.0f} QPM gesenkt, Pause {pause:.1f} s.")
+
+
+# Prozessweiter Limiter für alle Places-Anfragen
+limiter = RateLimiter()
+
+
+_http_session = None
+_http_session_lock = threading.Lock()
+
+
+def get_http_session():
+    """Prozessweite requests.Session mit Connection-Pool (Keep-Alive) für synchrone Aufrufe."""
+    global _http_session
+    with _http_session_lock:
+        if _http_session is None:
+            session = requests.Session()
+            adapter = HTTPAdapter(pool_connections=1, pool_maxsize=PLACES_HTTP_POOL_SIZE)
+            session.mount('https://', adapter)
+            session.mount('http://', adapter)
+            _http_session = session
+        return _http_session
+
+
+class _AsyncRuntime:
+    """Dauerhafter Event-Loop in einem Daemon-Thread mit einer langlebigen aiohttp.ClientSession."""
+
+    def __init__(self):
+        self.loop = None
+        self.session = None
+        self._lock = threading.Lock()
+
+    def _ensure_loop(self):
+        with self._lock:
+            if self.loop is None:
+                loop = asyncio.new_event_loop()
+                threading.Thread(target=loop.run_forever, name='places-api-loop', daemon=True).start()
+                self.loop = loop
+            return self.loop
+
+    def run(self, coro):
+        """Führt eine Coroutine auf dem Loop aus und wartet (blockierend) auf das Ergebnis."""
+        return asyncio.run_coroutine_threadsafe(coro, self._ensure_loop()).result()
+
+    async def get_session(self):
+        # Wird nur auf dem eigenen Loop aufgerufen, daher ohne Lock
+        if self.session is None or self.session.closed:
+            connector = aiohttp.TCPConnector(limit=PLACES_HTTP_POOL_SIZE, ttl_dns_cache=PLACES_DNS_CACHE_TTL)
+            timeout = aiohttp.ClientTimeout(sock_connect=PLACES_HTTP_CONNECT_TIMEOUT, sock_read=PLACES_HTTP_READ_TIMEOUT)
+            self.session = aiohttp.ClientSession(connector=connector, timeout=timeout)
+        return self.session
+
+    def close(self):
+        if self.loop is None:
+            return
+        if self.session is not None and not self.session.closed:
+            try:
+                asyncio.run_coroutine_threadsafe(self.session.close(), self.loop).result(timeout=5)
+            except Exception as e:
+                print(f"Fehler beim Schließen der aiohttp-Session: {e}")
+        self.loop.call_soon_threadsafe(self.loop.stop)
+
+
+_async_runtime = _AsyncRuntime()
+
+atexit.register(_async_runtime.close)
+
+
+def run_async(coro):
+    """Führt eine Coroutine auf dem gemeinsamen API-Event-Loop aus (blockiert den aufrufenden Thread)."""
+    return _async_runtime.run(coro)
+
+
+async def get_async_session():
+    """Langlebige aiohttp.ClientSession; nur innerhalb von run_async verwenden."""
+    return await _async_runtime.get_session()
+
+
+def post(url, headers, payload):
+    """Synchrone POST-Anfrage über den Limiter; wiederholt 429/503 bis PLACES_API_MAX_RETRIES."""
+    for attempt in range(PLACES_API_MAX_RETRIES + 1):
+        limiter.acquire()
+        response = get_http_session().post(
+            url, headers=headers, json=payload,
+            timeout=(PLACES_HTTP_CONNECT_TIMEOUT, PLACES_HTTP_READ_TIMEOUT)
+        )
+        if response.status_code in THROTTLE_STATUS_CODES and attempt < PLACES_API_MAX_RETRIES:
+            limiter.on_throttle(parse_retry_after(response.headers.get('Retry-After')))
+            continue
+        if response.ok:
+            limiter.on_success()
+        return response
+
+
+async def post_async(session, url, headers, payload):
+    """
+    Asynchrone POST-Anfrage über den Limiter (aiohttp); wiederholt 429/503 bis PLACES_API_MAX_RETRIES.
+
+    Returns:
+        (HTTP-Status, JSON-Antwort bei 200 sonst Antworttext)
+    """
+    for attempt in range(PLACES_API_MAX_RETRIES + 1):
+        await limiter.acquire_async()
+        async with session.post(url, headers=headers, json=payload) as response:
+            if response.status in THROTTLE_STATUS_CODES and attempt < PLACES_API_MAX_RETRIES:
+                limiter.on_throttle(parse_retry_after(response.headers.get('Retry-After')))
+                continue
+            if response.status == 200:
+                limiter.on_success()
+                return response.status, await response.json()
+            return response.status, await response.text()
+
+
+class InFlightRegistry:
+    """
+    Registry laufender Anfragen: gleiche Schlüssel teilen sich ein Future.
+
+    Funktioniert über Threads (Flask-Requests) und Event-Loops (Massensuche) hinweg, da ein
+    concurrent.futures.Future verwendet wird.
+    """
+
+    def __init__(self):
+        self._futures = {}
+        self._lock = threading.Lock()
+        self.coalesced = 0
+
+    def claim(self, key):
+        """Gibt (Future, True) für den ersten Aufrufer zurück, sonst das laufende Future und False."""
+        with self._lock:
+            future = self._futures.get(key)
+            if future is not None:
+                self.coalesced += 1
+                return future, False
+            future = Future()
+            self._futures[key] = future
+            return future, True
+
+    def resolve(self, key, future, result=None, exception=None):
+        """Entfernt den Schlüssel und setzt das Ergebnis für alle Wartenden."""
+        with self._lock:
+            if self._futures.get(key) is future:
+                del self._futures[key]
+        if future.done():
+            return
+        if exception is not None:
+            future.set_exception(exception)
+        else:
+            future.set_result(result)
+
+
+# Prozessweite Registry für Textsuchen
+in_flight = InFlightRegistry()
+
+
+def request_key(query, fields_mask='*', latitude=None, longitude=None):
+    """Schlüssel einer Textsuche: normalisierter Suchtext, Feldmaske und (gerundete) Koordinaten."""
+    normalized_query = ' '.join(query.casefold().split())
+    location = None
+    if latitude is not None and longitude is not None:
+        location = (round(float(latitude), 4), round(float(longitude), 4))
+    return normalized_query, fields_mask, location
+
+
+def coalesce(key, fetch):
+    """Führt fetch() aus oder wartet auf eine bereits laufende Anfrage mit gleichem Schlüssel."""
+    future, owner = in_flight.claim(key)
+    if not owner:
+        print(f"Anfrage '{key[0]}' läuft bereits, verwende deren Ergebnis.")
+        return future.result()
+    try:
+        result = fetch()
+    except BaseException as e:
+        in_flight.resolve(key, future, exception=e)
+        raise
+    in_flight.resolve(key, future, result)
+    return result
+
+
+async def coalesce_async(key, fetch):
+    """Wie coalesce, für Coroutine-Funktionen; Wartende werden nicht vom Abbruch anderer betroffen."""
+    future, owner = in_flight.claim(key)
+    if not owner:
+        print(f"Anfrage '{key[0]}' läuft bereits, verwende deren Ergebnis.")
+        # shield: ein abgebrochener Wartender (z.B. Timeout) darf das gemeinsame Future nicht abbrechen
+        return await asyncio.shield(asyncio.wrap_future(future))
+    try:
+        result = await fetch()
+    except asyncio.CancelledError:
+        in_flight.resolve(key, future, exception=asyncio.TimeoutError(f"Anfrage '{key[0]}' wurde abgebrochen"))
+        raise
+    except BaseException as e:
+        in_flight.resolve(key, future, exception=e)
+        raise
+    in_flight.resolve(key, future, result)
+    return result
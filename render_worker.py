@@ -0,0 +1,46 @@
+"""
+Einstiegspunkt der Render-Prozesse von chart_renderer.
+
+Die Worker importieren nur dieses Modul (und darüber utils und figure_pool), nicht app.py:
+chart_renderer startet sie ohne das Hauptskript des Elternprozesses.
+"""
+
+
+def warm_up():
+    """Initialisierung der Worker: schwere Importe einmalig beim Start ausführen."""
+    import matplotlib
+    matplotlib.use('Agg')
+    import seaborn  # noqa: F401
+    import utils  # noqa: F401
+
+
+def render_png(chart_type, *args):
+    """
+    Rendert ein Diagramm nach Typ und gibt die PNG-Bytes zurück (läuft im Worker-Prozess).
+
+    Typen:
+        'cities': (cities_df, start_rank, x_min, global_max) -> Balkendiagramm
+        'pie': (city_row,) -> Kreisdiagramm einer Stadt
+        'scatter': (df,) -> Scatter-Plot Einwohner vs. Einkommen
+        'clustering': (df, clustering) -> Clustering Einwohner/Einkommen
+        'clustering2': (df, clustering) -> Clustering Einwohner/Zielgruppe
+    """
+    import figure_pool
+    import utils
+
+    if chart_type == 'cities':
+        cities_df, start_rank, x_min, global_max = args
+        fig = utils.generate_cities_chart(cities_df, start_rank, x_min=x_min, global_max=global_max)
+    elif chart_type == 'pie':
+        fig = utils.generate_city_pie_chart(args[0])
+    elif chart_type == 'scatter':
+        fig = utils.generate_scatter_plot(args[0])
+    elif chart_type == 'clustering':
+        df, clustering = args
+        fig, _ = utils.perform_clustering(df, n_clusters=clustering.n_clusters, clustering=clustering)
+    elif chart_type == 'clustering2':
+        df, clustering = args
+        fig, _ = utils.perform_clustering_population_target(df, n_clusters=clustering.n_clusters, clustering=clustering)
+    else:
+        raise ValueError(f'Unbekannter Diagrammtyp: {chart_type}')
+    return figure_pool.figure_to_png(fig)
@@ -0,0 +1,166 @@
+"""Vektorisierte Normalisierung, Score- und Rangberechnung für die Städteanalyse."""
+import numpy as np
+import pandas as pd
+
+from utils import normalize
+
+# Spalten, die in den Score einfließen, in der Reihenfolge der Gewichte (w_pop, w_age, w_income)
+SCORE_COLUMNS = ('total', 'target_group_percent', 'Einkommen_2022')
+
+
+def normalize_array(values):
+    """
+    Min-Max-Normalisierung eines Arrays auf [0, 1].
+
+    Bei konstanten Werten (max == min) wird 0 zurückgegeben, wie bisher in process_data.
+    """
+    values = np.asarray(values, dtype=float)
+    if values.size == 0:
+        return values
+    min_val, max_val = values.min(), values.max()
+    if not max_val > min_val:
+        return np.zeros_like(values)
+    return normalize(values, min_val, max_val)
+
+
+def feature_matrix(df):
+    """Normalisierte Merkmalsmatrix (Städte × 3) in der Reihenfolge von SCORE_COLUMNS."""
+    columns = []
+    for col in SCORE_COLUMNS:
+        values = pd.to_numeric(df[col], errors='coerce').fillna(0).to_numpy(dtype=float)
+        columns.append(normalize_array(values))
+    return np.column_stack(columns) if columns[0].size else np.empty((0, len(SCORE_COLUMNS)))
+
+
+def normalize_weights(weights):
+    """
+    Normiert Gewichtsvektoren (w_pop, w_age, w_income) zeilenweise auf Summe 1.
+
+    Args:
+        weights: Ein Vektor der Länge 3 oder eine Matrix (Anzahl Gewichtungen × 3)
+
+    Returns:
+        Matrix (Anzahl Gewichtungen × 3); Zeilen mit Summe 0 bleiben unverändert
+    """
+    weights = np.atleast_2d(np.asarray(weights, dtype=float))
+    totals = weights.sum(axis=1, keepdims=True)
+    totals[totals == 0] = 1  # Verhindere Division durch 0
+    return weights / totals
+
+
+def weighted_score(features, w_pop, w_age, w_income):
+    """Score je Stadt für eine Gewichtung (Gewichte werden auf Summe 1 normiert)."""
+    w_pop, w_age, w_income = normalize_weights([w_pop, w_age, w_income])[0]
+    return features[:, 0] * w_pop + features[:, 2] * w_income + features[:, 1] * w_age
+
+
+def score_matrix(features, weights):
+    """Scores für mehrere Gewichtungen auf einmal: Matrix (Gewichtungen × Städte)."""
+    return normalize_weights(weights) @ features.T
+
+
+def rank_scores(scores):
+    """
+    Rang je Stadt (1 = höchster Score) entlang der letzten Achse.
+
+    Bei Gleichstand entscheidet die ursprüngliche Reihenfolge (stabile Sortierung).
+    """
+    scores = np.asarray(scores, dtype=float)
+    order = np.argsort(-scores, axis=-1, kind='stable')
+    ranks = np.empty_like(order)
+    np.put_along_axis(ranks, order, np.broadcast_to(np.arange(1, scores.shape[-1] + 1), order.shape), axis=-1)
+    return ranks
+
+
+def apply_scores(df, w_pop, w_age, w_income):
+    """Ergänzt df um norm_pop, norm_income, norm_target und score (wie bisher in den Routen)."""
+    features = feature_matrix(df)
+    df['norm_pop'] = features[:, 0]
+    df['norm_income'] = features[:, 2]
+    df['norm_target'] = features[:, 1]
+    df['score'] = weighted_score(features, w_pop, w_age, w_income)
+    return df
+
+
+def normalize_columns(matrix):
+    """Min-Max-Normalisierung jeder Spalte einer Matrix (konstante Spalten -> 0)."""
+    matrix = np.asarray(matrix, dtype=float)
+    min_vals = matrix.min(axis=0)
+    spans = matrix.max(axis=0) - min_vals
+    with np.errstate(divide='ignore', invalid='ignore'):
+        normalized = (matrix - min_vals) / spans
+    normalized[:, ~(spans > 0)] = 0
+    return normalized
+
+
+def weight_simplex_grid(step):
+    """Alle Gewichtungen (w_pop, w_age, w_income) im Raster `step`, deren Summe 1 ergibt."""
+    n = int(round(1 / step))
+    return [(i / n, j / n, (n - i - j) / n) for i in range(n + 1) for j in range(n + 1 - i)]
+
+
+class RankStability:
+    """Laufende Rangstatistik je Stadt (Mittelwert/Streuung nach Welford, Min/Max, Top-N-Anteil)."""
+
+    def __init__(self, n_cities, top_n=10):
+        self.top_n = top_n
+        self.count = 0
+        self.mean = np.zeros(n_cities)
+        self.m2 = np.zeros(n_cities)
+        self.min = np.full(n_cities, np.inf)
+        self.max = np.zeros(n_cities)
+        self.top_hits = np.zeros(n_cities, dtype=int)
+
+    def update(self, ranks):
+        """Nimmt eine Matrix (Parameter-Sets × Städte) von Rängen auf."""
+        for row in np.atleast_2d(ranks):
+            self.count += 1
+            delta = row - self.mean
+            self.mean += delta / self.count
+            self.m2 += delta * (row - self.mean)
+            np.minimum(self.min, row, out=self.min)
+            np.maximum(self.max, row, out=self.max)
+            self.top_hits += row <= self.top_n
+
+    def summary(self):
+        """Statistik als Dictionary mit Listen (Reihenfolge der Städte wie beim Aufbau)."""
+        std = np.sqrt(self.m2 / self.count) if self.count else np.zeros_like(self.mean)
+        return {
+            'parameter_sets': self.count,
+            'mean_rank': self.mean.round(3).tolist(),
+            'std_rank': std.round(3).tolist(),
+            'min_rank': self.min.astype(int).tolist() if self.count else [],
+            'max_rank': self.max.astype(int).tolist() if self.count else [],
+            f'top{self.top_n}_share': (self.top_hits / self.count).round(4).tolist() if self.count else [],
+        }
+
+
+def sweep_scores(engine, df, age_ranges, weights, chunk_size=64):
+    """
+    Berechnet Scores und Ränge für alle Kombinationen aus Altersbereichen und Gewichtungen.
+
+    Die Altersbereiche werden blockweise über die Zielgruppen-Engine ausgewertet, pro
+    Altersbereich entsteht eine Score-Matrix (Gewichtungen × Städte). Der Speicherbedarf
+    hängt daher nur von chunk_size und der Anzahl Gewichtungen ab, nicht von der Rastergröße.
+
+    Args:
+        engine: TargetGroupEngine, deren Zeilen mit df übereinstimmen
+        df: DataFrame mit 'total' und 'Einkommen_2022'
+        age_ranges: Liste von (min_age, max_age)
+        weights: Liste von (w_pop, w_age, w_income)
+
+    Yields:
+        (min_age, max_age, Gewichte normiert (k × 3), Scores (k × Städte), Ränge (k × Städte))
+    """
+    pop = normalize_array(pd.to_numeric(df['total'], errors='coerce').fillna(0))
+    income = normalize_array(pd.to_numeric(df['Einkommen_2022'], errors='coerce').fillna(0))
+    norm_weights = normalize_weights(weights)
+
+    for start in range(0, len(age_ranges), chunk_size):
+        chunk = age_ranges[start:start + chunk_size]
+        # Zielgruppenanteile (Städte × Altersbereiche), spaltenweise normalisiert
+        targets = normalize_columns(engine.share_grid(chunk))
+        for j, (min_age, max_age) in enumerate(chunk):
+            features = np.column_stack([pop, targets[:, j], income])
+            scores = norm_weights @ features.T
+            yield min_age, max_age, norm_weights, scores, rank_scores(scores)
@@ -0,0 +1,313 @@
+"""
+Persistente Suchaufträge für die Massensuche.
+
+Jede Massensuche legt einen Auftrag (search_job) mit dem Zustand jeder Stadt an
+(search_job_city: pending/done/failed, Anzahl Versuche, letzter Fehler). Erfolgreiche Städte
+werden vom PlaceWriter in derselben Transaktion wie ihre Ergebnisse als erledigt markiert.
+Bricht der Prozess ab, kann der Auftrag daher ab diesem Stand fortgesetzt werden, ohne
+bereits gespeicherte Städte erneut abzufragen.
+
+Welcher Prozess einen Auftrag ausführt, steht ebenfalls in search_job: Der ausführende Prozess
+hält eine Lease (owner) und erneuert updated_at regelmäßig (heartbeat). Ein Auftrag mit
+Status 'running', dessen updated_at älter als JOB_LEASE_SECONDS ist, gilt als unterbrochen und
+kann von jedem Worker-Prozess übernommen werden (claim_job); so läuft er auch bei mehreren
+Workern nie doppelt.
+"""
+import os
+import socket
+import threading
+import uuid
+from datetime import datetime, timedelta
+
+# Maximale Versuche pro Stadt und Lauf, bevor sie als endgültig fehlgeschlagen gilt
+JOB_MAX_ATTEMPTS = int(os.environ.get('SEARCH_JOB_MAX_ATTEMPTS', 3))
+
+# Wartezeit vor dem ersten erneuten Versuch (Sekunden); verdoppelt sich mit jedem weiteren Versuch
+JOB_RETRY_DELAY = float(os.environ.get('SEARCH_JOB_RETRY_DELAY', 30))
+
+# Ohne Heartbeat so lange (Sekunden) gilt ein laufender Auftrag als verwaist und kann übernommen werden
+JOB_LEASE_SECONDS = float(os.environ.get('SEARCH_JOB_LEASE_SECONDS', 60))
+
+# Abstand der Heartbeats eines laufenden Auftrags (Sekunden)
+JOB_HEARTBEAT_INTERVAL = JOB_LEASE_SECONDS / 3
+
+# Kennung dieses Prozesses als Lease-Inhaber (Host, PID und Zufallsteil gegen wiederverwendete PIDs)
+OWNER_ID = f"{socket.gethostname()}:{os.getpid()}:{uuid.uuid4().hex[:8]}"
+
+# Auftragsstatus: running, completed, incomplete (Städte endgültig fehlgeschlagen), cancelled, interrupted
+SQL_CREATE_SEARCH_JOB = """
+    CREATE TABLE IF NOT EXISTS search_job (
+        job_id INTEGER PRIMARY KEY AUTOINCREMENT,
+        term_id INTEGER NOT NULL,
+        status TEXT NOT NULL,
+        created_at TIMESTAMP NOT NULL,
+        updated_at TIMESTAMP NOT NULL,
+        finished_at TIMESTAMP,
+        message TEXT
+    )
+"""
+
+SQL_CREATE_SEARCH_JOB_CITY = """
+    CREATE TABLE IF NOT EXISTS search_job_city (
+        job_id INTEGER NOT NULL,
+        city_id INTEGER NOT NULL,
+        state TEXT NOT NULL DEFAULT 'pending',
+        attempts INTEGER NOT NULL DEFAULT 0,
+        last_error TEXT,
+        updated_at TIMESTAMP,
+        PRIMARY KEY (job_id, city_id)
+    )
+"""
+
+# Wird vom PlaceWriter zusammen mit den Ergebnissen der Stadt geschrieben (updated_at, job_id, city_id)
+SQL_MARK_CITY_DONE = """
+    UPDATE search_job_city
+    SET state = 'done', attempts = attempts + 1, last_error = NULL, updated_at = ?
+    WHERE job_id = ? AND city_id = ?
+"""
+
+SQL_MARK_CITY_FAILED = """
+    UPDATE search_job_city
+    SET state = 'failed', attempts = attempts + 1, last_error = ?, updated_at = ?
+    WHERE job_id = ? AND city_id = ?
+"""
+
+FINISHED_STATUSES = ('completed', 'cancelled')
+
+# Kein anderer Auftrag für denselben Suchbegriff hält eine gültige Lease (Parameter: Ablaufgrenze)
+_SQL_NO_OTHER_RUNNING_JOB = """
+    NOT EXISTS (
+        SELECT 1 FROM search_job other
+        WHERE other.term_id = search_job.term_id AND other.job_id != search_job.job_id
+          AND other.status = 'running' AND other.updated_at >= ?
+    )
+"""
+
+# Aufträge, die in diesem Prozess laufen: job_id -> Abbruch-Event
+_active_jobs = {}
+_active_lock = threading.Lock()
+
+
+class JobConflict(Exception):
+    """Für den Suchbegriff läuft bereits ein Auftrag (in diesem oder einem anderen Prozess)."""
+
+
+def _lease_expiry():
+    """Zeitpunkt, vor dem ein Heartbeat als abgelaufen gilt."""
+    return datetime.now() - timedelta(seconds=JOB_LEASE_SECONDS)
+
+
+def create_job(conn, term_id, city_ids):
+    """
+    Legt einen Auftrag mit allen Städten im Zustand 'pending' an und gibt die job_id zurück.
+
+    Der Auftrag gehört sofort diesem Prozess (Lease). JobConflict, wenn für den Suchbegriff
+    bereits ein Auftrag mit gültiger Lease läuft.
+    """
+    now = datetime.now()
+    with conn:
+        # Prüfen und Anlegen in einer Anweisung, damit zwei Worker nicht gleichzeitig anlegen können
+        cursor = conn.execute(
+            """
+            INSERT INTO search_job (term_id, status, owner, created_at, updated_at)
+            SELECT ?, 'running', ?, ?, ?
+            WHERE NOT EXISTS (
+                SELECT 1 FROM search_job WHERE term_id = ? AND status = 'running' AND updated_at >= ?
+            )
+            """,
+            (term_id, OWNER_ID, now, now, term_id, _lease_expiry())
+        )
+        if cursor.rowcount == 0:
+            raise JobConflict(term_id)
+        job_id = cursor.lastrowid
+        conn.executemany(
+            "INSERT INTO search_job_city (job_id, city_id, updated_at) VALUES (?, ?, ?)",
+            [(job_id, city_id, now) for city_id in city_ids]
+        )
+    return job_id
+
+
+def claim_job(conn, job_id):
+    """
+    Übernimmt einen nicht laufenden oder verwaisten Auftrag für diesen Prozess.
+
+    False, wenn er (oder ein anderer Auftrag für denselben Suchbegriff) noch von einem Prozess
+    mit gültiger Lease ausgeführt wird.
+    """
+    now = datetime.now()
+    expiry = _lease_expiry()
+    with conn:
+        cursor = conn.execute(
+            f"""
+            UPDATE search_job
+            SET status = 'running', owner = ?, cancel_requested = 0, updated_at = ?, finished_at = NULL
+            WHERE job_id = ? AND (status != 'running' OR updated_at < ?) AND {_SQL_NO_OTHER_RUNNING_JOB}
+            """,
+            (OWNER_ID, now, job_id, expiry, expiry)
+        )
+    return cursor.rowcount == 1
+
+
+def heartbeat(conn, job_id):
+    """
+    Erneuert die Lease eines Auftrags dieses Prozesses.
+
+    Returns:
+        'ok', 'cancel' (Abbruch wurde angefordert, ggf. aus einem anderen Prozess) oder
+        'lost' (die Lease ist abgelaufen und der Auftrag wurde von einem anderen Prozess übernommen)
+    """
+    with conn:
+        cursor = conn.execute(
+            "UPDATE search_job SET updated_at = ? WHERE job_id = ? AND owner = ? AND status = 'running'",
+            (datetime.now(), job_id, OWNER_ID)
+        )
+    if cursor.rowcount == 0:
+        return 'lost'
+    row = conn.execute("SELECT cancel_requested FROM search_job WHERE job_id = ?", (job_id,)).fetchone()
+    return 'cancel' if row[0] else 'ok'
+
+
+def finish_job(conn, job_id, status, message=None):
+    """Setzt den Endstatus eines Laufs; nur solange dieser Prozess die Lease hält."""
+    now = datetime.now()
+    with conn:
+        conn.execute(
+            """
+            UPDATE search_job SET status = ?, message = ?, updated_at = ?, finished_at = ?
+            WHERE job_id = ? AND owner = ? AND status = 'running'
+            """,
+            (status, message, now, now, job_id, OWNER_ID)
+        )
+
+
+def mark_city_failed(conn, job_id, city_id, error):
+    with conn:
+        conn.execute(SQL_MARK_CITY_FAILED, (str(error)[:500], datetime.now(), job_id, city_id))
+
+
+def open_city_ids(conn, job_id):
+    """Städte des Auftrags, die noch nicht erfolgreich abgefragt wurden (pending und failed)."""
+    rows = conn.execute(
+        "SELECT city_id FROM search_job_city WHERE job_id = ? AND state != 'done' ORDER BY city_id",
+        (job_id,)
+    ).fetchall()
+    return [row[0] for row in rows]
+
+
+def retry_delay(attempt):
+    """Wartezeit vor dem Versuch Nummer attempt + 1 (exponentielles Backoff)."""
+    return JOB_RETRY_DELAY * 2 ** (attempt - 1)
+
+
+def _job_dict(row):
+    job = dict(zip(
+        ('job_id', 'term_id', 'term_name', 'status', 'created_at', 'updated_at', 'finished_at',
+         'message', 'active', 'total', 'done', 'failed', 'pending'),
+        row
+    ))
+    job['active'] = bool(job['active'])
+    # Als laufend gespeichert, aber ohne gültige Lease: der ausführende Prozess wurde beendet
+    if job['status'] == 'running' and not job['active']:
+        job['status'] = 'interrupted'
+    return job
+
+
+# Parameter: Ablaufgrenze der Lease (für die Spalte active)
+_SQL_SELECT_JOBS = """
+    SELECT j.job_id, j.term_id, t.name, j.status, j.created_at, j.updated_at, j.finished_at, j.message,
+           j.status = 'running' AND j.updated_at >= ?,
+           COUNT(c.city_id),
+           COALESCE(SUM(c.state = 'done'), 0),
+           COALESCE(SUM(c.state = 'failed'), 0),
+           COALESCE(SUM(c.state = 'pending'), 0)
+    FROM search_job j
+    LEFT JOIN search_term t ON t.term_id = j.term_id
+    LEFT JOIN search_job_city c ON c.job_id = j.job_id
+"""
+
+
+def list_jobs(conn, limit=50):
+    """Die letzten Aufträge mit Fortschritt (Anzahl Städte je Zustand), neueste zuerst."""
+    rows = conn.execute(
+        _SQL_SELECT_JOBS + " GROUP BY j.job_id ORDER BY j.job_id DESC LIMIT ?", (_lease_expiry(), limit)
+    ).fetchall()
+    return [_job_dict(row) for row in rows]
+
+
+def get_job(conn, job_id):
+    """Ein Auftrag mit Fortschritt und den fehlgeschlagenen Städten (oder None)."""
+    row = conn.execute(
+        _SQL_SELECT_JOBS + " WHERE j.job_id = ? GROUP BY j.job_id", (_lease_expiry(), job_id)
+    ).fetchone()
+    if row is None:
+        return None
+    job = _job_dict(row)
+    failed = conn.execute(
+        """
+        SELECT c.city_id, ci.name, c.attempts, c.last_error, c.updated_at
+        FROM search_job_city c LEFT JOIN city ci ON ci.city_id = c.city_id
+        WHERE c.job_id = ? AND c.state = 'failed'
+        ORDER BY c.city_id
+        """,
+        (job_id,)
+    ).fetchall()
+    job['failed_cities'] = [
+        dict(zip(('city_id', 'name', 'attempts', 'last_error', 'updated_at'), row)) for row in failed
+    ]
+    return job
+
+
+def register_active(job_id):
+    """Meldet einen Auftrag als in diesem Prozess laufend an und gibt sein Abbruch-Event zurück."""
+    with _active_lock:
+        event = _active_jobs.setdefault(job_id, threading.Event())
+        event.clear()
+        return event
+
+
+def unregister_active(job_id):
+    with _active_lock:
+        _active_jobs.pop(job_id, None)
+
+
+def runs_locally(job_id):
+    """True, wenn der Auftrag in diesem Prozess läuft."""
+    with _active_lock:
+        return job_id in _active_jobs
+
+
+def request_cancel(conn, job_id):
+    """
+    Fordert den Abbruch eines Auftrags an.
+
+    Returns:
+        'requested', wenn er läuft (der ausführende Prozess bricht spätestens beim nächsten
+        Heartbeat ab), 'cancelled', wenn er nicht lief und direkt als abgebrochen markiert wurde,
+        None, wenn er bereits beendet ist
+    """
+    now = datetime.now()
+    expiry = _lease_expiry()
+    with conn:
+        requested = conn.execute(
+            "UPDATE search_job SET cancel_requested = 1 WHERE job_id = ? AND status = 'running' AND updated_at >= ?",
+            (job_id, expiry)
+        ).rowcount
+        cancelled = 0
+        if not requested:
+            cancelled = conn.execute(
+                f"""
+                UPDATE search_job
+                SET status = 'cancelled', message = 'Abgebrochen, während der Auftrag nicht lief.',
+                    updated_at = ?, finished_at = ?
+                WHERE job_id = ? AND status NOT IN ({','.join('?' * len(FINISHED_STATUSES))})
+                """,
+                (now, now, job_id, *FINISHED_STATUSES)
+            ).rowcount
+    if requested:
+        # Läuft der Auftrag hier, sofort abbrechen statt auf den Heartbeat zu warten
+        with _active_lock:
+            event = _active_jobs.get(job_id)
+        if event is not None:
+            event.set()
+        return 'requested'
+    return 'cancelled' if cancelled else None
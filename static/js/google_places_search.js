@@ -237,15 +237,6 @@ document.addEventListener('DOMContentLoaded', function() {
             } else {
                 console.warn("#search-progress Container nicht gefunden für Statusmeldungen.");
             }
-            
-            startSSEStatusUpdates(
-                // Callback für Abschluss, um UI wieder zu aktivieren
-                function() {
-                    if (liveSearchKeywordInput) liveSearchKeywordInput.disabled = false;
-                    if (clearKeywordInputBtn) clearKeywordInputBtn.disabled = false;
-                    updateStartLiveSearchButtonState();
-                }
-            );
 
             fetch(`/start_search/${encodeURIComponent(termToSearch)}`, {
                 method: 'POST',
@@ -258,7 +249,16 @@ document.addEventListener('DOMContentLoaded', function() {
                 if (data.error && progressContainer) {
                      progressContainer.innerHTML += `<br><span class="text-danger">Fehler: ${data.error}</span>`;
                 }
-                // Erfolgsfeedback kommt via SSE
+                // Erfolgsfeedback kommt via SSE (Statuskanal des angelegten Suchauftrags)
+                startSSEStatusUpdates(
+                    data.status_url || `/search_status/${data.job_id}`,
+                    // Callback für Abschluss, um UI wieder zu aktivieren
+                    function() {
+                        if (liveSearchKeywordInput) liveSearchKeywordInput.disabled = false;
+                        if (clearKeywordInputBtn) clearKeywordInputBtn.disabled = false;
+                        updateStartLiveSearchButtonState();
+                    }
+                );
             })
             .catch(error => {
                 console.error('Fehler beim Senden der Live-Suchanfrage:', error);
@@ -312,7 +312,7 @@ document.addEventListener('DOMContentLoaded', function() {
     
     document.addEventListener('citiesSelectionChanged', updateSelectedCitiesCountInModal);
 
-    function startSSEStatusUpdates(callback) {
+    function startSSEStatusUpdates(statusUrl, callback) {
         if (searchStatusSource) searchStatusSource.close();
         
         // Stelle sicher, dass der Progress-Container aus dem *Haupt-Modal* referenziert wird, nicht aus dem alten Such-Popup
@@ -326,7 +326,9 @@ document.addEventListener('DOMContentLoaded', function() {
         }
         finalProgressContainer.innerHTML = 'Verbinde für Status-Updates...'; // Initialer Text
         
-        searchStatusSource = new EventSource('/search_status');
+        // Bei Verbindungsabbrüchen verbindet der Browser selbst neu und schickt Last-Event-ID mit,
+        // der Server liefert dann die verpassten Meldungen nach
+        searchStatusSource = new EventSource(statusUrl);
         searchStatusSource.onopen = () => finalProgressContainer.innerHTML += '<br>SSE-Verbindung geöffnet.';
         searchStatusSource.onmessage = function(event) {
             const message = event.data;
@@ -351,6 +353,10 @@ document.addEventListener('DOMContentLoaded', function() {
             finalProgressContainer.scrollTop = finalProgressContainer.scrollHeight;
         };
         searchStatusSource.onerror = () => {
+            if (searchStatusSource && searchStatusSource.readyState === EventSource.CONNECTING) {
+                finalProgressContainer.innerHTML += '<br><span class="text-warning">Verbindung unterbrochen, verbinde neu...</span>';
+                return;
+            }
             finalProgressContainer.innerHTML += '<br><span class="text-danger">SSE-Verbindungsfehler.</span>';
             if (searchStatusSource) searchStatusSource.close();
             if (callback) callback();
@@ -411,63 +417,69 @@ document.addEventListener('DOMContentLoaded', function() {
         }
         containerParent.appendChild(miniStatusDiv);
         
-        // Starte SSE für Status-Updates
-        const refreshStatusSource = new EventSource('/search_status');
-        let lastUpdateTime = Date.now();
+        // Status-Updates über den Kanal des Suchauftrags (der Browser verbindet bei Abbrüchen selbst neu)
+        let refreshStatusSource = null;
+        function followRefreshStatus(statusUrl) {
+            refreshStatusSource = new EventSource(statusUrl);
+            let lastUpdateTime = Date.now();
         
-        refreshStatusSource.onmessage = function(event) {
-            const message = event.data;
-            const currentTime = Date.now();
+            refreshStatusSource.onmessage = function(event) {
+                const message = event.data;
+                const currentTime = Date.now();
             
-            // Update Status nur alle 500ms für bessere Performance
-            if (currentTime - lastUpdateTime > 500 || message === "DONE" || message.startsWith("FEHLER:")) {
-                lastUpdateTime = currentTime;
+                // Update Status nur alle 500ms für bessere Performance
+                if (currentTime - lastUpdateTime > 500 || message === "DONE" || message.startsWith("FEHLER:")) {
+                    lastUpdateTime = currentTime;
                 
-                if (message === "DONE" || message.includes('Suche abgeschlossen.')) {
-                    miniStatusDiv.innerHTML = `<i class="bi bi-check-circle text-success"></i> "${termName}" erfolgreich aktualisiert!`;
-                    refreshStatusSource.close();
+                    if (message === "DONE" || message.includes('Suche abgeschlossen.')) {
+                        miniStatusDiv.innerHTML = `<i class="bi bi-check-circle text-success"></i> "${termName}" erfolgreich aktualisiert!`;
+                        refreshStatusSource.close();
                     
-                    // Button wiederherstellen
-                    refreshBtn.innerHTML = originalHTML;
-                    refreshBtn.disabled = false;
+                        // Button wiederherstellen
+                        refreshBtn.innerHTML = originalHTML;
+                        refreshBtn.disabled = false;
                     
-                    // Status nach 3 Sekunden entfernen
-                    setTimeout(() => {
-                        miniStatusDiv.remove();
-                    }, 3000);
+                        // Status nach 3 Sekunden entfernen
+                        setTimeout(() => {
+                            miniStatusDiv.remove();
+                        }, 3000);
                     
-                    // Suchbegriffe neu laden (falls neue hinzugefügt wurden)
-                    loadSearchTerms();
-                } else if (message.startsWith("FEHLER:")) {
-                    miniStatusDiv.innerHTML = `<i class="bi bi-x-circle text-danger"></i> Fehler: ${message}`;
-                    refreshStatusSource.close();
+                        // Suchbegriffe neu laden (falls neue hinzugefügt wurden)
+                        loadSearchTerms();
+                    } else if (message.startsWith("FEHLER:")) {
+                        miniStatusDiv.innerHTML = `<i class="bi bi-x-circle text-danger"></i> Fehler: ${message}`;
+                        refreshStatusSource.close();
                     
-                    // Button wiederherstellen
-                    refreshBtn.innerHTML = originalHTML;
-                    refreshBtn.disabled = false;
-                } else if (message.startsWith("WARNUNG:")) {
-                    miniStatusDiv.innerHTML = `<i class="bi bi-exclamation-triangle text-warning"></i> ${message}`;
-                } else {
-                    // Zeige Fortschritt
-                    miniStatusDiv.innerHTML = `<i class="bi bi-arrow-repeat spin"></i> ${message}`;
+                        // Button wiederherstellen
+                        refreshBtn.innerHTML = originalHTML;
+                        refreshBtn.disabled = false;
+                    } else if (message.startsWith("WARNUNG:")) {
+                        miniStatusDiv.innerHTML = `<i class="bi bi-exclamation-triangle text-warning"></i> ${message}`;
+                    } else {
+                        // Zeige Fortschritt
+                        miniStatusDiv.innerHTML = `<i class="bi bi-arrow-repeat spin"></i> ${message}`;
+                    }
                 }
-            }
-        };
+            };
         
-        refreshStatusSource.onerror = function() {
-            miniStatusDiv.innerHTML = `<i class="bi bi-x-circle text-danger"></i> Verbindungsfehler`;
-            refreshStatusSource.close();
+            refreshStatusSource.onerror = function() {
+                if (refreshStatusSource.readyState === EventSource.CONNECTING) {
+                    return;
+                }
+                miniStatusDiv.innerHTML = `<i class="bi bi-x-circle text-danger"></i> Verbindungsfehler`;
+                refreshStatusSource.close();
             
-            // Button wiederherstellen
-            refreshBtn.innerHTML = originalHTML;
-            refreshBtn.disabled = false;
-        };
+                // Button wiederherstellen
+                refreshBtn.innerHTML = originalHTML;
+                refreshBtn.disabled = false;
+            };
+        }
         
-        // Starte die Suche
+        // Starte die Suche (nur Städte ohne aktuelle Ergebnisse)
         fetch(`/start_search/${encodeURIComponent(termName)}`, {
             method: 'POST',
             headers: { 'Content-Type': 'application/json' },
-            body: JSON.stringify({})
+            body: JSON.stringify({ incremental: true })
         })
         .then(response => {
             if (!response.ok) {
@@ -477,11 +489,12 @@ document.addEventListener('DOMContentLoaded', function() {
         })
         .then(data => {
             console.log(`Aktualisierung für "${termName}" gestartet:`, data.message || data.error);
+            followRefreshStatus(data.status_url || `/search_status/${data.job_id}`);
         })
         .catch(error => {
             console.error('Fehler beim Starten der Aktualisierung:', error);
             miniStatusDiv.innerHTML = `<i class="bi bi-x-circle text-danger"></i> Fehler: ${error}`;
-            refreshStatusSource.close();
+            if (refreshStatusSource) refreshStatusSource.close();
             
             // Button wiederherstellen
             refreshBtn.innerHTML = originalHTML;
@@ -263,27 +263,27 @@ $(document).ready(function() {
 
         // Balkendiagramm (Top 10) (ENTFERNT)
         /*
-        if (data.bar_chart_top10) {
+        if (data.bar_chart_top10_url) {
              console.log("Lade Balkendiagramm...");
-             // barContent.html('<img src="data:image/png;base64,' + data.bar_chart_top10 + '" alt="Top 10 Städte" class="img-fluid">');
+             // barContent.html('<img src="' + data.bar_chart_top10_url + '" alt="Top 10 Städte" class="img-fluid">');
         } else {
-            console.warn("Kein Balkendiagramm (bar_chart_top10) in Antwort gefunden.");
+            console.warn("Kein Balkendiagramm (bar_chart_top10_url) in Antwort gefunden.");
             // barContent.html('<p class="text-muted">Kein Balkendiagramm verfügbar.</p>');
         }
         */
         
-        // Kreisdiagramm 
-        if (data.pie_chart && pieChartContainer.length) {
+        // Kreisdiagramm (wird vom Browser über die URL nachgeladen)
+        if (data.pie_chart_url && pieChartContainer.length) {
             console.log("Lade Kreisdiagramm...");
             const cityHeading = $('<h4>').attr('id', 'cityChartHeading').addClass('mt-3 mb-2').text('Altersverteilung (Gesamt oder Top-Stadt)');
-            const cityChartImg = $('<img>').attr('src', 'data:image/png;base64,' + data.pie_chart).addClass('img-fluid');
+            const cityChartImg = $('<img>').attr('src', data.pie_chart_url).attr('loading', 'lazy').addClass('img-fluid');
              // Füge zuerst die Elemente hinzu, die im JS erstellt wurden
             pieChartContainer.append(cityHeading); 
             // Stelle sicher, dass Ladeanzeige/Fehler weg sind (falls sie vorher im HTML waren und nicht im JS erstellt)
             pieChartContainer.find('.spinner-border, .alert').remove(); 
             pieChartContainer.append(cityChartImg);
         } else {
-             if(!data.pie_chart) console.warn("Kein Kreisdiagramm (pie_chart) in Antwort gefunden.");
+             if(!data.pie_chart_url) console.warn("Kein Kreisdiagramm (pie_chart_url) in Antwort gefunden.");
              if(!pieChartContainer.length) console.warn("pieChartContainer nicht im DOM gefunden für Kreisdiagramm.");
              if(pieChartContainer.length) pieChartContainer.html('<p class="text-muted">Kein Kreisdiagramm verfügbar.</p>');
         }
@@ -291,9 +291,9 @@ $(document).ready(function() {
         // Erweiterte Analyse
         if (data.advanced_analysis) {
              console.log("Lade erweiterte Analyse...");
-             // Scatter Plot
-             if (data.advanced_analysis.scatter_plot) {
-                 scatterPlotContainer.html('<img src="data:image/png;base64,' + data.advanced_analysis.scatter_plot + '" alt="Scatter Plot" class="img-fluid">');
+             // Scatter Plot (Diagramme werden erst beim Öffnen des Tabs geladen)
+             if (data.advanced_analysis.scatter_plot_url) {
+                 scatterPlotContainer.html('<img src="' + data.advanced_analysis.scatter_plot_url + '" loading="lazy" alt="Scatter Plot" class="img-fluid">');
                  // Link zum interaktiven Plot (falls benötigt, ID anpassen)
                  const scatterLink = $('<a>').attr('href', '/interactive_scatter').attr('target', '_blank').addClass('btn btn-sm btn-outline-primary mt-2').text('Interaktiven Plot öffnen');
                  scatterPlotContainer.append($('<p class="text-center">').append(scatterLink)); 
@@ -301,8 +301,8 @@ $(document).ready(function() {
                  scatterPlotContainer.html('<p class="text-muted">Kein Scatter Plot verfügbar.</p>');
              }
              // Clustering 1
-             if (data.advanced_analysis.clustering && data.advanced_analysis.clustering.plot) {
-                 clusteringPlotContainer.html('<img src="data:image/png;base64,' + data.advanced_analysis.clustering.plot + '" alt="Clustering 1 Plot" class="img-fluid">');
+             if (data.advanced_analysis.clustering && data.advanced_analysis.clustering.plot_url) {
+                 clusteringPlotContainer.html('<img src="' + data.advanced_analysis.clustering.plot_url + '" loading="lazy" alt="Clustering 1 Plot" class="img-fluid">');
                  const cluster1Link = $('<a>').attr('href', '/interactive_clustering').attr('target', '_blank').addClass('btn btn-sm btn-outline-primary mt-2').text('Interaktives Clustering öffnen');
                  clusteringPlotContainer.append($('<p class="text-center">').append(cluster1Link)); 
              } else {
@@ -314,8 +314,8 @@ $(document).ready(function() {
                   clusteringTableContainer.html('');
              }
              // Clustering 2
-             if (data.advanced_analysis.clustering2 && data.advanced_analysis.clustering2.plot) {
-                 clustering2PlotContainer.html('<img src="data:image/png;base64,' + data.advanced_analysis.clustering2.plot + '" alt="Clustering 2 Plot" class="img-fluid">');
+             if (data.advanced_analysis.clustering2 && data.advanced_analysis.clustering2.plot_url) {
+                 clustering2PlotContainer.html('<img src="' + data.advanced_analysis.clustering2.plot_url + '" loading="lazy" alt="Clustering 2 Plot" class="img-fluid">');
                  const cluster2Link = $('<a>').attr('href', '/interactive_clustering2').attr('target', '_blank').addClass('btn btn-sm btn-outline-primary mt-2').text('Interaktives Clustering 2 öffnen');
                  clustering2PlotContainer.append($('<p class="text-center">').append(cluster2Link)); 
              } else {
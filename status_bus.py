@@ -0,0 +1,231 @@
+"""
+Statusmeldungen der Massensuche als Publish/Subscribe pro Suchauftrag.
+
+Jeder Suchauftrag hat einen eigenen Kanal mit einem begrenzten Ringpuffer der letzten
+Meldungen. Jede Meldung bekommt eine fortlaufende ID (SSE `id:`), sodass ein Client nach
+einem Verbindungsabbruch mit `Last-Event-ID` genau dort weiterlesen kann. Beliebig viele
+Abonnenten lesen denselben Kanal, ohne sich Meldungen gegenseitig wegzunehmen; sie werden
+über eine Condition geweckt, statt eine Queue abzufragen. Für den eventbasierten SSE-Server
+(status_server) gibt es dieselbe Schnittstelle als Coroutine: Wartende Abonnenten sind dort
+nur Futures auf einem Event-Loop und belegen keinen Thread.
+"""
+import asyncio
+import os
+import threading
+from collections import OrderedDict, deque
+
+# Anzahl Meldungen, die pro Auftrag für nachträglich verbundene Clients vorgehalten werden
+STATUS_BUFFER_SIZE = int(os.environ.get('STATUS_BUFFER_SIZE', 500))
+
+# Anzahl Kanäle (Aufträge), die im Speicher bleiben; abgeschlossene werden zuerst verdrängt
+STATUS_MAX_CHANNELS = int(os.environ.get('STATUS_MAX_CHANNELS', 20))
+
+# Meldung, die das Ende eines Auftrags signalisiert
+DONE = "DONE"
+
+
+class StatusChannel:
+    """Ringpuffer der Meldungen eines Auftrags mit fortlaufenden IDs."""
+
+    def __init__(self, buffer_size):
+        self.events = deque(maxlen=buffer_size)
+        self.last_id = 0
+        # Erste ID des aktuellen Laufs; Meldungen früherer Läufe (fortgesetzter Auftrag) gelten nicht als verpasst
+        self.run_start_id = 1
+        self.closed = False
+        self.condition = threading.Condition()
+        # Wartende Coroutines: Future -> Event-Loop, auf dem sie läuft
+        self._async_waiters = {}
+
+    def publish(self, message):
+        with self.condition:
+            self.last_id += 1
+            self.events.append((self.last_id, message))
+            if message == DONE:
+                self.closed = True
+            self.condition.notify_all()
+            for future, loop in self._async_waiters.items():
+                loop.call_soon_threadsafe(_wake, future)
+            return self.last_id
+
+    def start_run(self, message):
+        """
+        Beginnt einen neuen Lauf (z.B. beim Fortsetzen eines Auftrags): verwirft die Meldungen
+        früherer Läufe samt ihrem DONE, öffnet den Kanal wieder und veröffentlicht message.
+        Die IDs laufen weiter, damit Last-Event-ID eindeutig bleibt.
+        """
+        with self.condition:
+            self.events.clear()
+            self.closed = False
+            self.run_start_id = self.last_id + 1
+        return self.publish(message)
+
+    def events_after(self, last_event_id):
+        """
+        Meldungen mit einer ID größer als last_event_id.
+
+        Returns:
+            (Liste von (id, Meldung), Anzahl Meldungen, die schon aus dem Ringpuffer verdrängt wurden)
+        """
+        with self.condition:
+            return self._events_after(last_event_id)
+
+    def _events_after(self, last_event_id):
+        last_event_id = max(last_event_id, self.run_start_id - 1)
+        events = [event for event in self.events if event[0] > last_event_id]
+        first_id = events[0][0] if events else self.last_id + 1
+        missed = max(0, first_id - last_event_id - 1)
+        return events, missed
+
+    def wait(self, last_event_id, timeout):
+        """Wartet (höchstens timeout Sekunden), bis es Meldungen nach last_event_id gibt, und gibt sie zurück."""
+        with self.condition:
+            self.condition.wait_for(lambda: self.last_id > last_event_id or self.closed, timeout)
+            return self._events_after(last_event_id)
+
+    async def wait_async(self, last_event_id, timeout):
+        """Wie wait, aber als Coroutine: wartet auf dem Event-Loop statt in einem Thread."""
+        future = asyncio.get_running_loop().create_future()
+        with self.condition:
+            if self.last_id > last_event_id or self.closed:
+                return self._events_after(last_event_id)
+            self._async_waiters[future] = future.get_loop()
+        try:
+            await asyncio.wait_for(future, timeout)
+        except asyncio.TimeoutError:
+            pass
+        finally:
+            with self.condition:
+                self._async_waiters.pop(future, None)
+        return self.events_after(last_event_id)
+
+
+def _wake(future):
+    if not future.done():
+        future.set_result(None)
+
+
+def format_sse(event_id, message):
+    """Formatiert eine Meldung als SSE-Nachricht (message None = Keep-alive-Kommentar)."""
+    if message is None:
+        return ": keep-alive\n\n"
+    id_line = f"id: {event_id}\n" if event_id is not None else ""
+    return f"{id_line}data: {message}\n\n"
+
+
+class StatusBus:
+    """Kanäle je Suchauftrag (job_id)."""
+
+    def __init__(self, buffer_size=None, max_channels=None):
+        self.buffer_size = buffer_size or STATUS_BUFFER_SIZE
+        self.max_channels = max_channels or STATUS_MAX_CHANNELS
+        self._channels = OrderedDict()
+        self._lock = threading.Lock()
+        # Serialisiert das Anlegen von Kanälen aus dem gespeicherten Auftragsstand (ensure_channel)
+        self._init_lock = threading.Lock()
+
+    def channel(self, job_id, create=True):
+        """Kanal des Auftrags (wird bei Bedarf angelegt; mit create=False sonst None)."""
+        with self._lock:
+            channel = self._channels.get(job_id)
+            if channel is None and create:
+                channel = self._channels[job_id] = StatusChannel(self.buffer_size)
+                self._evict()
+            return channel
+
+    def _evict(self):
+        # Älteste abgeschlossene Kanäle verdrängen; laufende Aufträge bleiben erhalten
+        excess = len(self._channels) - self.max_channels
+        for job_id in [job_id for job_id, channel in self._channels.items() if channel.closed][:max(excess, 0)]:
+            del self._channels[job_id]
+
+    def publish(self, job_id, message):
+        return self.channel(job_id).publish(message)
+
+    def start_run(self, job_id, message):
+        """Setzt den Kanal für einen neuen Lauf des Auftrags zurück (siehe StatusChannel.start_run)."""
+        with self._lock:
+            channel = self._channels.get(job_id)
+            if channel is None:
+                channel = self._channels[job_id] = StatusChannel(self.buffer_size)
+                self._evict()
+            else:
+                self._channels.move_to_end(job_id)
+            # Unter dem Bus-Lock, damit der Kanal nicht zwischen Anlegen und Öffnen verdrängt wird
+            return channel.start_run(message)
+
+    def ensure_channel(self, job_id, initial_messages):
+        """
+        Legt den Kanal eines Auftrags an, falls er fehlt, und veröffentlicht dabei initial_messages().
+
+        initial_messages() liefert die Meldungen für den neuen Kanal (z.B. den gespeicherten Stand
+        nach einem Neustart) oder None, wenn der Auftrag unbekannt ist. Gleichzeitige Aufrufe
+        für denselben Auftrag veröffentlichen die Meldungen nur einmal.
+
+        Returns:
+            False, wenn der Auftrag unbekannt ist, sonst True
+        """
+        if self.channel(job_id, create=False) is not None:
+            return True
+        with self._init_lock:
+            if self.channel(job_id, create=False) is not None:
+                return True
+            messages = initial_messages()
+            if messages is None:
+                return False
+            channel = StatusChannel(self.buffer_size)
+            for message in messages:
+                channel.publish(message)
+            with self._lock:
+                # Erst gefüllt eintragen, damit kein Abonnent einen halb initialisierten Kanal sieht
+                self._channels.setdefault(job_id, channel)
+                self._evict()
+            return True
+
+    def subscribe(self, job_id, last_event_id=0, keepalive=15):
+        """
+        Liefert die Meldungen eines Auftrags ab last_event_id, bis der Auftrag abgeschlossen ist.
+
+        Yields:
+            (id, Meldung) für jede Meldung; (None, None), wenn keepalive Sekunden lang nichts kam
+            (Gelegenheit für einen SSE-Kommentar); (None, Hinweis), wenn Meldungen bereits aus dem
+            Ringpuffer verdrängt wurden.
+        """
+        channel = self.channel(job_id)
+        if last_event_id > channel.last_id:
+            # ID aus einem früheren Prozess (Neustart): von vorne lesen
+            last_event_id = 0
+        while True:
+            events, missed = channel.wait(last_event_id, keepalive)
+            if missed:
+                yield None, f"WARNUNG: {missed} ältere Statusmeldungen sind nicht mehr verfügbar."
+            if not events:
+                if channel.closed:
+                    return
+                yield None, None
+                continue
+            for event in events:
+                yield event
+                if event[1] == DONE:
+                    return
+            last_event_id = events[-1][0]
+
+    async def subscribe_async(self, job_id, last_event_id=0, keepalive=15):
+        """Wie subscribe, aber als asynchroner Generator für den eventbasierten SSE-Server."""
+        channel = self.channel(job_id)
+        if last_event_id > channel.last_id:
+            last_event_id = 0
+        while True:
+            events, missed = await channel.wait_async(last_event_id, keepalive)
+            if missed:
+                yield None, f"WARNUNG: {missed} ältere Statusmeldungen sind nicht mehr verfügbar."
+            if not events:
+                if channel.closed:
+                    return
+                yield None, None
+                continue
+            for event in events:
+                yield event
+                if event[1] == DONE:
+                    return
+            last_event_id = events[-1][0]
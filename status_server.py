@@ -0,0 +1,151 @@
+"""
+Eventbasierter SSE-Server für die Statusmeldungen der Massensuche.
+
+Über Flask belegt jede offene /search_status-Verbindung einen Worker-Thread, solange die Suche
+läuft. Deshalb startet app.py beim ersten Abruf eines Status-Streams diesen aiohttp-Server auf
+einem eigenen Event-Loop-Thread (Port STATUS_SSE_PORT, 0 = aus): Alle SSE-Clients werden dort
+als Coroutines bedient, ein wartender Client ist nur ein Future
+(status_bus.StatusChannel.wait_async). Flask leitet /search_status dann hierher um.
+
+Der Server spricht nur HTTP. Wird die Web-App über HTTPS ausgeliefert, bleibt der Stream ohne
+STATUS_SSE_PUBLIC_URL (z.B. ein Pfad desselben Reverse-Proxys) bei Flask, statt Mixed Content
+zu erzeugen.
+"""
+import asyncio
+import os
+import threading
+
+from aiohttp import web
+
+from status_bus import format_sse
+
+# Port des eventbasierten SSE-Servers (0 = aus, Statusmeldungen laufen dann über Flask)
+STATUS_SSE_PORT = int(os.environ.get('STATUS_SSE_PORT', 5001))
+# Wie Flask erreichbar sein muss, damit Browser auf anderen Rechnern umgeleitet werden können
+STATUS_SSE_HOST = os.environ.get('STATUS_SSE_HOST', '0.0.0.0')
+
+# Öffentliche Basis-URL, falls der Server hinter einem Reverse-Proxy liegt (z.B. https://example.org/events)
+STATUS_SSE_PUBLIC_URL = os.environ.get('STATUS_SSE_PUBLIC_URL', '').rstrip('/')
+
+# Erlaubter Origin für die Web-App (der Server läuft auf einem anderen Port, also Cross-Origin)
+STATUS_SSE_ALLOW_ORIGIN = os.environ.get('STATUS_SSE_ALLOW_ORIGIN', '*')
+
+# Sekunden ohne Meldung, nach denen ein Keep-alive-Kommentar gesendet wird
+STATUS_SSE_KEEPALIVE = float(os.environ.get('STATUS_SSE_KEEPALIVE', 15))
+
+RETRY_TIMEOUT_MS = 2000
+
+_server = None
+_start_lock = threading.Lock()
+# Start fehlgeschlagen (z.B. Port belegt durch einen anderen Worker-Prozess): nicht erneut versuchen
+_start_failed = False
+
+
+def running():
+    """True, wenn der Server in diesem Prozess gestartet wurde."""
+    return _server is not None
+
+
+def status_url(job_id, request_scheme, request_host):
+    """
+    URL des Status-Streams für einen Auftrag, gebildet aus Schema und Host der Flask-Anfrage.
+
+    None, wenn der Server unter dem Schema der Anfrage nicht erreichbar ist (HTTPS ohne
+    STATUS_SSE_PUBLIC_URL); der Stream bleibt dann bei Flask.
+    """
+    if STATUS_SSE_PUBLIC_URL:
+        return f"{STATUS_SSE_PUBLIC_URL}/search_status/{job_id}"
+    if request_scheme != 'http':
+        return None
+    hostname = request_host.rsplit(':', 1)[0] if not request_host.endswith(']') else request_host
+    return f"http://{hostname}:{STATUS_SSE_PORT}/search_status/{job_id}"
+
+
+class StatusServer:
+    """aiohttp-Server auf einem eigenen Event-Loop-Thread."""
+
+    def __init__(self, bus, ensure_channel, host, port):
+        """
+        Args:
+            bus: status_bus.StatusBus
+            ensure_channel: ensure_channel(job_id) -> bool; False, wenn der Auftrag unbekannt ist
+                (blockierend, wird in einem Thread ausgeführt)
+        """
+        self.bus = bus
+        self.ensure_channel = ensure_channel
+        self.host = host
+        self.port = port
+        self.loop = asyncio.new_event_loop()
+        self._started = threading.Event()
+        self._error = None
+        self._thread = threading.Thread(target=self._run, name='status-sse', daemon=True)
+
+    def start(self):
+        self._thread.start()
+        self._started.wait()
+        if self._error is not None:
+            raise self._error
+        return self
+
+    def _run(self):
+        asyncio.set_event_loop(self.loop)
+        try:
+            self.loop.run_until_complete(self._serve())
+        except Exception as e:
+            self._error = e
+            return
+        finally:
+            self._started.set()
+        self.loop.run_forever()
+
+    async def _serve(self):
+        app = web.Application()
+        app.router.add_get('/search_status/{job_id:\\d+}', self.handle_status)
+        runner = web.AppRunner(app)
+        await runner.setup()
+        await web.TCPSite(runner, self.host, self.port).start()
+
+    async def handle_status(self, request):
+        job_id = int(request.match_info['job_id'])
+        cors = {'Access-Control-Allow-Origin': STATUS_SSE_ALLOW_ORIGIN}
+        if not await asyncio.to_thread(self.ensure_channel, job_id):
+            return web.json_response({'error': f'Suchauftrag #{job_id} nicht gefunden.'}, status=404, headers=cors)
+        try:
+            last_event_id = int(request.headers.get('Last-Event-ID') or request.query.get('last_event_id') or 0)
+        except ValueError:
+            last_event_id = 0
+
+        response = web.StreamResponse(headers={
+            'Content-Type': 'text/event-stream',
+            'Cache-Control': 'no-cache',
+            'X-Accel-Buffering': 'no',  # Für Nginx
+            **cors,
+        })
+        await response.prepare(request)
+        try:
+            await response.write(f"retry: {RETRY_TIMEOUT_MS}\n\n".encode())
+            async for event_id, message in self.bus.subscribe_async(job_id, last_event_id, STATUS_SSE_KEEPALIVE):
+                await response.write(format_sse(event_id, message).encode())
+        except ConnectionResetError:
+            # Client hat die Verbindung geschlossen
+            pass
+        return response
+
+
+def start(bus, ensure_channel):
+    """
+    Startet den Server beim ersten Aufruf (außer bei STATUS_SSE_PORT=0) und gibt ihn zurück.
+
+    None, wenn er aus ist oder nicht gestartet werden konnte.
+    """
+    global _server, _start_failed
+    with _start_lock:
+        if _server is None and not _start_failed and STATUS_SSE_PORT > 0:
+            try:
+                _server = StatusServer(bus, ensure_channel, STATUS_SSE_HOST, STATUS_SSE_PORT).start()
+            except OSError as e:
+                _start_failed = True
+                print(f"WARNUNG: SSE-Statusserver konnte nicht gestartet werden ({e}), Statusmeldungen laufen über Flask.")
+            else:
+                print(f"SSE-Statusserver läuft auf http://{STATUS_SSE_HOST}:{STATUS_SSE_PORT}")
+    return _server
@@ -0,0 +1,161 @@
+"""Vektorisierte Zielgruppenberechnung auf Basis der Altersgruppen (Städte × Altersgruppen)."""
+import re
+
+import numpy as np
+import pandas as pd
+
+# Angenommene Obergrenze für offene Altersgruppen ('65 und älter')
+OPEN_END_MAX_AGE = 85
+
+# Nur Altersgruppen ab diesem Alter zählen zur Zielgruppe; jüngere werden als 'unter 18' geführt
+ADULT_AGE = 18
+
+_RANGE_LABEL = re.compile(r'^\s*(\d+)\s*bis\s*(\d+)', re.IGNORECASE)
+_UNDER_LABEL = re.compile(r'^\s*unter\s*(\d+)', re.IGNORECASE)
+_OPEN_LABEL = re.compile(r'^\s*(\d+)\s*(?:und|jahre und)\s*(?:älter|mehr)', re.IGNORECASE)
+_INTERNAL_RANGE = re.compile(r'^age_(\d+)_(\d+)$')
+_INTERNAL_OPEN = re.compile(r'^age_(\d+)_plus$')
+
+
+def parse_age_band(label):
+    """
+    Ermittelt die Altersgrenzen einer Altersgruppe aus ihrem Label.
+
+    Versteht die Labels der age_group-Tabelle ('Unter 3 Jahre', '18 bis 29 Jahre',
+    '65 und älter') sowie die internen Spaltennamen ('age_18_29', 'age_65_plus').
+
+    Returns:
+        Tupel (start, end, offen) oder None, wenn das Label keine Altersgruppe ist
+    """
+    if not isinstance(label, str):
+        return None
+    match = _INTERNAL_RANGE.match(label) or _RANGE_LABEL.match(label)
+    if match:
+        return int(match.group(1)), int(match.group(2)), False
+    match = _INTERNAL_OPEN.match(label) or _OPEN_LABEL.match(label)
+    if match:
+        return int(match.group(1)), OPEN_END_MAX_AGE, True
+    match = _UNDER_LABEL.match(label)
+    if match:
+        return 0, int(match.group(1)) - 1, False
+    return None
+
+
+def internal_band_name(start, end, open_end=False):
+    """Interner Spaltenname einer Altersgruppe, z.B. 'age_18_29' oder 'age_65_plus'."""
+    return f'age_{start}_plus' if open_end else f'age_{start}_{end}'
+
+
+def age_band_columns(columns):
+    """Gibt {Spaltenname: (start, end, offen)} für alle Spalten zurück, die eine Altersgruppe darstellen."""
+    bands = {}
+    for col in columns:
+        band = parse_age_band(col)
+        if band is not None:
+            bands[col] = band
+    return bands
+
+
+def age_band_rename_map(columns):
+    """Mapping von DB-Labels der Altersgruppen auf die internen Spaltennamen."""
+    return {col: internal_band_name(*band) for col, band in age_band_columns(columns).items()}
+
+
+class TargetGroupEngine:
+    """
+    Hält die Altersverteilung aller Städte als NumPy-Matrix (Städte × Altersgruppen).
+
+    Die Zielgruppengröße für einen Altersbereich ist ein Matrix-Vektor-Produkt mit dem
+    Gewichtsvektor der Altersgruppen (Anteil der Jahrgänge einer Gruppe, die im Bereich
+    liegen, lineare Verteilung innerhalb der Gruppe). Für ein ganzes Raster von
+    Altersbereichen genügt ein Matrix-Matrix-Produkt.
+    """
+
+    def __init__(self, city_ids, columns, bounds, counts, totals):
+        self.city_ids = pd.Index(city_ids)
+        self.columns = list(columns)
+        self.starts = np.array([b[0] for b in bounds], dtype=float)
+        self.ends = np.array([b[1] for b in bounds], dtype=float)
+        self.widths = self.ends - self.starts + 1
+        self.counts = counts
+        self.totals = totals
+        # Gruppen, die vollständig unter 18 liegen, bzw. zur Zielgruppe zählen können
+        self.under_18_mask = self.ends < ADULT_AGE
+        self.adult_mask = self.starts >= ADULT_AGE
+        self.under_18_sizes = counts[:, self.under_18_mask].sum(axis=1)
+
+    @classmethod
+    def from_frame(cls, df):
+        """Erstellt die Engine aus einem DataFrame mit 'city_id', 'total' und Altersgruppen-Spalten."""
+        bands = age_band_columns(df.columns)
+        columns = list(bands)
+        counts = df[columns].apply(pd.to_numeric, errors='coerce').fillna(0).to_numpy(dtype=float)
+        totals = pd.to_numeric(df['total'], errors='coerce').to_numpy(dtype=float)
+        city_ids = df['city_id'] if 'city_id' in df.columns else df.index
+        return cls(city_ids, columns, [bands[c] for c in columns], counts, totals)
+
+    def band_weights(self, min_age, max_age):
+        """Gewichtsvektor der Altersgruppen für den Bereich [min_age, max_age]."""
+        return self.weight_matrix([(min_age, max_age)])[0]
+
+    def weight_matrix(self, age_ranges):
+        """Gewichtsmatrix (Altersbereiche × Altersgruppen) für eine Liste von (min_age, max_age)."""
+        ranges = np.asarray(age_ranges, dtype=float).reshape(-1, 2)
+        overlap_start = np.maximum(ranges[:, [0]], self.starts)
+        overlap_end = np.minimum(ranges[:, [1]], self.ends)
+        overlap_years = np.clip(overlap_end - overlap_start + 1, 0, None)
+        return (overlap_years / self.widths) * self.adult_mask
+
+    def target_sizes(self, min_age, max_age, rows=None):
+        """Zielgruppengröße je Stadt für einen Altersbereich."""
+        counts = self.counts if rows is None else self.counts[rows]
+        return counts @ self.band_weights(min_age, max_age)
+
+    def share_grid(self, age_ranges):
+        """
+        Zielgruppenanteile für viele Altersbereiche auf einmal.
+
+        Returns:
+            Matrix (Städte × Altersbereiche) mit Anteilen zwischen 0 und 1
+        """
+        sizes = self.counts @ self.weight_matrix(age_ranges).T
+        with np.errstate(divide='ignore', invalid='ignore'):
+            shares = sizes / self.totals[:, None]
+        return np.clip(np.nan_to_num(shares, nan=0.0), 0, 1)
+
+    def rows_for(self, df):
+        """Zeilenpositionen der Städte eines DataFrames in der Engine (None, falls nicht alle enthalten sind)."""
+        if 'city_id' not in df.columns:
+            return None
+        rows = self.city_ids.get_indexer(df['city_id'])
+        if (rows < 0).any():
+            return None
+        return rows
+
+    def apply(self, df, min_age, max_age, rows=None):
+        """Ergänzt df um Zielgruppen-, Unter-18- und Sonstige-Spalten (gibt einen neuen DataFrame zurück)."""
+        if rows is None:
+            rows = np.arange(len(self.counts))
+        totals = self.totals[rows]
+        target_size = self.target_sizes(min_age, max_age, rows)
+        under_18_size = self.under_18_sizes[rows]
+
+        with np.errstate(divide='ignore', invalid='ignore'):
+            under_18_percent = under_18_size / totals
+            target_percent = np.clip(np.nan_to_num(target_size / totals, nan=0.0), 0, 1)
+            others_size = np.clip(np.nan_to_num(totals, nan=0.0) - target_size - under_18_size, 0, None)
+            others_percent = np.nan_to_num(others_size / totals, nan=0.0)
+
+        return df.assign(
+            target_group_size=target_size,
+            under_18_size=under_18_size,
+            under_18_percent=under_18_percent,
+            target_group_percent=target_percent,
+            others_size=others_size,
+            others_percent=others_percent,
+        )
+
+
+def all_age_ranges(min_age=0, max_age=OPEN_END_MAX_AGE):
+    """Alle Altersbereiche (a, b) mit min_age <= a <= b <= max_age."""
+    return [(a, b) for a in range(min_age, max_age + 1) for b in range(a, max_age + 1)]
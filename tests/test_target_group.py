@@ -0,0 +1,121 @@
+"""
+Vergleicht die vektorisierte Zielgruppenberechnung (TargetGroupEngine) mit der ursprünglichen,
+spaltenweisen Berechnung aus utils.calculate_target_group.
+
+Ausführen: python -m pytest tests
+"""
+import os
+import sys
+
+import numpy as np
+import pandas as pd
+import pytest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from target_group import OPEN_END_MAX_AGE, TargetGroupEngine, age_band_rename_map  # noqa: E402
+from utils import calculate_target_group  # noqa: E402
+
+# Ursprüngliche Altersgruppen (Label der age_group-Tabelle -> (interner Name, Beginn, Ende))
+BASELINE_BANDS = {
+    'Unter 3 Jahre': ('age_0_2', 0, 2),
+    '3 bis 5 Jahre': ('age_3_5', 3, 5),
+    '6 bis 10 Jahre': ('age_6_10', 6, 10),
+    '11 bis 17 Jahre': ('age_11_17', 11, 17),
+    '18 bis 29 Jahre': ('age_18_29', 18, 29),
+    '30 bis 39 Jahre': ('age_30_39', 30, 39),
+    '40 bis 49 Jahre': ('age_40_49', 40, 49),
+    '50 bis 64 Jahre': ('age_50_64', 50, 64),
+    '65 und älter': ('age_65_plus', 65, 85),
+}
+UNDER_18_BANDS = ['age_0_2', 'age_3_5', 'age_6_10', 'age_11_17']
+
+
+def baseline_calculate_target_group(df, min_age, max_age):
+    """Berechnung vor der TargetGroupEngine (ohne Debug-Ausgaben)."""
+    df_result = df.rename(columns={label: band[0] for label, band in BASELINE_BANDS.items()})
+    for name, _, _ in BASELINE_BANDS.values():
+        df_result[name] = pd.to_numeric(df_result[name], errors='coerce').fillna(0)
+
+    df_result['under_18_size'] = df_result[UNDER_18_BANDS].sum(axis=1)
+    df_result['under_18_percent'] = df_result['under_18_size'] / df_result['total']
+
+    df_result['target_group_size'] = 0.0
+    for name, start, end in BASELINE_BANDS.values():
+        if name in UNDER_18_BANDS:
+            continue
+        overlap_start = max(min_age, start)
+        overlap_end = min(max_age, end)
+        if overlap_end >= overlap_start:
+            fraction = (overlap_end - overlap_start + 1) / (end - start + 1)
+            df_result['target_group_size'] += df_result[name] * fraction
+
+    df_result['target_group_percent'] = (df_result['target_group_size'] / df_result['total']).fillna(0).clip(0, 1)
+    df_result['others_size'] = (df_result['total'] - df_result['target_group_size'] - df_result['under_18_size']).clip(lower=0)
+    df_result['others_percent'] = (df_result['others_size'] / df_result['total']).fillna(0)
+    return df_result
+
+
+@pytest.fixture
+def cities():
+    """Drei Städte mit festen Zahlen je Altersgruppe (eine mit fehlendem Wert)."""
+    counts = {
+        'Unter 3 Jahre': [300, 120, 0],
+        '3 bis 5 Jahre': [290, 110, 15],
+        '6 bis 10 Jahre': [480, 200, 25],
+        '11 bis 17 Jahre': [700, 260, 40],
+        '18 bis 29 Jahre': [1500, 400, 60],
+        '30 bis 39 Jahre': [1300, 380, None],
+        '40 bis 49 Jahre': [1250, 410, 90],
+        '50 bis 64 Jahre': [2100, 700, 150],
+        '65 und älter': [1900, 900, 210],
+    }
+    df = pd.DataFrame({
+        'city_id': [11, 12, 13],
+        'location_name': ['Adorf', 'Bestadt', 'Cedorf'],
+        'total': [10000, 3500, 650],
+        **counts,
+    })
+    return df
+
+
+# Grenzen der Altersgruppen, Bereiche dazwischen, die Unter-18-Grenze und das offene Ende
+AGE_RANGES = [
+    (18, 29), (18, 18), (29, 29), (29, 30), (30, 39), (25, 35), (40, 49), (45, 45),
+    (50, 64), (64, 65), (65, 65), (65, OPEN_END_MAX_AGE), (70, 80), (65, 99), (85, 99), (86, 99),
+    (0, 17), (10, 20), (17, 18), (0, OPEN_END_MAX_AGE), (0, 120), (18, OPEN_END_MAX_AGE),
+]
+
+COMPARED_COLUMNS = [
+    'target_group_size', 'target_group_percent', 'under_18_size', 'under_18_percent',
+    'others_size', 'others_percent',
+]
+
+
+@pytest.mark.parametrize('min_age,max_age', AGE_RANGES)
+def test_matches_baseline_without_engine(cities, min_age, max_age):
+    expected = baseline_calculate_target_group(cities, min_age, max_age)
+    result = calculate_target_group(cities, min_age, max_age)
+    for column in COMPARED_COLUMNS:
+        np.testing.assert_allclose(result[column].to_numpy(dtype=float), expected[column].to_numpy(dtype=float),
+                                   rtol=1e-12, atol=1e-9, err_msg=column)
+
+
+@pytest.mark.parametrize('min_age,max_age', AGE_RANGES)
+def test_matches_baseline_with_dataset_engine(cities, min_age, max_age):
+    # Wie im Datensatz-Cache: Engine über alle Städte, Berechnung für eine Teilmenge
+    engine = TargetGroupEngine.from_frame(cities.rename(columns=age_band_rename_map(cities.columns)))
+    subset = cities.iloc[[2, 0]]
+    expected = baseline_calculate_target_group(subset, min_age, max_age)
+    result = calculate_target_group(subset, min_age, max_age, engine=engine)
+    for column in COMPARED_COLUMNS:
+        np.testing.assert_allclose(result[column].to_numpy(dtype=float), expected[column].to_numpy(dtype=float),
+                                   rtol=1e-12, atol=1e-9, err_msg=column)
+
+
+def test_share_grid_matches_baseline(cities):
+    engine = TargetGroupEngine.from_frame(cities)
+    shares = engine.share_grid(AGE_RANGES)
+    for index, (min_age, max_age) in enumerate(AGE_RANGES):
+        expected = baseline_calculate_target_group(cities, min_age, max_age)['target_group_percent']
+        np.testing.assert_allclose(shares[:, index], expected.to_numpy(dtype=float), rtol=1e-12, atol=1e-12)
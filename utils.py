@@ -2,16 +2,16 @@ import pandas as pd
 import numpy as np
 import matplotlib
 matplotlib.use('Agg')  # Verwende nicht-interaktiven Backend
-import matplotlib.pyplot as plt
 import seaborn as sns
 from sklearn.cluster import KMeans
 from sklearn.preprocessing import StandardScaler
-import io
 import base64
 import plotly.express as px
 import plotly.graph_objects as go
 import re
 import warnings
+from target_group import TargetGroupEngine, age_band_rename_map
+import figure_pool
 
 # Unterdrücke spezifische FutureWarning von Pandas in Plotly Express
 warnings.filterwarnings('ignore', category=FutureWarning, message='.*When grouping with a length-1 list-like.*')
@@ -21,140 +21,32 @@ def normalize(val, min_val, max_val):
         return 0.5
     return (val - min_val) / (max_val - min_val)
 
-def calculate_target_group(df, min_age, max_age):
-    # Eine echte Kopie des DataFrames erstellen
-    df_result = df.copy()
-    
-    # Debug: Verfügbare Spalten anzeigen
-    print(f"Available columns in DataFrame for target group calculation: {df_result.columns.tolist()}")
-    
-    # Mapping von DB-Labels zu internen, einfachen Namen
-    # (Passe dies an die exakten Labels in deiner age_group Tabelle an!)
-    age_group_label_mapping = {
-        'Unter 3 Jahre': 'age_0_2',
-        '3 bis 5 Jahre': 'age_3_5',
-        '6 bis 10 Jahre': 'age_6_10',
-        '11 bis 17 Jahre': 'age_11_17',
-        '18 bis 29 Jahre': 'age_18_29',
-        '30 bis 39 Jahre': 'age_30_39',
-        '40 bis 49 Jahre': 'age_40_49',
-        '50 bis 64 Jahre': 'age_50_64',
-        '65 und älter': 'age_65_plus'
-        # Füge hier weitere Mappings hinzu, falls nötig
-    }
-
-    # Spalten umbenennen für einfachere Handhabung
-    df_result = df_result.rename(columns=age_group_label_mapping)
-
-    # Liste der internen Altersspaltennamen
-    internal_age_columns = list(age_group_label_mapping.values())
-
-    # Sicherstellen, dass alle benötigten (internen) Altersspalten existieren und numerisch sind
-    for col in internal_age_columns:
-        if col not in df_result.columns:
-            print(f"WARNUNG: Erwartete interne Altersspalte '{col}' nicht gefunden. Wird mit 0 ersetzt.")
-            df_result[col] = 0
-        else:
-            # Konvertiere zu numerischem Typ, fülle NaN mit 0
-            df_result[col] = pd.to_numeric(df_result[col], errors='coerce').fillna(0)
-
-    # Zielgruppe initialisieren
-    df_result["target_group_size"] = 0.0
+def format_thousands(series):
+    """Formatiert eine Zahlen-Series als Ganzzahlen mit Punkt als Tausendertrennzeichen (vektorisiert)."""
+    as_int = pd.Series(series).astype('int64').astype(str)
+    return as_int.str.replace(r'\B(?=(\d{3})+(?!\d))', '.', regex=True)
 
-    # Berechnung unter 18 Jahre
-    # Addiere die entsprechenden internen Spalten
-    under_18_cols = ['age_0_2', 'age_3_5', 'age_6_10', 'age_11_17']
-    # Nur existierende Spalten berücksichtigen
-    existing_under_18_cols = [col for col in under_18_cols if col in df_result.columns]
-    df_result["under_18_size"] = df_result[existing_under_18_cols].sum(axis=1)
-    df_result["under_18_percent"] = df_result["under_18_size"] / df_result["total"]
-
-    # --- Zielgruppenberechnung basierend auf internen Spalten --- 
-    # Diese Logik muss eventuell angepasst werden, je nachdem, wie präzise 
-    # die Aufteilung sein soll und wie die Altersgruppen genau definiert sind.
-    # Annahme: Lineare Verteilung innerhalb der breiteren Gruppen.
-
-    # Beispielhafte Logik (muss überprüft und ggf. verfeinert werden!):
-    # Beispiel: Gruppe 'age_18_29' (12 Jahre: 18-29)
-    if 'age_18_29' in df_result.columns:
-        start = 18
-        end = 29
-        count_total = df_result['age_18_29']
-        overlap_start = max(min_age, start)
-        overlap_end = min(max_age, end)
-        if overlap_end >= overlap_start:
-            overlap_years = overlap_end - overlap_start + 1
-            fraction = overlap_years / (end - start + 1)
-            df_result["target_group_size"] += count_total * fraction
-
-    # Beispiel: Gruppe 'age_30_39' (10 Jahre: 30-39)
-    if 'age_30_39' in df_result.columns:
-        start = 30
-        end = 39
-        count_total = df_result['age_30_39']
-        overlap_start = max(min_age, start)
-        overlap_end = min(max_age, end)
-        if overlap_end >= overlap_start:
-            overlap_years = overlap_end - overlap_start + 1
-            fraction = overlap_years / (end - start + 1)
-            df_result["target_group_size"] += count_total * fraction
-            
-    # Beispiel: Gruppe 'age_40_49' (10 Jahre: 40-49)
-    if 'age_40_49' in df_result.columns:
-        start = 40
-        end = 49
-        count_total = df_result['age_40_49']
-        overlap_start = max(min_age, start)
-        overlap_end = min(max_age, end)
-        if overlap_end >= overlap_start:
-            overlap_years = overlap_end - overlap_start + 1
-            fraction = overlap_years / (end - start + 1)
-            df_result["target_group_size"] += count_total * fraction
-
-    # Beispiel: Gruppe 'age_50_64' (15 Jahre: 50-64)
-    if 'age_50_64' in df_result.columns:
-        start = 50
-        end = 64
-        count_total = df_result['age_50_64']
-        overlap_start = max(min_age, start)
-        overlap_end = min(max_age, end)
-        if overlap_end >= overlap_start:
-            overlap_years = overlap_end - overlap_start + 1
-            fraction = overlap_years / (end - start + 1)
-            df_result["target_group_size"] += count_total * fraction
+def calculate_target_group(df, min_age, max_age, engine=None):
+    """
+    Berechnet Zielgruppengröße und -anteil für den Altersbereich [min_age, max_age].
 
-    # Beispiel: Gruppe 'age_65_plus' (Annahme bis z.B. 85 für Berechnung)
-    if 'age_65_plus' in df_result.columns:
-        start = 65
-        end = 85 # Annahme für die Obergrenze
-        count_total = df_result['age_65_plus']
-        overlap_start = max(min_age, start)
-        overlap_end = min(max_age, end)
-        if overlap_end >= overlap_start:
-            overlap_years = overlap_end - overlap_start + 1
-            # Hier ist die Fraktion schwerer zu schätzen, ggf. anpassen
-            fraction = overlap_years / (end - start + 1) 
-            df_result["target_group_size"] += count_total * fraction
+    Die Altersgruppen-Spalten werden über ihre Grenzen (aus dem age_group-Label) gewichtet,
+    die Berechnung erfolgt vektorisiert in einer TargetGroupEngine.
 
-    # Zielgruppenanteil berechnen (verhindere Division durch Null)
-    df_result["target_group_percent"] = (df_result["target_group_size"] / df_result["total"]).fillna(0)
-    df_result["target_group_percent"] = df_result["target_group_percent"].clip(0, 1) # Stelle sicher, dass der Anteil zwischen 0 und 1 liegt
+    Args:
+        df: DataFrame mit 'total' und den Altersgruppen-Spalten
+        min_age, max_age: Altersbereich der Zielgruppe
+        engine: Optional vorberechnete TargetGroupEngine (z.B. aus dem Datensatz-Cache)
 
-    # Berechnung sonstige (über der Zielgruppe)
-    # Sicherstellen, dass alle Größen numerisch sind und NaN mit 0 füllen
-    df_result["total"] = pd.to_numeric(df_result["total"], errors='coerce').fillna(0)
-    df_result["target_group_size"] = pd.to_numeric(df_result["target_group_size"], errors='coerce').fillna(0)
-    df_result["under_18_size"] = pd.to_numeric(df_result["under_18_size"], errors='coerce').fillna(0)
-    
-    df_result["others_size"] = df_result["total"] - df_result["target_group_size"] - df_result["under_18_size"]
-    # Negative Werte vermeiden
-    df_result["others_size"] = df_result["others_size"].clip(lower=0)
-    df_result["others_percent"] = (df_result["others_size"] / df_result["total"]).fillna(0)
-    
-    # Debug: Zeige Ergebnis der Zielgruppenberechnung
-    print(df_result[['location_name', 'total', 'target_group_size', 'target_group_percent']].head())
-    
-    return df_result
+    Returns:
+        Neuer DataFrame mit target_group_*, under_18_* und others_* Spalten
+    """
+    rows = engine.rows_for(df) if engine is not None else None
+    if rows is None:
+        # Keine (passende) Engine vorhanden: aus dem übergebenen DataFrame erstellen
+        df = df.rename(columns=age_band_rename_map(df.columns))
+        engine = TargetGroupEngine.from_frame(df)
+    return engine.apply(df, min_age, max_age, rows)
 
 def generate_charts(df):
     # Alle Städte nach Score sortieren
@@ -185,7 +77,8 @@ def generate_cities_chart(cities_df, start_rank=0, x_min=None, global_max=None):
         x_min: Minimalwert für die X-Achse
         global_max: Maximaler Score-Wert aus allen Städten für konsistente Skalierung
     """
-    fig, ax = plt.subplots(figsize=(8, 4))
+    fig = figure_pool.acquire('cities')
+    ax = fig.subplots()
     
     # Höchstens 10 Städte anzeigen
     if len(cities_df) > 10:
@@ -217,12 +110,12 @@ def generate_cities_chart(cities_df, start_rank=0, x_min=None, global_max=None):
     for i, score in enumerate(cities_df["score"]):
         ax.text(score, i, f" {(score * 100):.2f}%", va='center', fontsize=9)
     
-    fig = plt.gcf()
     return fig
 
 def generate_city_pie_chart(city_row):
     """Generiert ein Kreisdiagramm für eine bestimmte Stadt mit 'Unter 18 Jahre', 'Zielgruppe' und 'Sonstige'"""
-    fig, ax = plt.subplots(figsize=(4, 4))
+    fig = figure_pool.acquire('pie')
+    ax = fig.subplots()
     
     labels = ['Unter 18 Jahre', 'Zielgruppe', 'Sonstige']
     sizes = [
@@ -240,8 +133,9 @@ def generate_city_pie_chart(city_row):
 
 def generate_scatter_plot(df):
     """Erstellt einen Scatter-Plot für Einwohnerzahl vs. Einkommen mit Farbe für Zielgruppenanteil"""
-    plt.figure(figsize=(10, 6))
-    scatter = plt.scatter(
+    fig = figure_pool.acquire('scatter')
+    ax = fig.subplots()
+    scatter = ax.scatter(
         df['total'], 
         df['Einkommen_2022'], 
         c=df['target_group_percent'],
@@ -250,17 +144,17 @@ def generate_scatter_plot(df):
         s=100 * df['norm_target']
     )
     
-    plt.colorbar(scatter, label='Zielgruppenanteil')
-    plt.xlabel('Einwohnerzahl')
-    plt.ylabel('Einkommen')
-    plt.title('Einwohnerzahl vs. Einkommen (Farbe: Zielgruppenanteil)')
-    plt.grid(True, alpha=0.3)
-    plt.tight_layout()
+    fig.colorbar(scatter, ax=ax, label='Zielgruppenanteil')
+    ax.set_xlabel('Einwohnerzahl')
+    ax.set_ylabel('Einkommen')
+    ax.set_title('Einwohnerzahl vs. Einkommen (Farbe: Zielgruppenanteil)')
+    ax.grid(True, alpha=0.3)
+    fig.tight_layout()
     
     # Beschriftung für Top-Städte
     top_5 = df.sort_values('score', ascending=False).head(5)
     for idx, row in top_5.iterrows():
-        plt.annotate(
+        ax.annotate(
             row['location_name'], 
             (row['total'], row['Einkommen_2022']),
             xytext=(5, 5),
@@ -269,14 +163,13 @@ def generate_scatter_plot(df):
             fontweight='bold'
         )
     
-    fig = plt.gcf()
     return fig
 
 def generate_interactive_scatter_plot(df):
     """Erstellt einen interaktiven Scatter-Plot mit Plotly"""
     # Formatiere Einwohnerzahl und Einkommen für Hover-Text
-    df['formatted_total'] = df['total'].apply(lambda x: f"{int(x):,}".replace(",", "."))
-    df['formatted_income'] = df['Einkommen_2022'].apply(lambda x: f"{int(x):,}".replace(",", "."))
+    df['formatted_total'] = format_thousands(df['total'])
+    df['formatted_income'] = format_thousands(df['Einkommen_2022'])
     df['target_percent_display'] = (df['target_group_percent'] * 100).round(1).astype(str) + "%"
     
     # Erstelle einen Scatter Plot mit Plotly Express
@@ -336,54 +229,209 @@ def generate_interactive_scatter_plot(df):
     # Als JSON-String zurückgeben
     return fig.to_json()
 
-def perform_clustering(df, n_clusters=5):
-    """Führt eine Clustering-Analyse durch und erstellt ein Visualisierungsdiagramm"""
-    # Feature-Auswahl
-    features = df[['total', 'Einkommen_2022', 'target_group_percent']].copy()
-    
+class ClusteringResult:
+    """
+    Ergebnis eines K-Means-Laufs: Scaler, Zentren (in Originalskala), rohe Labels und
+    die semantische Zuordnung roher Cluster-IDs zu den Cluster-Interpretationen (0-4).
+
+    Wird pro Request und Feature-Set einmal berechnet und an alle Darstellungen
+    (Tabelle, statischer Plot, interaktiver Plot) weitergereicht.
+    """
+
+    def __init__(self, feature_columns, scaler, kmeans, raw_labels, centers, mapping):
+        self.feature_columns = feature_columns
+        self.scaler = scaler
+        self.kmeans = kmeans
+        self.raw_labels = raw_labels
+        self.centers = centers
+        self.mapping = mapping
+        self.n_clusters = len(centers)
+        # Gemappte Labels pro Zeile (gleiche Reihenfolge wie der DataFrame beim Fit)
+        self.labels = np.array([mapping.get(c, 0) for c in raw_labels])
+
+    def center_labels(self):
+        """Beschriftungen der Zentren in der Reihenfolge der rohen Cluster ('Zentrum C1' ... 'Zentrum C5')."""
+        return [f'Zentrum C{self.mapping.get(i, 0) + 1}' for i in range(self.n_clusters)]
+
+def _fit_kmeans(df, feature_columns, n_clusters):
+    """Skaliert die Features und führt K-Means aus. Gibt Scaler, Modell, rohe Labels und Zentren zurück."""
+    # Feature-Auswahl, NaN-Werte vor dem Skalieren behandeln
+    features = df[feature_columns].copy().fillna(0)
+
     # Skalierung der Daten
     scaler = StandardScaler()
-    # NaN-Werte vor dem Skalieren behandeln
-    features = features.fillna(0)
     scaled_features = scaler.fit_transform(features)
-    
+
     # K-Means Clustering
     kmeans = KMeans(n_clusters=n_clusters, random_state=42)
-    # Cluster-Zuweisungen basierend auf K-Means
     raw_clusters = kmeans.fit_predict(scaled_features)
-    
+
     # Zentren berechnen
     centers = scaler.inverse_transform(kmeans.cluster_centers_)
-    
+    return scaler, kmeans, raw_clusters, centers
+
+def fit_clustering(df, n_clusters=5):
+    """Clustering nach Einwohnerzahl, Einkommen und Zielgruppenanteil inkl. Zuordnung zu den Interpretationen"""
+    feature_columns = ['total', 'Einkommen_2022', 'target_group_percent']
+    scaler, kmeans, raw_clusters, centers = _fit_kmeans(df, feature_columns, n_clusters)
+
     # Zuordnung der Cluster zu den Interpretationen basierend auf ihren Charakteristika
     cluster_mapping = {}
-    
+
     # Finde den Cluster mit den höchsten Bevölkerungszahlen -> Großstädte (blau, Cluster 2)
     cluster_mapping[np.argmax([center[0] for center in centers])] = 1  # Blau
-    
+
     # Finde den Cluster mit dem höchsten Zielgruppenanteil -> Universitätsstädte (lila, Cluster 4)
     cluster_mapping[np.argmax([center[2] for center in centers])] = 3  # Lila
-    
+
     # Finde den Cluster mit dem höchsten Einkommen -> Wohlhabende Mittelstädte (orange, Cluster 5)
     cluster_mapping[np.argmax([center[1] for center in centers])] = 4  # Orange
-    
+
     # Finde den Cluster mit dem niedrigsten Einkommen -> Ländliche Regionen (grün, Cluster 3)
     cluster_mapping[np.argmin([center[1] for center in centers])] = 2  # Grün
-    
+
     # Der übrig gebliebene Cluster ist Mittelstädte (rot, Cluster 1)
     for i in range(n_clusters):
         if i not in cluster_mapping:
             cluster_mapping[i] = 0  # Rot
+
+    return ClusteringResult(feature_columns, scaler, kmeans, raw_clusters, centers, cluster_mapping)
+
+def fit_clustering_population_target(df, n_clusters=5):
+    """Clustering nach Einwohnerzahl und Zielgruppenanteil inkl. Zuordnung zu den Interpretationen"""
+    feature_columns = ['total', 'target_group_percent']
+    scaler, kmeans, raw_clusters, centers = _fit_kmeans(df, feature_columns, n_clusters)
+
+    # Zuordnung der Cluster zu den Interpretationen basierend auf ihren Charakteristika
+    cluster_mapping = {}
+
+    # Finde den Cluster mit den höchsten Bevölkerungszahlen -> Großstädte
+    cluster_mapping[np.argmax([center[0] for center in centers])] = 1  # Blau
+
+    # Finde den Cluster mit dem höchsten Zielgruppenanteil -> Universitätsstädte
+    cluster_mapping[np.argmax([center[1] for center in centers])] = 3  # Lila
+
+    # Finde den Cluster mit dem niedrigsten Zielgruppenanteil -> Wenig Zielgruppe
+    cluster_mapping[np.argmin([center[1] for center in centers])] = 2  # Grün
+
+    # Finde den Cluster mit den wenigsten Einwohnern und mittlerem/hohem Zielgruppenanteil -> Kleine Universitätsstädte
+    remaining = [i for i in range(n_clusters) if i not in cluster_mapping.keys()]
+    if len(remaining) >= 2:
+        # Sortiere nach Einwohnerzahl (aufsteigend)
+        pop_sorted = sorted(remaining, key=lambda i: centers[i][0])
+        # Sortiere die verbleibenden nach Zielgruppenanteil (absteigend)
+        target_sorted = sorted(pop_sorted, key=lambda i: centers[i][1], reverse=True)
+
+        # Der mit dem höchsten Zielgruppenanteil wird Cluster 4 (Kleine Universitätsstädte)
+        cluster_mapping[target_sorted[0]] = 4  # Orange
+
+        # Der andere ist Cluster 0 (Mittelstädte)
+        for i in target_sorted[1:]:
+            if i not in cluster_mapping:
+                cluster_mapping[i] = 0  # Rot
+    else:
+        # Falls nur ein Cluster übrig bleibt, ordne ihn als Mittelstädte ein
+        for i in remaining:
+            cluster_mapping[i] = 0  # Rot
+
+    return ClusteringResult(feature_columns, scaler, kmeans, raw_clusters, centers, cluster_mapping)
+
+def summarize_clustering(df, clustering):
+    """Cluster-Zusammenfassung (Einwohner/Einkommen/Zielgruppe) als DataFrame, ohne Diagramm"""
+    n_clusters = clustering.n_clusters
+    df_clustered = df.assign(cluster=clustering.labels)
+
+    # Cluster-Beschreibungen
+    cluster_descriptions = [
+        'Mittelstädte',
+        'Großstädte',
+        'Ländliche Regionen',
+        'Universitätsstädte',
+        'Wohlhabende Mittelstädte'
+    ]
+
+    cluster_summary = []
+    for i in range(n_clusters):
+        cluster_df = df_clustered[df_clustered['cluster'] == i]
+        if len(cluster_df) > 0:
+            summary = {
+                'Cluster': f'Cluster {i+1}',
+                'Beschreibung': cluster_descriptions[i],
+                'Anzahl Städte': len(cluster_df),
+                'Durchschn. Einwohner': f"{int(cluster_df['total'].mean()):,}".replace(",", "."),
+                'Durchschn. Einkommen': f"{int(cluster_df['Einkommen_2022'].mean()):,}".replace(",", "."),
+                'Durchschn. Zielgruppe': f"{(cluster_df['target_group_percent'].mean() * 100):.1f}%",
+                'Durchschn. Score': f"{(cluster_df['score'].mean() * 100):.2f}%",
+                'Top Stadt': cluster_df.sort_values('score', ascending=False).iloc[0]['location_name']
+            }
+        else:
+            summary = {
+                'Cluster': f'Cluster {i+1}',
+                'Beschreibung': cluster_descriptions[i],
+                'Anzahl Städte': 0,
+                'Durchschn. Einwohner': "0",
+                'Durchschn. Einkommen': "0",
+                'Durchschn. Zielgruppe': '0,0%',
+                'Durchschn. Score': '0,00%',
+                'Top Stadt': 'N/A'
+            }
+        cluster_summary.append(summary)
     
-    # Remapping der Cluster-Zuweisungen und dem Haupt-DataFrame hinzufügen
+    return pd.DataFrame(cluster_summary)
+
+def summarize_clustering_population_target(df, clustering):
+    """Cluster-Zusammenfassung (Einwohner vs. Zielgruppe) als DataFrame, ohne Diagramm"""
+    n_clusters = clustering.n_clusters
+    df_clustered = df.assign(cluster=clustering.labels)
+
+    # Cluster-Beschreibung für die Zusammenfassung
+    cluster_descriptions = [
+        'Mittelstädte',
+        'Großstädte',
+        'Städte mit geringem Zielgruppenanteil',
+        'Große Universitätsstädte',
+        'Kleinere Universitätsstädte'
+    ]
     
-    mapped_clusters = []
-    for c in raw_clusters:
-        mapped_value = cluster_mapping.get(c, 0)
-        mapped_clusters.append(mapped_value)
+    # Cluster-Zusammenfassung als DataFrame
+    cluster_summary = []
+    for i in range(n_clusters):
+        cluster_df = df_clustered[df_clustered['cluster'] == i]
+        if len(cluster_df) > 0:
+            summary = {
+                'cluster': f'Cluster {i+1}',
+                'description': cluster_descriptions[i],
+                'count': len(cluster_df),
+                'avg_population': f"{int(cluster_df['total'].mean()):,}".replace(",", "."),
+                'avg_income': f"{int(cluster_df['Einkommen_2022'].mean()):,}".replace(",", "."),
+                'avg_target': (cluster_df['target_group_percent'].mean() * 100).round(1),
+                'avg_score': f"{(cluster_df['score'].mean() * 100):.2f}%",
+                'top_city': cluster_df.sort_values('score', ascending=False).iloc[0]['location_name']
+            }
+        else:
+            summary = {
+                'cluster': f'Cluster {i+1}',
+                'description': cluster_descriptions[i],
+                'count': 0,
+                'avg_population': "0",
+                'avg_income': "0",
+                'avg_target': 0.0,
+                'avg_score': '0,00%',
+                'top_city': 'N/A'
+            }
+        cluster_summary.append(summary)
     
+    return pd.DataFrame(cluster_summary)
+
+def perform_clustering(df, n_clusters=5, clustering=None):
+    """Führt eine Clustering-Analyse durch und erstellt ein Visualisierungsdiagramm"""
+    # Clustering nur berechnen, wenn kein Ergebnis aus dem Request übergeben wurde
+    if clustering is None:
+        clustering = fit_clustering(df, n_clusters)
+    centers = clustering.centers
+
     # WICHTIG: Füge die gemappte Spalte zum originalen DataFrame hinzu, NICHT zu df_clustered
-    df['cluster'] = mapped_clusters 
+    df['cluster'] = clustering.labels
     
     # Debug-Ausgabe für Cluster-Verteilung im *originalen* df
     cluster_counts = df['cluster'].value_counts().to_dict()
@@ -402,11 +450,12 @@ def perform_clustering(df, n_clusters=5):
     cmap = matplotlib.colors.ListedColormap(cluster_colors)
     
     # Clustering-Ergebnisse visualisieren
-    plt.figure(figsize=(10, 6))
+    fig = figure_pool.acquire('clustering')
+    ax = fig.subplots()
     
     # Verwende die ersten beiden Features für die Visualisierung
     # BENUTZE df statt df_clustered!
-    scatter = plt.scatter(
+    scatter = ax.scatter(
         df['total'], 
         df['Einkommen_2022'], 
         c=df['cluster'], # <-- Verwende die gemappte Spalte aus df
@@ -418,7 +467,7 @@ def perform_clustering(df, n_clusters=5):
     )
     
     # Clusterzentren
-    plt.scatter(
+    ax.scatter(
         centers[:, 0], 
         centers[:, 1], 
         c='black', 
@@ -427,17 +476,17 @@ def perform_clustering(df, n_clusters=5):
         marker='X'
     )
     
-    plt.xlabel('Einwohnerzahl')
-    plt.ylabel('Einkommen')
-    plt.title(f'Clustering-Analyse (K={n_clusters})')
+    ax.set_xlabel('Einwohnerzahl')
+    ax.set_ylabel('Einkommen')
+    ax.set_title(f'Clustering-Analyse (K={n_clusters})')
     
     # Colorbar anpassen, um nur die 5 Cluster anzuzeigen
-    cbar = plt.colorbar(scatter, label='Cluster')
+    cbar = fig.colorbar(scatter, ax=ax, label='Cluster')
     cbar.set_ticks([0, 1, 2, 3, 4])
     # Verwende die Cluster-Beschreibungen für die Labels
     cbar.set_ticklabels([cluster_descriptions[i] for i in range(n_clusters)]) 
     
-    plt.grid(True, alpha=0.3)
+    ax.grid(True, alpha=0.3)
     
     # Beschriftung für einige Städte
     # BENUTZE df statt df_clustered!
@@ -447,7 +496,7 @@ def perform_clustering(df, n_clusters=5):
             # Annotiere die Top-Stadt nach Score im Cluster
             top_in_cluster = cluster_data.sort_values('score', ascending=False).head(1)
             for _, row in top_in_cluster.iterrows():
-                plt.annotate(
+                ax.annotate(
                     row['location_name'], 
                     (row['total'], row['Einkommen_2022']),
                     xytext=(5, 5),
@@ -456,75 +505,21 @@ def perform_clustering(df, n_clusters=5):
                     fontweight='bold'
                 )
     
-    plt.tight_layout()
+    fig.tight_layout()
     
     # Cluster-Zusammenfassung als DataFrame
-    cluster_summary = []
-    # BENUTZE df statt df_clustered!
-    for i in range(n_clusters):
-        cluster_df = df[df['cluster'] == i]
-        if len(cluster_df) > 0:
-            summary = {
-                'Cluster': f'Cluster {i+1}',
-                'Beschreibung': cluster_descriptions[i],
-                'Anzahl Städte': len(cluster_df),
-                'Durchschn. Einwohner': f"{int(cluster_df['total'].mean()):,}".replace(",", "."),
-                'Durchschn. Einkommen': f"{int(cluster_df['Einkommen_2022'].mean()):,}".replace(",", "."),
-                'Durchschn. Zielgruppe': f"{(cluster_df['target_group_percent'].mean() * 100):.1f}%",
-                'Durchschn. Score': f"{(cluster_df['score'].mean() * 100):.2f}%",
-                'Top Stadt': cluster_df.sort_values('score', ascending=False).iloc[0]['location_name']
-            }
-        else:
-            summary = {
-                'Cluster': f'Cluster {i+1}',
-                'Beschreibung': cluster_descriptions[i],
-                'Anzahl Städte': 0,
-                'Durchschn. Einwohner': "0",
-                'Durchschn. Einkommen': "0",
-                'Durchschn. Zielgruppe': '0,0%',
-                'Durchschn. Score': '0,00%',
-                'Top Stadt': 'N/A'
-            }
-        cluster_summary.append(summary)
-    
-    cluster_summary_df = pd.DataFrame(cluster_summary)
+    cluster_summary_df = summarize_clustering(df, clustering)
     
-    fig = plt.gcf()
     return fig, cluster_summary_df
 
-def generate_interactive_clustering(df, n_clusters=5):
+def generate_interactive_clustering(df, n_clusters=5, clustering=None):
     """Erstellt ein interaktives Clustering mit Plotly"""
-    # Feature-Auswahl
-    features = df[['total', 'Einkommen_2022', 'target_group_percent']].copy()
-    
-    # Skalierung der Daten
-    scaler = StandardScaler()
-    # NaN-Werte vor dem Skalieren behandeln
-    features = features.fillna(0)
-    scaled_features = scaler.fit_transform(features)
-    
-    # K-Means Clustering
-    kmeans = KMeans(n_clusters=n_clusters, random_state=42)
-    # df_clustered = df.copy() # Kopie nicht hier, da wir 'cluster' zu df hinzufügen
-    
-    # Cluster-Zuweisungen basierend auf K-Means
-    raw_clusters = kmeans.fit_predict(scaled_features)
-    
-    # Zentren berechnen
-    centers = scaler.inverse_transform(kmeans.cluster_centers_)
-    
-    # Zuordnung der Cluster zu den Interpretationen
-    cluster_mapping = {}
-    cluster_mapping[np.argmax([center[0] for center in centers])] = 1  # Großstädte (Blau)
-    cluster_mapping[np.argmax([center[2] for center in centers])] = 3  # Universitätsstädte (Lila)
-    cluster_mapping[np.argmax([center[1] for center in centers])] = 4  # Wohlhabende Mittelstädte (Orange)
-    cluster_mapping[np.argmin([center[1] for center in centers])] = 2  # Ländliche Regionen (Grün)
-    for i in range(n_clusters):
-        if i not in cluster_mapping:
-            cluster_mapping[i] = 0  # Mittelstädte (Rot)
+    if clustering is None:
+        clustering = fit_clustering(df, n_clusters)
+    centers = clustering.centers
     
     # Remapping der Cluster-Zuweisungen zum originalen DataFrame hinzufügen
-    df['cluster'] = [cluster_mapping[c] for c in raw_clusters]
+    df['cluster'] = clustering.labels
     
     # Datenbereinigung und Formatierung für Hover/Size (ähnlich wie bei anderer Plot-Funktion)
     df['total'] = pd.to_numeric(df['total'], errors='coerce').fillna(0)
@@ -534,8 +529,8 @@ def generate_interactive_clustering(df, n_clusters=5):
     if 'Land' not in df.columns:
         df['Land'] = 'N/A'
 
-    df['formatted_total'] = df['total'].apply(lambda x: f"{int(x):,}".replace(",", "."))
-    df['formatted_income'] = df['Einkommen_2022'].apply(lambda x: f"{int(x):,}".replace(",", "."))
+    df['formatted_total'] = format_thousands(df['total'])
+    df['formatted_income'] = format_thousands(df['Einkommen_2022'])
     df['target_percent_display'] = (df['target_group_percent'] * 100).round(1).astype(str) + "%"
     
     # Statistiken pro Cluster berechnen
@@ -654,7 +649,7 @@ def generate_interactive_clustering(df, n_clusters=5):
     centers_df = pd.DataFrame({
         'total': centers[:, 0],
         'Einkommen_2022': centers[:, 1],
-        'cluster_name': [f'Zentrum C{i+1}' for i in range(n_clusters)]
+        'cluster_name': clustering.center_labels()
     })
     
     # Zentren als Kreuze darstellen
@@ -690,7 +685,7 @@ def generate_interactive_clustering(df, n_clusters=5):
         )
     }
 
-def generate_filtered_clustering(df, n_clusters=5, selected_clusters=None):
+def generate_filtered_clustering(df, n_clusters=5, selected_clusters=None, clustering=None):
     """
     Erstellt ein interaktives Clustering mit Plotly, aber zeigt nur die ausgewählten Cluster an
     
@@ -698,6 +693,7 @@ def generate_filtered_clustering(df, n_clusters=5, selected_clusters=None):
         df: DataFrame mit den Daten
         n_clusters: Anzahl der Cluster (Standard: 5)
         selected_clusters: Liste der Cluster-Indizes, die angezeigt werden sollen (0-4)
+        clustering: Optional bereits berechnetes ClusteringResult (siehe fit_clustering)
     
     Returns:
         Dictionary mit Plotly-JSON und HTML-Tabelle für die Statistiken
@@ -705,49 +701,17 @@ def generate_filtered_clustering(df, n_clusters=5, selected_clusters=None):
     if selected_clusters is None:
         selected_clusters = list(range(n_clusters))  # Standardmäßig alle Cluster anzeigen
     
-    # Feature-Auswahl
-    features = df[['total', 'Einkommen_2022', 'target_group_percent']].copy()
-    
-    # Skalierung der Daten
-    scaler = StandardScaler()
-    scaled_features = scaler.fit_transform(features)
-    
-    # K-Means Clustering
-    kmeans = KMeans(n_clusters=n_clusters, random_state=42)
-    df_clustered = df.copy()
-    
-    # Cluster-Zuweisungen basierend auf K-Means
-    raw_clusters = kmeans.fit_predict(scaled_features)
-    
-    # Zentren berechnen
-    centers = scaler.inverse_transform(kmeans.cluster_centers_)
-    
-    # Zuordnung der Cluster zu den Interpretationen
-    cluster_mapping = {}
-    
-    # Finde den Cluster mit den höchsten Bevölkerungszahlen -> Großstädte (blau, Cluster 2)
-    cluster_mapping[np.argmax([center[0] for center in centers])] = 1  # Blau
-    
-    # Finde den Cluster mit dem höchsten Zielgruppenanteil -> Universitätsstädte (lila, Cluster 4)
-    cluster_mapping[np.argmax([center[2] for center in centers])] = 3  # Lila
-    
-    # Finde den Cluster mit dem höchsten Einkommen -> Wohlhabende Mittelstädte (orange, Cluster 5)
-    cluster_mapping[np.argmax([center[1] for center in centers])] = 4  # Orange
-    
-    # Finde den Cluster mit dem niedrigsten Einkommen -> Ländliche Regionen (grün, Cluster 3)
-    cluster_mapping[np.argmin([center[1] for center in centers])] = 2  # Grün
-    
-    # Der übrig gebliebene Cluster ist Mittelstädte (rot, Cluster 1)
-    for i in range(n_clusters):
-        if i not in cluster_mapping:
-            cluster_mapping[i] = 0  # Rot
+    if clustering is None:
+        clustering = fit_clustering(df, n_clusters)
+    centers = clustering.centers
     
     # Remapping der Cluster-Zuweisungen
-    df_clustered['cluster'] = [cluster_mapping[c] for c in raw_clusters]
+    df_clustered = df.copy()
+    df_clustered['cluster'] = clustering.labels
     
     # Formatierung für Hover-Text
-    df_clustered['formatted_total'] = df_clustered['total'].apply(lambda x: f"{int(x):,}".replace(",", "."))
-    df_clustered['formatted_income'] = df_clustered['Einkommen_2022'].apply(lambda x: f"{int(x):,}".replace(",", "."))
+    df_clustered['formatted_total'] = format_thousands(df_clustered['total'])
+    df_clustered['formatted_income'] = format_thousands(df_clustered['Einkommen_2022'])
     df_clustered['target_percent_display'] = (df_clustered['target_group_percent'] * 100).round(1).astype(str) + "%"
     
     # Statistiken pro Cluster berechnen (nur für ausgewählte Cluster)
@@ -866,10 +830,11 @@ def generate_filtered_clustering(df, n_clusters=5, selected_clusters=None):
     # Hier nur die Zentren der ausgewählten Cluster anzeigen
     filtered_centers = []
     filtered_labels = []
+    center_labels = clustering.center_labels()
     for i in range(n_clusters):
-        if i in selected_clusters:
+        if clustering.mapping.get(i, 0) in selected_clusters:
             filtered_centers.append(centers[i])
-            filtered_labels.append(f'Zentrum C{i+1}')
+            filtered_labels.append(center_labels[i])
     
     if filtered_centers:  # Nur wenn Zentren ausgewählt wurden
         centers_df = pd.DataFrame({
@@ -918,11 +883,8 @@ def generate_filtered_clustering(df, n_clusters=5, selected_clusters=None):
     }
 
 def encode_figure_to_base64(fig):
-    """Konvertiert eine Matplotlib-Figur zu einem Base64-kodierten String"""
-    img = io.BytesIO()
-    fig.savefig(img, format='png', bbox_inches='tight')
-    img.seek(0)
-    return base64.b64encode(img.getvalue()).decode('utf-8')
+    """Konvertiert eine Matplotlib-Figur zu einem Base64-kodierten String (die Figur geht zurück in den Pool)"""
+    return base64.b64encode(figure_pool.figure_to_png(fig)).decode('utf-8')
 
 def generate_interactive_map(df, kpi_column='score'):
     """
@@ -1061,70 +1023,27 @@ def create_plz_map(df):
     
     return geojson
 
-def perform_clustering_population_target(df, n_clusters=5):
+def perform_clustering_population_target(df, n_clusters=5, clustering=None):
     """Führt eine Clustering-Analyse durch mit Einwohnerzahl und Zielgruppenanteil und erstellt ein Visualisierungsdiagramm"""
-    # Feature-Auswahl - nur Einwohnerzahl und Zielgruppenanteil
-    features = df[['total', 'target_group_percent']].copy()
-    
-    # Skalierung der Daten
-    scaler = StandardScaler()
-    scaled_features = scaler.fit_transform(features)
-    
-    # K-Means Clustering
-    kmeans = KMeans(n_clusters=n_clusters, random_state=42)
-    df_clustered = df.copy()
-    
-    # Cluster-Zuweisungen basierend auf K-Means
-    raw_clusters = kmeans.fit_predict(scaled_features)
-    
-    # Zentren berechnen
-    centers = scaler.inverse_transform(kmeans.cluster_centers_)
-    
-    # Zuordnung der Cluster zu den Interpretationen basierend auf ihren Charakteristika
-    cluster_mapping = {}
-    
-    # Finde den Cluster mit den höchsten Bevölkerungszahlen -> Großstädte
-    cluster_mapping[np.argmax([center[0] for center in centers])] = 1  # Blau
-    
-    # Finde den Cluster mit dem höchsten Zielgruppenanteil -> Universitätsstädte
-    cluster_mapping[np.argmax([center[1] for center in centers])] = 3  # Lila
-    
-    # Finde den Cluster mit dem niedrigsten Zielgruppenanteil -> Wenig Zielgruppe
-    cluster_mapping[np.argmin([center[1] for center in centers])] = 2  # Grün
-    
-    # Finde den Cluster mit den wenigsten Einwohnern und mittlerem/hohem Zielgruppenanteil -> Kleine Universitätsstädte
-    remaining = [i for i in range(n_clusters) if i not in cluster_mapping.keys()]
-    if len(remaining) >= 2:
-        # Sortiere nach Einwohnerzahl (aufsteigend)
-        pop_sorted = sorted(remaining, key=lambda i: centers[i][0])
-        # Sortiere die verbleibenden nach Zielgruppenanteil (absteigend)
-        target_sorted = sorted(pop_sorted, key=lambda i: centers[i][1], reverse=True)
-        
-        # Der mit dem höchsten Zielgruppenanteil wird Cluster 4 (Kleine Universitätsstädte)
-        cluster_mapping[target_sorted[0]] = 4  # Orange
-        
-        # Der andere ist Cluster 0 (Mittelstädte)
-        for i in target_sorted[1:]:
-            if i not in cluster_mapping:
-                cluster_mapping[i] = 0  # Rot
-    else:
-        # Falls nur ein Cluster übrig bleibt, ordne ihn als Mittelstädte ein
-        for i in remaining:
-            cluster_mapping[i] = 0  # Rot
+    if clustering is None:
+        clustering = fit_clustering_population_target(df, n_clusters)
+    centers = clustering.centers
     
     # Remapping der Cluster-Zuweisungen
-    df_clustered['cluster'] = [cluster_mapping[c] for c in raw_clusters]
+    df_clustered = df.copy()
+    df_clustered['cluster'] = clustering.labels
     
     # Definiere die gleichen Farben wie im interaktiven Clustering
     cluster_colors = ['#e41a1c', '#377eb8', '#4daf4a', '#984ea3', '#ff7f00']
     
     # Konfiguriere den Plot
-    plt.figure(figsize=(10, 6))
+    fig = figure_pool.acquire('clustering2')
+    ax = fig.subplots()
     
     # Plotte jeden Cluster mit einer anderen Farbe
     for i in range(n_clusters):
         cluster_points = df_clustered[df_clustered['cluster'] == i]
-        plt.scatter(
+        ax.scatter(
             cluster_points['total'], 
             cluster_points['target_group_percent'],
             s=80,
@@ -1133,24 +1052,21 @@ def perform_clustering_population_target(df, n_clusters=5):
             label=f'Cluster {i+1}'
         )
     
-    # Clusterzentren plotten
-    for i, center in enumerate(centers):
-        cluster_num = [k for k, v in cluster_mapping.items() if v == i]
-        if cluster_num:
-            cluster_num = cluster_num[0]
-            plt.scatter(
-                center[0], 
-                center[1], 
-                s=200, 
-                c='black', 
-                marker='X', 
-                label=f'Zentrum C{cluster_num+1}'
-            )
+    # Clusterzentren plotten (beschriftet mit dem gemappten Cluster)
+    for center, center_label in zip(centers, clustering.center_labels()):
+        ax.scatter(
+            center[0], 
+            center[1], 
+            s=200, 
+            c='black', 
+            marker='X', 
+            label=center_label
+        )
     
     # Top-Städte markieren
     top_cities = df_clustered.sort_values('score', ascending=False).head(5)
     for _, city in top_cities.iterrows():
-        plt.annotate(
+        ax.annotate(
             city['location_name'],
             (city['total'], city['target_group_percent']),
             xytext=(5, 5),
@@ -1159,94 +1075,25 @@ def perform_clustering_population_target(df, n_clusters=5):
             fontweight='bold'
         )
     
-    plt.xlabel('Einwohnerzahl')
-    plt.ylabel('Zielgruppenanteil')
-    plt.title('Clustering-Analyse (Einwohnerzahl vs. Zielgruppe, K=5)')
-    plt.grid(True, alpha=0.3)
-    plt.legend()
-    
-    # Cluster-Beschreibung für die Zusammenfassung
-    cluster_descriptions = [
-        'Mittelstädte',
-        'Großstädte',
-        'Städte mit geringem Zielgruppenanteil',
-        'Große Universitätsstädte',
-        'Kleinere Universitätsstädte'
-    ]
+    ax.set_xlabel('Einwohnerzahl')
+    ax.set_ylabel('Zielgruppenanteil')
+    ax.set_title('Clustering-Analyse (Einwohnerzahl vs. Zielgruppe, K=5)')
+    ax.grid(True, alpha=0.3)
+    ax.legend()
     
     # Cluster-Zusammenfassung als DataFrame
-    cluster_summary = []
-    for i in range(n_clusters):
-        cluster_df = df_clustered[df_clustered['cluster'] == i]
-        if len(cluster_df) > 0:
-            summary = {
-                'cluster': f'Cluster {i+1}',
-                'description': cluster_descriptions[i],
-                'count': len(cluster_df),
-                'avg_population': f"{int(cluster_df['total'].mean()):,}".replace(",", "."),
-                'avg_income': f"{int(cluster_df['Einkommen_2022'].mean()):,}".replace(",", "."),
-                'avg_target': (cluster_df['target_group_percent'].mean() * 100).round(1),
-                'avg_score': f"{(cluster_df['score'].mean() * 100):.2f}%",
-                'top_city': cluster_df.sort_values('score', ascending=False).iloc[0]['location_name']
-            }
-        else:
-            summary = {
-                'cluster': f'Cluster {i+1}',
-                'description': cluster_descriptions[i],
-                'count': 0,
-                'avg_population': "0",
-                'avg_income': "0",
-                'avg_target': 0.0,
-                'avg_score': '0,00%',
-                'top_city': 'N/A'
-            }
-        cluster_summary.append(summary)
-    
-    cluster_summary_df = pd.DataFrame(cluster_summary)
+    cluster_summary_df = summarize_clustering_population_target(df, clustering)
     
-    fig = plt.gcf()
     return fig, cluster_summary_df
 
-def generate_interactive_clustering_population_target(df, n_clusters=5):
+def generate_interactive_clustering_population_target(df, n_clusters=5, clustering=None):
     """Erstellt ein interaktives Clustering mit Plotly für Einwohnerzahl und Zielgruppenanteil"""
-    # Feature-Auswahl - nur Einwohnerzahl und Zielgruppenanteil
-    features = df[['total', 'target_group_percent']].copy()
-    
-    # Skalierung der Daten
-    scaler = StandardScaler()
-    # Wichtig: NaN-Werte vor dem Skalieren behandeln
-    features = features.fillna(0)
-    scaled_features = scaler.fit_transform(features)
-    
-    # K-Means Clustering
-    kmeans = KMeans(n_clusters=n_clusters, random_state=42)
-    # df_clustered = df.copy() # Kopie nicht hier, da wir 'cluster' zu df hinzufügen
-    
-    # Cluster-Zuweisungen basierend auf K-Means
-    raw_clusters = kmeans.fit_predict(scaled_features)
-    
-    # Zentren berechnen
-    centers = scaler.inverse_transform(kmeans.cluster_centers_)
-    
-    # Zuordnung der Cluster zu den Interpretationen basierend auf ihren Charakteristika
-    cluster_mapping = {}
-    cluster_mapping[np.argmax([center[0] for center in centers])] = 1  # Großstädte (Blau)
-    cluster_mapping[np.argmax([center[1] for center in centers])] = 3  # Große Universitätsstädte (Lila)
-    cluster_mapping[np.argmin([center[1] for center in centers])] = 2  # Geringer Zielgruppenanteil (Grün)
-    remaining = [i for i in range(n_clusters) if i not in cluster_mapping.keys()]
-    if len(remaining) >= 2:
-        pop_sorted = sorted(remaining, key=lambda i: centers[i][0])
-        target_sorted = sorted(pop_sorted, key=lambda i: centers[i][1], reverse=True)
-        cluster_mapping[target_sorted[0]] = 4  # Kleinere Universitätsstädte (Orange)
-        for i in target_sorted[1:]:
-            if i not in cluster_mapping:
-                cluster_mapping[i] = 0  # Mittelstädte (Rot)
-    else:
-        for i in remaining:
-            cluster_mapping[i] = 0  # Mittelstädte (Rot)
+    if clustering is None:
+        clustering = fit_clustering_population_target(df, n_clusters)
+    centers = clustering.centers
     
     # Remapping der Cluster-Zuweisungen zum originalen DataFrame hinzufügen
-    df['cluster'] = [cluster_mapping[c] for c in raw_clusters]
+    df['cluster'] = clustering.labels
     
     # Wichtig: Sicherstellen, dass Spalten für Hover und Size numerisch sind
     df['total'] = pd.to_numeric(df['total'], errors='coerce').fillna(0)
@@ -1261,8 +1108,8 @@ def generate_interactive_clustering_population_target(df, n_clusters=5):
         df['Land'] = 'N/A'
         
     # Formatierung für Hover-Text (NACH der Konvertierung)
-    df['formatted_total'] = df['total'].apply(lambda x: f"{int(x):,}".replace(",", "."))
-    df['formatted_income'] = df['Einkommen_2022'].apply(lambda x: f"{int(x):,}".replace(",", "."))
+    df['formatted_total'] = format_thousands(df['total'])
+    df['formatted_income'] = format_thousands(df['Einkommen_2022'])
     df['target_percent_display'] = (df['target_group_percent'] * 100).round(1).astype(str) + "%"
     
     # Statistiken pro Cluster berechnen
@@ -1380,7 +1227,7 @@ def generate_interactive_clustering_population_target(df, n_clusters=5):
     centers_df = pd.DataFrame({
         'total': centers[:, 0],
         'target_group_percent': centers[:, 1],
-        'cluster_name': [f'Zentrum C{i+1}' for i in range(n_clusters)]
+        'cluster_name': clustering.center_labels()
     })
     
     # Zentren als Kreuze darstellen
@@ -1439,8 +1286,8 @@ def generate_cities_table_html(sorted_df):
         display_df['cluster'] = 0
     
     # Formatiere die Daten für die Anzeige
-    display_df['total'] = display_df['total'].apply(lambda x: f"{int(x):,}".replace(",", "."))
-    display_df['Einkommen_2022'] = display_df['Einkommen_2022'].apply(lambda x: f"{int(x):,}".replace(",", "."))
+    display_df['total'] = format_thousands(display_df['total'])
+    display_df['Einkommen_2022'] = format_thousands(display_df['Einkommen_2022'])
     display_df['target_group_percent'] = (display_df['target_group_percent'] * 100).round(1).astype(str) + "%"
     display_df['score'] = (display_df['score'] * 100).round(2).astype(str) + "%"
     